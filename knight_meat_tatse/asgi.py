@@ -13,4 +13,14 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'knight_meat_tatse.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# imported once django is set up
+from rest_api.feed import websocket_feed  # noqa: E402
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "websocket" and scope["path"] == "/ws/orders/":
+        await websocket_feed(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
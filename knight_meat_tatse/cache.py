@@ -0,0 +1,254 @@
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+MISSING = object()
+
+
+def get_config(key, default):
+    return getattr(settings, "TIERED_CACHE", {}).get(key, default)
+
+
+class LocalCache:
+    """
+    The per-process tier: a bounded LRU whose entries expire after their
+    own timeout. Values are shared with the callers, not copied.
+    """
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return MISSING
+            if entry[1] <= time.monotonic():
+                del self.entries[key]
+                return MISSING
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value, timeout):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + timeout)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+_local = None
+_local_lock = threading.Lock()
+
+
+def get_local_cache():
+    global _local
+    if _local is None:
+        with _local_lock:
+            if _local is None:
+                _local = LocalCache(get_config("LOCAL_MAX_ENTRIES", 10000))
+    return _local
+
+
+class CacheNamespace:
+    """
+    Values of one kind, cached in the shared django cache (`cache`) and for
+    `local_timeout` seconds in the process too, so hot keys skip the network
+    and the unpickling. Another worker's change shows up here after at most
+    `local_timeout` seconds, keys that must be fresh include a version.
+
+    Every key carries the namespace version, invalidate() bumps it and so
+    drops every key at once. get_or_set() builds a missing value once: one
+    thread per process and one process at a time, the others wait for it.
+    """
+
+    STATS = ("local_hits", "hits", "misses", "waits")
+
+    def __init__(
+        self,
+        name,
+        timeout=300,
+        local_timeout=0,
+        lock_timeout=10,
+        wait=5,
+        cache="default",
+    ):
+        self.name = name
+        self.timeout = timeout
+        self.local_timeout = local_timeout
+        self.lock_timeout = lock_timeout
+        self.wait = wait
+        self.cache_alias = cache
+        self.version_key = f"{name}:version"
+        self.counts = dict.fromkeys(self.STATS, 0)
+        self.counts_lock = threading.Lock()
+        # builds of one key in this process queue up, striped to bound memory
+        self.build_locks = [threading.Lock() for _ in range(32)]
+
+    @property
+    def shared(self):
+        return caches[self.cache_alias]
+
+    def count(self, stat):
+        with self.counts_lock:
+            self.counts[stat] += 1
+
+    def get_version(self):
+        local = get_local_cache()
+        version = local.get(self.version_key) if self.local_timeout else MISSING
+        if version is MISSING:
+            version = self.shared.get(self.version_key)
+            if version is None:
+                self.shared.add(self.version_key, 1, None)
+                version = self.shared.get(self.version_key, 1)
+            if self.local_timeout:
+                local.set(self.version_key, version, self.local_timeout)
+        return version
+
+    def make_key(self, key):
+        key = str(key)
+        # user input can't break memcached's key rules or its length limit
+        if len(key) > 200 or not key.isprintable() or " " in key:
+            key = hashlib.sha256(key.encode()).hexdigest()
+        return f"{self.name}:{self.get_version()}:{key}"
+
+    def lookup(self, full_key):
+        if self.local_timeout:
+            value = get_local_cache().get(full_key)
+            if value is not MISSING:
+                self.count("local_hits")
+                return value
+        value = self.shared.get(full_key, MISSING)
+        if value is MISSING:
+            return MISSING
+        self.count("hits")
+        if self.local_timeout:
+            get_local_cache().set(full_key, value, self.local_timeout)
+        return value
+
+    def store(self, full_key, value, timeout):
+        self.shared.set(full_key, value, self.timeout if timeout is None else timeout)
+        if self.local_timeout:
+            get_local_cache().set(full_key, value, self.local_timeout)
+
+    def get(self, key, default=None):
+        value = self.lookup(self.make_key(key))
+        if value is MISSING:
+            self.count("misses")
+            return default
+        return value
+
+    def set(self, key, value, timeout=None):
+        self.store(self.make_key(key), value, timeout)
+
+    def delete(self, key):
+        full_key = self.make_key(key)
+        self.shared.delete(full_key)
+        get_local_cache().delete(full_key)
+
+    def invalidate(self):
+        try:
+            self.shared.incr(self.version_key)
+        except ValueError:
+            # expired or never used, any other value than the old one will do
+            self.shared.set(self.version_key, time.time_ns(), None)
+        get_local_cache().delete(self.version_key)
+
+    def get_or_set(self, key, build, timeout=None):
+        full_key = self.make_key(key)
+        value = self.lookup(full_key)
+        if value is not MISSING:
+            return value
+
+        # a miss is counted once per build, whoever waited for it got a hit
+        with self.build_locks[hash(full_key) % len(self.build_locks)]:
+            value = self.lookup(full_key)
+            if value is not MISSING:
+                return value
+
+            lock_key = f"{full_key}:lock"
+            token = uuid.uuid4().hex
+            if self.shared.add(lock_key, token, self.lock_timeout):
+                try:
+                    self.count("misses")
+                    value = build()
+                    self.store(full_key, value, timeout)
+                    return value
+                finally:
+                    if self.shared.get(lock_key) == token:
+                        self.shared.delete(lock_key)
+
+        # another process is building it, waited for without the stripe lock
+        # so the keys sharing it can still be built here meanwhile
+        self.count("waits")
+        deadline = time.monotonic() + self.wait
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            value = self.lookup(full_key)
+            if value is not MISSING:
+                return value
+
+        # the builder died or is too slow
+        self.count("misses")
+        value = build()
+        self.store(full_key, value, timeout)
+        return value
+
+    def stats(self):
+        with self.counts_lock:
+            stats = dict(self.counts)
+        lookups = stats["local_hits"] + stats["hits"] + stats["misses"]
+        stats["hit_rate"] = (
+            (stats["local_hits"] + stats["hits"]) / lookups if lookups else 0.0
+        )
+        stats["local_hit_rate"] = stats["local_hits"] / lookups if lookups else 0.0
+        return stats
+
+
+_namespaces = {}
+_namespaces_lock = threading.Lock()
+
+
+def get_namespace(name):
+    """
+    The namespace configured in TIERED_CACHE['NAMESPACES'][name].
+    """
+    if name not in _namespaces:
+        with _namespaces_lock:
+            if name not in _namespaces:
+                config = get_config("NAMESPACES", {}).get(name, {})
+                _namespaces[name] = CacheNamespace(
+                    name,
+                    timeout=config.get("TIMEOUT", 300),
+                    local_timeout=config.get("LOCAL_TIMEOUT", 0),
+                    lock_timeout=config.get("LOCK_TIMEOUT", 10),
+                    wait=config.get("WAIT", 5),
+                    cache=config.get("CACHE", "default"),
+                )
+    return _namespaces[name]
+
+
+def get_stats():
+    return {
+        "local_entries": len(get_local_cache()),
+        "namespaces": {name: namespace.stats() for name, namespace in _namespaces.items()},
+    }
@@ -0,0 +1,135 @@
+import os
+import threading
+import time
+from collections import deque
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import OperationalError
+from django.db.backends.postgresql import base
+from django.db.backends.postgresql.psycopg_any import IsolationLevel
+
+
+class ConnectionPool:
+    """
+    At most `max_size` connections per process, handed out most recently
+    used first. Idle ones that sat longer than `check_after` seconds are
+    pinged before being handed out again, like CONN_HEALTH_CHECKS.
+    """
+
+    def __init__(self, max_size=10, timeout=10, check_after=30):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.check_after = check_after
+        self.slots = threading.BoundedSemaphore(max_size)
+        self.idle = deque()
+        self.lock = threading.Lock()
+
+    def acquire(self, connect):
+        if not self.slots.acquire(timeout=self.timeout):
+            raise OperationalError(
+                f"No database connection was free within {self.timeout}s, "
+                f"all {self.max_size} are in use."
+            )
+        try:
+            while True:
+                with self.lock:
+                    if not self.idle:
+                        break
+                    connection, returned_at = self.idle.pop()
+                if self.is_usable(connection, returned_at):
+                    return connection
+                connection.close()
+            return connect()
+        except BaseException:
+            self.slots.release()
+            raise
+
+    def is_usable(self, connection, returned_at):
+        if connection.closed:
+            return False
+        if time.monotonic() - returned_at < self.check_after:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            return True
+        except base.Database.Error:
+            return False
+
+    def release(self, connection, discard=False):
+        try:
+            if discard or connection.closed:
+                connection.close()
+            else:
+                with self.lock:
+                    self.idle.append((connection, time.monotonic()))
+        finally:
+            self.slots.release()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, name, options):
+    # keyed by pid too, a forked worker must not reuse its parent's sockets
+    key = (alias, name, os.getpid())
+    if key not in _pools:
+        with _pools_lock:
+            if key not in _pools:
+                _pools[key] = ConnectionPool(**options)
+    return _pools[key]
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    The postgresql backend with an in-process pool when OPTIONS['pool'] is
+    set, True or ConnectionPool arguments, the shape Django 5.1's native pool
+    uses. Closing a connection at the end of a request returns it to the
+    pool, so CONN_MAX_AGE has to be 0.
+    """
+
+    @property
+    def pool(self):
+        options = self.settings_dict["OPTIONS"].get("pool")
+        if not options:
+            return None
+        if self.settings_dict["CONN_MAX_AGE"] != 0:
+            raise ImproperlyConfigured("Pooled connections require CONN_MAX_AGE = 0.")
+        return get_pool(
+            self.alias, self.settings_dict["NAME"], {} if options is True else options
+        )
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop("pool", None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        pool = self.pool
+        if pool is None:
+            return super().get_new_connection(conn_params)
+        connection = pool.acquire(
+            lambda: super(DatabaseWrapper, self).get_new_connection(conn_params)
+        )
+        # set by get_new_connection() for fresh connections only
+        self.isolation_level = IsolationLevel(
+            self.settings_dict["OPTIONS"].get(
+                "isolation_level", IsolationLevel.READ_COMMITTED
+            )
+        )
+        return connection
+
+    def _close(self):
+        pool = self.pool
+        if pool is None or self.connection is None:
+            return super()._close()
+        connection = self.connection
+        discard = False
+        try:
+            # the next borrower must not inherit an open transaction
+            if not connection.closed and connection.get_transaction_status():
+                connection.rollback()
+        except base.Database.Error:
+            discard = True
+        pool.release(connection, discard)
@@ -0,0 +1,144 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+def get_config(key, default):
+    return getattr(settings, "DB_REPLICA_ROUTING", {}).get(key, default)
+
+
+def get_replicas():
+    return [alias for alias in settings.DATABASES if alias != DEFAULT_DB_ALIAS]
+
+
+class RoutingState:
+    """
+    Where the reads of one request go. Shared by reference, so writes made
+    in a sync_to_async thread pin the rest of the request too.
+    """
+
+    __slots__ = ("replica", "pinned", "wrote")
+
+    def __init__(self, replica, pinned=False):
+        self.replica = replica
+        self.pinned = pinned
+        self.wrote = False
+
+
+# only set while a request is handled, reads anywhere else (background
+# threads picking up what was just committed, commands) go to the primary
+_state = ContextVar("db_routing_state", default=None)
+
+
+@contextmanager
+def use_primary():
+    """
+    Read from the primary inside the block, for builds whose result is
+    cached and must not lag behind the write that triggered them.
+    """
+    token = _state.set(None)
+    try:
+        yield
+    finally:
+        _state.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Writes go to the primary, request reads to one replica picked per
+    request. After a write the request reads from the primary, as do
+    reads inside transactions.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if (
+            state is None
+            or state.pinned
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return DEFAULT_DB_ALIAS
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.pinned = state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same rows
+        return True
+
+
+def pin_key(user_id):
+    return f"db:pinned:{user_id}"
+
+
+class ReplicaPinningMiddleware:
+    """
+    Sets up routing for each request. A user who wrote anything, like a
+    profile update, reads from the primary for the next PIN_SECONDS, so
+    they see their own writes despite replication lag. The window lives in
+    the default cache, shared workers need a shared cache.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        # here rather than at import, routers are loaded before the apps
+        from django.core.cache import cache
+        from users.authentication import get_token_user_id
+
+        self.get_response = get_response
+        self.cache = cache
+        self.get_token_user_id = get_token_user_id
+        self.replicas = get_replicas()
+        self.pin_seconds = get_config("PIN_SECONDS", 5)
+        self.primary_paths = tuple(get_config("PRIMARY_PATHS", ()))
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not self.replicas:
+            return self.get_response(request)
+
+        user_id, state = self.start(request)
+        token = _state.set(state)
+        try:
+            return self.get_response(request)
+        finally:
+            _state.reset(token)
+            self.finish(user_id, state)
+
+    async def __acall__(self, request):
+        if not self.replicas:
+            return await self.get_response(request)
+
+        # the pin lives in django's cache, which may be Redis
+        user_id, state = await sync_to_async(self.start)(request)
+        token = _state.set(state)
+        try:
+            return await self.get_response(request)
+        finally:
+            _state.reset(token)
+            await sync_to_async(self.finish)(user_id, state)
+
+    def start(self, request):
+        user_id = self.get_token_user_id(request)
+        pinned = request.path.startswith(self.primary_paths) or bool(
+            user_id and self.cache.get(pin_key(user_id))
+        )
+        return user_id, RoutingState(random.choice(self.replicas), pinned)
+
+    def finish(self, user_id, state):
+        if state.wrote and user_id:
+            self.cache.set(pin_key(user_id), True, self.pin_seconds)
@@ -0,0 +1,30 @@
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    The sqlite3 backend plus the two OPTIONS Django 5.1 adds to it:
+    `init_command`, statements run on every new connection (the PRAGMAs),
+    and `transaction_mode`, so atomic blocks can BEGIN IMMEDIATE and take the
+    write lock up front instead of failing with "database is locked" when a
+    read transaction has to upgrade. Drop this ENGINE once on 5.1.
+    """
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        self.init_command = params.pop("init_command", "")
+        self.transaction_mode = params.pop("transaction_mode", None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for statement in self.init_command.split(";"):
+            if statement.strip():
+                conn.execute(statement)
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        if self.transaction_mode is None:
+            super()._start_transaction_under_autocommit()
+        else:
+            self.cursor().execute(f"BEGIN {self.transaction_mode}")
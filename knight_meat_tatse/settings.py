@@ -32,6 +32,11 @@ DEBUG = os.getenv("DEBUG")
 
 ALLOWED_HOSTS = ["*"]
 
+# drf_yasg, the views' schema decorators and the swagger and redoc pages.
+# Workers boot faster without them (API_DOCS=False), /api/swagger.json is
+# served from the prebuilt file either way, see OPENAPI_SCHEMA
+API_DOCS = os.environ.get("API_DOCS", "True") == "True"
+
 
 # Application definition
 
@@ -47,7 +52,7 @@ INSTALLED_APPS = [
     # restframework
     "rest_framework",
     # drf_yasg
-    "drf_yasg",
+    *(["drf_yasg"] if API_DOCS else []),
     # third-party
     "rest_framework_simplejwt",
     "rest_framework_simplejwt.token_blacklist",
@@ -59,6 +64,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "knight_meat_tatse.db.router.ReplicaPinningMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     # "corsheaders.middleware.CorsMiddleware",
@@ -67,6 +73,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "rest_api.idempotency.IdempotencyMiddleware",
     # "whitenoise.middleware.WhiteNoiseMiddleware",
 ]
 
@@ -94,11 +101,90 @@ WSGI_APPLICATION = "knight_meat_tatse.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+# DB_ENGINE=postgresql for anything with more than one worker writing,
+# sqlite (the default) serializes every write across processes
+DB_ENGINE = os.environ.get("DB_ENGINE", "sqlite")
+
+if DB_ENGINE == "postgresql":
+    # DB_POOL_SIZE > 0 keeps an in-process pool of that many connections per
+    # worker, otherwise each thread keeps its own for DB_CONN_MAX_AGE seconds
+    DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 0))
+    DATABASES = {
+        "default": {
+            "ENGINE": (
+                "knight_meat_tatse.db.postgresql"
+                if DB_POOL_SIZE
+                else "django.db.backends.postgresql"
+            ),
+            "NAME": os.environ.get("DB_NAME", "knight_meat_tatse"),
+            "USER": os.environ.get("DB_USER", ""),
+            "PASSWORD": os.environ.get("DB_PASSWORD", ""),
+            "HOST": os.environ.get("DB_HOST", ""),
+            "PORT": os.environ.get("DB_PORT", ""),
+            "CONN_MAX_AGE": (
+                0 if DB_POOL_SIZE else int(os.environ.get("DB_CONN_MAX_AGE", 60))
+            ),
+            # a persistent connection is pinged before a request reuses it
+            "CONN_HEALTH_CHECKS": True,
+            "OPTIONS": (
+                {
+                    "pool": {
+                        "max_size": DB_POOL_SIZE,
+                        "timeout": int(os.environ.get("DB_POOL_TIMEOUT", 10)),
+                    }
+                }
+                if DB_POOL_SIZE
+                else {}
+            ),
+        }
+    }
+else:
+    # WAL lets readers run alongside the writer, synchronous=NORMAL only
+    # fsyncs at checkpoints, and IMMEDIATE transactions queue on the busy
+    # timeout instead of failing. SQLITE_TUNED=False for Django's defaults
+    SQLITE_TUNED = os.environ.get("SQLITE_TUNED", "True") == "True"
+    DATABASES = {
+        "default": {
+            "ENGINE": "knight_meat_tatse.db.sqlite3",
+            "NAME": os.environ.get("DB_NAME", BASE_DIR / "db.sqlite3"),
+            "OPTIONS": (
+                {
+                    "timeout": 20,
+                    "transaction_mode": "IMMEDIATE",
+                    "init_command": (
+                        "PRAGMA journal_mode=WAL;"
+                        "PRAGMA synchronous=NORMAL;"
+                        "PRAGMA mmap_size=134217728;"
+                        "PRAGMA cache_size=-20000;"
+                        "PRAGMA temp_store=MEMORY"
+                    ),
+                }
+                if SQLITE_TUNED
+                else {}
+            ),
+        }
     }
+
+# read replicas, comma separated hosts for postgresql or files for sqlite
+# (kept in step locally with `manage.py sync_replicas`). Requests read from
+# one of them until they write, see knight_meat_tatse/db/router.py
+for number, replica in enumerate(
+    filter(None, os.environ.get("DB_REPLICAS", "").split(",")), 1
+):
+    DATABASES[f"replica{number}"] = {
+        **DATABASES["default"],
+        "HOST" if DB_ENGINE == "postgresql" else "NAME": replica,
+        "OPTIONS": dict(DATABASES["default"]["OPTIONS"]),
+        "TEST": {"MIRROR": "default"},
+    }
+
+DATABASE_ROUTERS = ["knight_meat_tatse.db.router.ReplicaRouter"]
+
+# PIN_SECONDS: how long a user reads from the primary after writing,
+# it should cover the replication lag. PRIMARY_PATHS always do
+DB_REPLICA_ROUTING = {
+    "PIN_SECONDS": int(os.environ.get("DB_REPLICA_PIN_SECONDS", 5)),
+    "PRIMARY_PATHS": ("/admin/",),
 }
 
 
@@ -120,6 +206,18 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# signed links from register and forgot_password, see users.tokens
+EMAIL_VERIFICATION_TIMEOUT = 60 * 60 * 24 * 3
+PASSWORD_RESET_TIMEOUT = 60 * 60
+
+# password hashing runs in a bounded pool, requests get a 429 once
+# WORKERS + MAX_QUEUE hashes are in flight ("thread" or "process")
+PASSWORD_HASHING = {
+    "EXECUTOR": os.environ.get("PASSWORD_HASHING_EXECUTOR", "thread"),
+    "WORKERS": int(os.environ.get("PASSWORD_HASHING_WORKERS", os.cpu_count() or 1)),
+    "MAX_QUEUE": int(os.environ.get("PASSWORD_HASHING_MAX_QUEUE", 32)),
+}
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.0/topics/i18n/
@@ -146,6 +244,15 @@ MEDIA_URL = "/media/"
 # DEFAULT_FILE_STORAGE = "cloudinary_storage.storage.MediaCloudinaryStorage"
 
 
+# uploaded profile pictures are resized off the request path,
+# EXECUTOR is "thread" or "process"
+AVATAR_PROCESSING = {
+    "EXECUTOR": os.environ.get("AVATAR_PROCESSING_EXECUTOR", "thread"),
+    "WORKERS": int(os.environ.get("AVATAR_PROCESSING_WORKERS", 2)),
+    "SIZES": (64, 128, 256),
+}
+
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
@@ -155,24 +262,71 @@ AUTH_USER_MODEL = "users.User"
 
 
 EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
-EMAIL_HOST = "smtp.gmail.com"
-EMAIL_PORT = 587
-EMAIL_USE_TLS = True
+EMAIL_HOST = os.environ.get("EMAIL_HOST", "smtp.gmail.com")
+EMAIL_PORT = int(os.environ.get("EMAIL_PORT", 587))
+EMAIL_USE_TLS = os.environ.get("EMAIL_USE_TLS", "True") == "True"
 EMAIL_USE_SSL = False
 EMAIL_HOST_USER = os.environ.get("DONOT_REPLY_EMAIL")
 DISPLAY_NAME = "Knight Meat Taste"
 EMAIL_HOST_PASSWORD = os.environ.get("DONOT_REPLY_EMAIL_PASSWORD")
 
+# outbox worker (python manage.py send_outbox_emails)
+EMAIL_OUTBOX_BATCH_SIZE = 50
+EMAIL_OUTBOX_MAX_ATTEMPTS = 5
+EMAIL_OUTBOX_RETRY_BACKOFF = 60
+EMAIL_OUTBOX_MAX_BACKOFF = 3600
+
 
 REST_FRAMEWORK = {
     # YOUR SETTINGS
     "DEFAULT_SCHEMA_CLASS": "rest_framework.schemas.coreapi.AutoSchema",
     # auth with token
     "DEFAULT_AUTHENTICATION_CLASSES": [
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "users.authentication.CachedJWTAuthentication",
     ],
 }
 
+# the shared cache every worker sees: redis with REDIS_URL (needs the redis
+# package), otherwise a per-process stand-in for development and tests.
+# Profile versions (users.profiles) live here, with more than one worker
+# it has to be shared or workers keep serving profiles saved elsewhere
+CACHES = {
+    "default": (
+        {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ["REDIS_URL"],
+            "KEY_PREFIX": "knight_meat_tatse",
+        }
+        if os.environ.get("REDIS_URL")
+        else {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "shared",
+            "OPTIONS": {"MAX_ENTRIES": 10000},
+        }
+    ),
+}
+
+# knight_meat_tatse.cache namespaces, in the shared cache for TIMEOUT seconds
+# and in every worker's memory for LOCAL_TIMEOUT more (0 to skip that tier),
+# bounded to LOCAL_MAX_ENTRIES per worker. Hit rates at /api/auth/cache-metrics/
+TIERED_CACHE = {
+    "LOCAL_MAX_ENTRIES": 10000,
+    "NAMESPACES": {
+        # keyed by the user's profile version, never stale
+        "profiles": {"TIMEOUT": 60 * 60 * 24, "LOCAL_TIMEOUT": 60},
+        # invalidated whenever a dish changes
+        "dish-search": {"TIMEOUT": 300, "LOCAL_TIMEOUT": 5},
+    },
+}
+
+# per-process cache of authenticated users, SHARED_INVALIDATION also
+# publishes invalidations through django's cache so every worker sees them
+USER_CACHE = {
+    "MAX_SIZE": 1024,
+    "TTL": 60,
+    "SHARED_INVALIDATION": os.environ.get("USER_CACHE_SHARED_INVALIDATION") == "True",
+}
+
 
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=300),
@@ -180,6 +334,20 @@ SIMPLE_JWT = {
     "ROTATE_REFRESH_TOKENS": True,
     "BLACKLIST_AFTER_ROTATION": True,
     "UPDATE_LAST_LOGIN": False,
+    "TOKEN_OBTAIN_SERIALIZER": "users.serializers.IndexedTokenObtainPairSerializer",
+    "TOKEN_REFRESH_SERIALIZER": "users.serializers.IndexedTokenRefreshSerializer",
+}
+
+# per-worker bloom filter in front of the refresh token blacklist,
+# expired rows are removed with python manage.py prune_expired_tokens
+TOKEN_REVOCATION = {
+    "CAPACITY": 1000000,
+    "ERROR_RATE": 0.01,
+    "SYNC_INTERVAL": 1,
+    "REBUILD_INTERVAL": 3600,
+    # ids skipped by a newer row are looked up again for this many seconds,
+    # longer than any transaction that blacklists a token
+    "GAP_TIMEOUT": 60,
 }
 
 # CORS_ALLOWED_ORIGINS = [
@@ -202,6 +370,79 @@ SIMPLE_JWT = {
 
 CLIENT_URL = "http://localhost:3000"
 
+# cleanup jobs, run with python manage.py run_maintenance [--loop]
+MAINTENANCE = {
+    "BATCH_SIZE": 500,
+    "PAUSE": 0.1,
+    "UNVERIFIED_ACCOUNT_DAYS": 7,
+    "SENT_EMAIL_DAYS": 30,
+    "AVATAR_GRACE_SECONDS": 3600,
+    "RENDITION_GRACE_SECONDS": 3600,
+}
+
+# GET /api/menu/ snapshot, rebuilt whenever a dish changes. With a
+# per-process cache (locmem) other workers only pick up a rebuild once
+# their copy times out, a shared cache sees it immediately
+MENU_SNAPSHOT = {
+    "CACHE": "default",
+    "TIMEOUT": 300,
+    "REBUILD_WAIT": 5,
+}
+
+# dish search, the autocomplete trie is per worker and reloads at most every
+# REFRESH_INTERVAL seconds after a dish changed
+DISH_SEARCH = {
+    "AUTOCOMPLETE_LIMIT": 10,
+    "MAX_PREFIX_LENGTH": 12,
+    "REFRESH_INTERVAL": 1,
+}
+
+# API schema written by python manage.py build_openapi_schema at deploy time
+# (with API_DOCS) and served from memory, browsers and proxies keep it MAX_AGE
+# seconds. Only DEBUG with API_DOCS generates it on each request
+OPENAPI_SCHEMA = {
+    "DIRECTORY": os.path.join(BASE_DIR, "build", "openapi"),
+    "MAX_AGE": 60 * 60 * 24,
+}
+
+# the docs pages load the prebuilt schema rather than generating their own
+SWAGGER_SETTINGS = {"SPEC_URL": ("schema-json", {"format": ".json"})}
+REDOC_SETTINGS = {"SPEC_URL": ("schema-json", {"format": ".json"})}
+
+# POSTs to these paths sent with an Idempotency-Key header run once, retries
+# within TTL seconds get the stored response. Duplicates of a request still
+# running wait up to WAIT seconds for it
+IDEMPOTENCY = {
+    "PATHS": ("/api/auth/register/", "/api/orders/"),
+    "TTL": 60 * 60 * 24,
+    "WAIT": 10,
+    "LOCK_TIMEOUT": 60,
+}
+
+# cashier order feed, served by asgi.py as server-sent events on
+# /api/orders/feed/ and a WebSocket on /ws/orders/. LocalBackend only reaches
+# clients of the same process, DatabaseBackend fans out across nodes through
+# the OrderEvent table. Clients more than QUEUE_SIZE events behind are cut
+# off and resume with Last-Event-ID from the last BUFFER_SIZE events
+ORDER_FEED = {
+    "BACKEND": os.environ.get("ORDER_FEED_BACKEND", "rest_api.feed.LocalBackend"),
+    "QUEUE_SIZE": 100,
+    "BUFFER_SIZE": 1000,
+    "HEARTBEAT": 15,
+    "POLL_INTERVAL": 0.5,
+    # ids DatabaseBackend reads again on every poll for events committed out
+    # of order, more than the events placed during the longest transaction
+    "OVERLAP": 100,
+    "RETENTION_HOURS": 24,
+}
+
+# route the auth and profile endpoints to users.async_views, for deployments
+# served through asgi.py (uvicorn knight_meat_tatse.asgi:application) next
+# to the order feed. They keep the event loop free while requests wait on
+# hashing, the database or the cache; they're not faster, a sync WSGI
+# worker pool serves more requests per second (see bench_async_views)
+ASYNC_VIEWS = os.environ.get("ASYNC_VIEWS") == "True"
+
 # CLIENT_URL = "https://main--merry-beignet-218b04.netlify.app"
 # SECURE_SCHEMES = ["https", "http"]
 # SECURE_SSL_REDIRECT = True
@@ -1,6 +1,24 @@
 from django.contrib import admin
-from rest_api.models import Dish
+from rest_api.models import Dish, Order, OrderLine
 
 admin.site.site_header = "Knight meat eats Administration"
 
 admin.site.register(Dish)
+
+
+class OrderLineInline(admin.TabularInline):
+    model = OrderLine
+    extra = 0
+    readonly_fields = ("dish", "name", "unit_price", "quantity")
+
+
+class OrderAdmin(admin.ModelAdmin):
+    list_display = ("id", "user", "status", "total", "created_at")
+    list_filter = ("status",)
+    list_select_related = ("user",)
+    readonly_fields = ("total", "created_at")
+    inlines = (OrderLineInline,)
+
+
+admin.site.register(Order, OrderAdmin)
+
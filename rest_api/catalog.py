@@ -0,0 +1,60 @@
+from rest_framework.exceptions import ValidationError
+
+from rest_api.renditions import get_media_url_builder, get_rendition_urls
+from rest_api.serializers import DishSerializer
+
+
+# DishSerializer field: the columns it is built from
+DISH_COLUMNS = {
+    "id": ("id",),
+    "name": ("name",),
+    "image": ("image",),
+    "price": ("price",),
+    "renditions": ("renditions",),
+    "srcset": ("renditions",),
+}
+
+
+def get_dish_fields(fields=None):
+    """
+    The DishSerializer fields requested through `?fields=a,b`, all of them by default.
+    """
+    available = DishSerializer.Meta.fields
+    if not fields:
+        return available
+
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in requested if field not in available]
+    if unknown:
+        raise ValidationError(
+            {"fields": [f"Unknown field: {field}." for field in unknown]}
+        )
+    return tuple(field for field in available if field in requested)
+
+
+def get_dish_columns(fields):
+    # id is always selected, the cursor is built from it
+    columns = {"id"}
+    for field in fields:
+        columns.update(DISH_COLUMNS[field])
+    return sorted(columns)
+
+
+def dish_row_to_data(row, fields, request=None, url=None):
+    """
+    Render a `values()` row the way DishSerializer renders a Dish, without
+    building the model instance and the serializer fields for every row.
+    """
+    url = url or get_media_url_builder(request)
+    data = {}
+    renditions = None
+    for field in fields:
+        if field == "image":
+            data["image"] = url(row["image"]) if row["image"] else None
+        elif field in ("renditions", "srcset"):
+            if renditions is None:
+                renditions = get_rendition_urls(row["renditions"], request, url)
+            data[field] = renditions[field]
+        else:
+            data[field] = row[field]
+    return data
@@ -0,0 +1,466 @@
+import asyncio
+import itertools
+import json
+import logging
+import threading
+import time
+from collections import deque
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import connection, transaction
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils.module_loading import import_string
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from users.authentication import TokenUserAuthentication
+
+
+logger = logging.getLogger(__name__)
+
+# user types allowed on the feed, cashiers and admins
+FEED_USER_TYPES = (2, 3)
+
+
+def get_config(key, default):
+    return getattr(settings, "ORDER_FEED", {}).get(key, default)
+
+
+class Event:
+    __slots__ = ("id", "type", "data")
+
+    def __init__(self, id, type, data):
+        self.id = id
+        self.type = type
+        self.data = data
+
+    def as_json(self):
+        return json.dumps({"id": self.id, "type": self.type, "data": self.data})
+
+    def as_sse(self):
+        return f"id: {self.id}\nevent: {self.type}\ndata: {json.dumps(self.data)}\n\n"
+
+
+# queued for a subscriber that fell too far behind, its connection is closed
+OVERFLOW = Event(None, "overflow", {})
+
+
+class Subscriber:
+    """
+    One connected client: a bounded queue living on the client's event loop.
+    """
+
+    def __init__(self, loop, queue_size):
+        self.loop = loop
+        self.queue = asyncio.Queue(queue_size)
+        self.overflowed = False
+        # ids of the missed events it was sent on subscribing, the live
+        # stream may repeat them
+        self.replayed = set()
+
+    def push(self, event):
+        # runs on self.loop
+        if self.overflowed or event.id in self.replayed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # rather than buffering without bound or blocking the publisher,
+            # cut the client off, it resumes from its last event id
+            self.overflowed = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(OVERFLOW)
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class LocalBackend:
+    """
+    Events only reach the clients of this process. Enough for a single
+    worker, and the stand-in for tests.
+    """
+
+    def __init__(self, **options):
+        self.counter = itertools.count(1)
+        self.lock = threading.Lock()
+        self.dispatch = None
+
+    def attach(self, dispatch):
+        self.dispatch = dispatch
+
+    def publish(self, type, data):
+        with self.lock:
+            self.dispatch(Event(next(self.counter), type, data))
+
+    def history(self, last_id, limit):
+        # nothing older than the broker's buffer is kept
+        return None
+
+    def subscribers_changed(self, count, last_id=None):
+        pass
+
+
+class DatabaseBackend:
+    """
+    Events go through the OrderEvent table, one poller thread per process
+    picks them up while it has clients and fans them out. Database load
+    grows with the number of nodes, not terminals, and ids are shared by
+    every node so clients can resume anywhere.
+
+    Ids are handed out at insert but show up at commit, so a lower id can
+    appear after a higher one was polled. Every poll reads the last
+    `overlap` ids again, down to where polling started, and skips the ones
+    it already dispatched. Events of transactions that stay open longer
+    than that are missed.
+    """
+
+    def __init__(self, poll_interval=0.5, overlap=100, **options):
+        self.poll_interval = poll_interval
+        self.overlap = overlap
+        self.dispatch = None
+        self.lock = threading.Lock()
+        self.polling = False
+        self.subscribers = 0
+        self.last_id = None
+        # nothing at or below it is dispatched, subscribers have it already
+        self.start_id = None
+        self.dispatched = set()
+
+    def attach(self, dispatch):
+        self.dispatch = dispatch
+
+    def publish(self, type, data):
+        from rest_api.models import OrderEvent
+
+        OrderEvent.objects.create(type=type, data=data)
+
+    def history(self, last_id, limit):
+        from rest_api.models import OrderEvent
+
+        rows = list(
+            OrderEvent.objects.filter(id__gt=last_id)
+            .order_by("id")
+            .values_list("id", "type", "data")[: limit + 1]
+        )
+        if len(rows) > limit:
+            return None
+        return [Event(*row) for row in rows]
+
+    def subscribers_changed(self, count, last_id=None):
+        """
+        `last_id` is the event a new subscriber was caught up to from the
+        history or the broker's buffer, polling continues from there at the
+        latest so nothing after it is skipped.
+        """
+        with self.lock:
+            self.subscribers = count
+            if last_id is not None and (self.last_id is None or last_id < self.last_id):
+                self.last_id = last_id
+                if self.start_id is None or last_id < self.start_id:
+                    self.start_id = last_id
+            if count and not self.polling:
+                self.polling = True
+                threading.Thread(target=self.poll, daemon=True).start()
+
+    def poll_once(self, limit=500):
+        from rest_api.models import OrderEvent
+
+        if self.last_id is None:
+            # no subscriber needs anything older, start with the next event
+            latest = OrderEvent.objects.order_by("-id").values_list("id", flat=True)
+            latest = latest.first() or 0
+            with self.lock:
+                if self.last_id is None:
+                    self.last_id = self.start_id = latest
+
+        with self.lock:
+            last_id = self.last_id
+            floor = max(last_id - self.overlap, self.start_id)
+
+        rows = (
+            OrderEvent.objects.filter(id__gt=floor)
+            .order_by("id")
+            .values_list("id", "type", "data")
+        )
+        highest = last_id
+        for row in rows[: self.overlap + limit]:
+            highest = max(highest, row[0])
+            if row[0] in self.dispatched:
+                continue
+            self.dispatched.add(row[0])
+            self.dispatch(Event(*row))
+
+        with self.lock:
+            # unless a subscriber moved it back meanwhile
+            if self.last_id == last_id:
+                self.last_id = highest
+            floor = max(self.last_id - self.overlap, self.start_id)
+        self.dispatched = {pk for pk in self.dispatched if pk > floor}
+
+    def poll(self):
+        try:
+            while True:
+                with self.lock:
+                    if not self.subscribers:
+                        # the next subscribers start from their own position
+                        self.polling = False
+                        self.last_id = self.start_id = None
+                        self.dispatched = set()
+                        return
+                self.poll_once()
+                time.sleep(self.poll_interval)
+        except Exception:
+            logger.exception("Polling the order events failed")
+            with self.lock:
+                self.polling = False
+        finally:
+            connection.close()
+
+
+class Broker:
+    """
+    Fans published events out to the subscribers of this process. The last
+    `buffer_size` events are kept so a reconnecting client can be sent what
+    it missed, older ones are asked from the backend.
+    """
+
+    def __init__(self, backend, buffer_size=1000, queue_size=100):
+        self.backend = backend
+        self.buffer = deque(maxlen=buffer_size)
+        self.queue_size = queue_size
+        self.subscribers = set()
+        self.lock = threading.Lock()
+        self.last_id = 0
+        self.overflows = 0
+        backend.attach(self.dispatch)
+
+    def publish(self, type, data):
+        self.backend.publish(type, data)
+
+    def dispatch(self, event):
+        with self.lock:
+            self.buffer.append(event)
+            self.last_id = max(self.last_id, event.id)
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.loop.call_soon_threadsafe(subscriber.push, event)
+            except RuntimeError:
+                # its loop is gone without unsubscribing
+                self.unsubscribe(subscriber)
+
+    def covers(self, last_id):
+        with self.lock:
+            if last_id == self.last_id:
+                return True
+            return bool(self.buffer) and self.buffer[0].id <= last_id + 1 <= self.last_id
+
+    async def subscribe(self, last_id=None):
+        missed = []
+        if last_id is not None and not self.covers(last_id):
+            history = await sync_to_async(self.backend.history)(last_id, self.buffer.maxlen)
+            if history is None:
+                # too far behind, the client has to reload its orders
+                missed, last_id = [Event(self.last_id, "reset", {})], None
+            else:
+                missed = history
+                last_id = history[-1].id if history else last_id
+
+        subscriber = Subscriber(asyncio.get_running_loop(), self.queue_size)
+        with self.lock:
+            if last_id is not None:
+                missed += [event for event in self.buffer if event.id > last_id]
+                last_id = max([last_id, *(event.id for event in missed)])
+            self.subscribers.add(subscriber)
+            count = len(self.subscribers)
+        # no await until these are queued, so live events can't overtake them
+        for event in missed:
+            subscriber.push(event)
+        subscriber.replayed = {event.id for event in missed}
+        self.backend.subscribers_changed(count, last_id)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+            count = len(self.subscribers)
+            if subscriber.overflowed:
+                self.overflows += 1
+        self.backend.subscribers_changed(count)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "subscribers": len(self.subscribers),
+                "last_id": self.last_id,
+                "buffered": len(self.buffer),
+                "overflows": self.overflows,
+            }
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                backend = import_string(
+                    get_config("BACKEND", "rest_api.feed.LocalBackend")
+                )
+                _broker = Broker(
+                    backend(
+                        poll_interval=get_config("POLL_INTERVAL", 0.5),
+                        overlap=get_config("OVERLAP", 100),
+                    ),
+                    buffer_size=get_config("BUFFER_SIZE", 1000),
+                    queue_size=get_config("QUEUE_SIZE", 100),
+                )
+    return _broker
+
+
+def publish_order_event(type, data):
+    """
+    Publish once the current transaction commits, so clients never see an
+    order that was rolled back. `data` may be a function building it then.
+    """
+
+    def publish():
+        get_broker().publish(type, data() if callable(data) else data)
+
+    transaction.on_commit(publish)
+
+
+def authenticate(raw_token):
+    """
+    The TokenUser of a cashier or admin access token, None otherwise. It
+    reads the token version from django's cache, call it through
+    sync_to_async on an event loop.
+    """
+    if not raw_token:
+        return None
+    authentication = TokenUserAuthentication()
+    try:
+        user = authentication.get_user(authentication.get_validated_token(raw_token))
+    except (InvalidToken, AuthenticationFailed):
+        return None
+    return user if user.user_type in FEED_USER_TYPES else None
+
+
+def get_raw_token(authorization, query):
+    """
+    From the Authorization header, or ?token= since EventSource and browser
+    WebSockets can't set headers.
+    """
+    parts = (authorization or "").split()
+    if len(parts) == 2 and parts[0] in api_settings.AUTH_HEADER_TYPES:
+        return parts[1]
+    return query.get("token")
+
+
+def parse_last_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+async def event_stream(last_id):
+    # subscribed here rather than in the view: with sync middleware the view
+    # runs on a short-lived event loop, the response is streamed from the server's
+    subscriber = await get_broker().subscribe(last_id)
+    heartbeat = get_config("HEARTBEAT", 15)
+    try:
+        yield "retry: 3000\n\n"
+        while True:
+            try:
+                event = await asyncio.wait_for(subscriber.get(), heartbeat)
+            except asyncio.TimeoutError:
+                # keeps proxies from closing an idle connection
+                yield ": ping\n\n"
+                continue
+            if event is OVERFLOW:
+                yield "event: overflow\ndata: {}\n\n"
+                return
+            yield event.as_sse()
+    finally:
+        get_broker().unsubscribe(subscriber)
+
+
+async def order_feed(request):
+    """
+    Server-sent events of new orders and status changes for cashiers. Only
+    served through asgi.py, a WSGI worker would be held by every client.
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse(
+            {"error": "The order feed is only served over ASGI."}, status=501
+        )
+
+    user = await sync_to_async(authenticate)(
+        get_raw_token(request.headers.get("Authorization"), request.GET)
+    )
+    if user is None:
+        return JsonResponse(
+            {"error": "You must be a cashier to access this resource."}, status=403
+        )
+
+    last_id = parse_last_id(
+        request.headers.get("Last-Event-ID") or request.GET.get("last_event_id")
+    )
+    response = StreamingHttpResponse(
+        event_stream(last_id), content_type="text/event-stream"
+    )
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+async def websocket_feed(scope, receive, send):
+    """
+    The same feed over a WebSocket, one JSON message per event. Resume with
+    ?last_event_id=.
+    """
+    message = await receive()
+    if message["type"] != "websocket.connect":
+        return
+
+    query = {key: values[-1] for key, values in parse_qs(scope["query_string"].decode()).items()}
+    headers = {name.decode().lower(): value.decode() for name, value in scope["headers"]}
+    user = await sync_to_async(authenticate)(
+        get_raw_token(headers.get("authorization"), query)
+    )
+    if user is None:
+        await send({"type": "websocket.close", "code": 4403})
+        return
+
+    await send({"type": "websocket.accept"})
+    broker = get_broker()
+    subscriber = await broker.subscribe(parse_last_id(query.get("last_event_id")))
+
+    async def forward():
+        while True:
+            event = await subscriber.get()
+            await send({"type": "websocket.send", "text": event.as_json()})
+            if event is OVERFLOW:
+                await send({"type": "websocket.close", "code": 4008})
+                return
+
+    async def listen():
+        while (await receive())["type"] != "websocket.disconnect":
+            pass
+
+    tasks = [asyncio.ensure_future(forward()), asyncio.ensure_future(listen())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        broker.unsubscribe(subscriber)
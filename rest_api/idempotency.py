@@ -0,0 +1,260 @@
+import hashlib
+import threading
+import time
+from datetime import timedelta
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+
+from rest_api.models import IdempotencyKey
+from users.authentication import get_token_user_id
+
+
+HEADER = "Idempotency-Key"
+
+
+def get_config(key, default):
+    return getattr(settings, "IDEMPOTENCY", {}).get(key, default)
+
+
+def get_digest(request, key):
+    # anonymous requests share one scope
+    scope = "\n".join((request.method, request.path, get_token_user_id(request), key))
+    return hashlib.sha256(scope.encode()).hexdigest()
+
+
+class IdempotencyMiddleware:
+    """
+    Runs a POST to one of IDEMPOTENCY['PATHS'] carrying an Idempotency-Key
+    header once, and replays the stored status and body for every retry
+    within TTL seconds.
+
+    The first request claims the key by inserting its row, so a duplicate
+    arriving while it runs waits for the response (up to WAIT seconds, then
+    409) instead of executing again, in this worker or another one. Server
+    errors and 429s aren't stored so the client can retry them for real.
+
+    Under ASGI the database work runs in threads, so the async views behind
+    it aren't pushed back onto a sync thread.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        self.paths = tuple(get_config("PATHS", ()))
+        self.ttl = get_config("TTL", 60 * 60 * 24)
+        self.wait = get_config("WAIT", 10)
+        self.lock_timeout = get_config("LOCK_TIMEOUT", 60)
+        # duplicates in this worker wait on the event instead of polling
+        self.in_flight = {}
+        self.lock = threading.Lock()
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
+        checked = self.check(request)
+        if checked is None:
+            return self.get_response(request)
+        if isinstance(checked, HttpResponse):
+            return checked
+        digest, fingerprint = checked
+
+        while True:
+            entry = self.claim(digest, fingerprint)
+            if entry is None:
+                return self.execute(request, digest)
+            response = self.handle_existing(entry, fingerprint)
+            if response is not None:
+                return response
+
+            entry = self.wait_for(entry)
+            if entry is None:
+                # the first request failed or was abandoned, run this one
+                continue
+            return self.handle_finished(entry)
+
+    async def __acall__(self, request):
+        checked = self.check(request)
+        if checked is None:
+            return await self.get_response(request)
+        if isinstance(checked, HttpResponse):
+            return checked
+        digest, fingerprint = checked
+
+        while True:
+            entry = await sync_to_async(self.claim)(digest, fingerprint)
+            if entry is None:
+                return await self.aexecute(request, digest)
+            response = self.handle_existing(entry, fingerprint)
+            if response is not None:
+                return response
+
+            # off the thread-sensitive executor, the request being waited
+            # for may need it
+            entry = await sync_to_async(self.wait_for, thread_sensitive=False)(entry)
+            if entry is None:
+                continue
+            return self.handle_finished(entry)
+
+    def check(self, request):
+        """
+        None for requests this doesn't apply to, an error response, or the
+        (digest, fingerprint) of the request.
+        """
+        key = request.headers.get(HEADER)
+        if request.method != "POST" or not key or request.path not in self.paths:
+            return None
+
+        if len(key) > 255:
+            return JsonResponse(
+                {"message": f"{HEADER} must be at most 255 characters."}, status=400
+            )
+
+        return get_digest(request, key), hashlib.sha256(request.body).hexdigest()
+
+    def handle_existing(self, entry, fingerprint):
+        """
+        The response for a key claimed by another request, None while it runs.
+        """
+        if entry.fingerprint != fingerprint:
+            return JsonResponse(
+                {"message": f"{HEADER} was already used for a different request."},
+                status=422,
+            )
+        if entry.status_code is not None:
+            return self.replay(entry)
+        return None
+
+    def handle_finished(self, entry):
+        if entry.status_code is None:
+            return JsonResponse(
+                {"message": "A request with this key is still being processed."},
+                status=409,
+            )
+        return self.replay(entry)
+
+    def claim(self, digest, fingerprint):
+        """
+        None when this request now owns the key, otherwise the existing entry.
+        """
+        now = timezone.now()
+        try:
+            # a savepoint, so a taken key doesn't break an enclosing transaction
+            with transaction.atomic():
+                IdempotencyKey.objects.create(
+                    digest=digest,
+                    fingerprint=fingerprint,
+                    locked_at=now,
+                    expires_at=now + timedelta(seconds=self.ttl),
+                )
+        except IntegrityError:
+            pass
+        else:
+            return None
+
+        entry = IdempotencyKey.objects.filter(digest=digest).first()
+        if entry is None:
+            return self.claim(digest, fingerprint)
+
+        abandoned = entry.status_code is None and entry.locked_at <= now - timedelta(
+            seconds=self.lock_timeout
+        )
+        if entry.expires_at <= now or abandoned:
+            # only one of the racing requests gets to replace it
+            taken = IdempotencyKey.objects.filter(
+                pk=entry.pk, locked_at=entry.locked_at
+            ).update(
+                fingerprint=fingerprint,
+                status_code=None,
+                content_type="",
+                body=None,
+                locked_at=now,
+                expires_at=now + timedelta(seconds=self.ttl),
+            )
+            if taken:
+                return None
+            entry.refresh_from_db()
+        return entry
+
+    def execute(self, request, digest):
+        event = threading.Event()
+        with self.lock:
+            self.in_flight[digest] = event
+        try:
+            response = self.get_response(request)
+            self.store(digest, response)
+            return response
+        except Exception:
+            IdempotencyKey.objects.filter(digest=digest, status_code=None).delete()
+            raise
+        finally:
+            with self.lock:
+                self.in_flight.pop(digest, None)
+            event.set()
+
+    async def aexecute(self, request, digest):
+        event = threading.Event()
+        with self.lock:
+            self.in_flight[digest] = event
+        try:
+            response = await self.get_response(request)
+            await sync_to_async(self.store)(digest, response)
+            return response
+        except Exception:
+            await IdempotencyKey.objects.filter(digest=digest, status_code=None).adelete()
+            raise
+        finally:
+            with self.lock:
+                self.in_flight.pop(digest, None)
+            event.set()
+
+    def store(self, digest, response):
+        if (
+            response.status_code >= 500
+            or response.status_code == 429
+            or response.streaming
+        ):
+            IdempotencyKey.objects.filter(digest=digest, status_code=None).delete()
+            return
+        IdempotencyKey.objects.filter(digest=digest).update(
+            status_code=response.status_code,
+            content_type=response.get("Content-Type", ""),
+            body=response.content,
+        )
+
+    def wait_for(self, entry):
+        """
+        The entry once it has a response, None if it went away, or the
+        unfinished entry when WAIT ran out.
+        """
+        deadline = time.monotonic() + self.wait
+        with self.lock:
+            event = self.in_flight.get(entry.digest)
+        if event is not None:
+            event.wait(self.wait)
+
+        while True:
+            entry = IdempotencyKey.objects.filter(pk=entry.pk).first()
+            if entry is None or entry.status_code is not None:
+                return entry
+            if time.monotonic() >= deadline:
+                return entry
+            time.sleep(0.05)
+
+    def replay(self, entry):
+        response = HttpResponse(
+            bytes(entry.body or b""),
+            status=entry.status_code,
+            content_type=entry.content_type or None,
+        )
+        response["Idempotent-Replayed"] = "true"
+        return response
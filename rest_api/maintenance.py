@@ -0,0 +1,53 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+from rest_api.models import Dish, IdempotencyKey, OrderEvent
+from rest_api.renditions import RENDITION_DIR
+from users.maintenance import delete_file, get_config, in_batches, job
+
+
+@job(interval=timedelta(hours=1))
+def delete_expired_idempotency_keys():
+    expired = IdempotencyKey.objects.filter(expires_at__lte=timezone.now())
+    return in_batches(expired, lambda keys: keys.delete()), 0
+
+
+@job(interval=timedelta(hours=1))
+def delete_old_order_events():
+    hours = getattr(settings, "ORDER_FEED", {}).get("RETENTION_HOURS", 24)
+    old = OrderEvent.objects.filter(created_at__lt=timezone.now() - timedelta(hours=hours))
+    return in_batches(old, lambda events: events.delete()), 0
+
+
+@job(interval=timedelta(days=1))
+def delete_superseded_renditions():
+    """
+    Remove renditions no dish refers to anymore, left behind when a dish's
+    image is replaced or the dish is deleted. The names are content hashed
+    and may be shared between dishes. Files newer than
+    RENDITION_GRACE_SECONDS are kept, a render may not have been recorded yet.
+    """
+    try:
+        _, files = default_storage.listdir(RENDITION_DIR)
+    except FileNotFoundError:
+        return 0, 0
+
+    referenced = set()
+    for renditions in Dish.objects.values_list("renditions", flat=True).iterator():
+        for rendition in (renditions or {}).values():
+            referenced.update(rendition["formats"].values())
+
+    cutoff = timezone.now() - timedelta(
+        seconds=get_config("RENDITION_GRACE_SECONDS", 3600)
+    )
+    rows = reclaimed = 0
+    for filename in files:
+        name = f"{RENDITION_DIR}/{filename}"
+        if name in referenced or default_storage.get_modified_time(name) > cutoff:
+            continue
+        reclaimed += delete_file(name)
+        rows += 1
+    return rows, reclaimed
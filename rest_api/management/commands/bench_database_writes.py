@@ -0,0 +1,210 @@
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from rest_api.models import Dish, Order
+from users.models import User
+
+
+BENCH_DOMAIN = "bench.example.com"
+
+# environment of the worker processes per mode, see DATABASES in settings.py
+MODES = {
+    "sqlite": {"DB_ENGINE": "sqlite", "SQLITE_TUNED": "False"},
+    "sqlite-tuned": {"DB_ENGINE": "sqlite", "SQLITE_TUNED": "True"},
+    "postgresql": {"DB_ENGINE": "postgresql", "DB_CONN_MAX_AGE": "0", "DB_POOL_SIZE": "0"},
+    "postgresql-persistent": {
+        "DB_ENGINE": "postgresql",
+        "DB_CONN_MAX_AGE": "60",
+        "DB_POOL_SIZE": "0",
+    },
+    "postgresql-pool": {"DB_ENGINE": "postgresql", "DB_POOL_SIZE": "{threads}"},
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare order writes per second across the database modes, with several "
+        "worker processes of several threads like gunicorn. The sqlite modes run "
+        "on temporary files, the postgresql ones on the DB_* database, where a "
+        "throwaway user and dishes are created and removed afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--modes",
+            default="sqlite,sqlite-tuned",
+            help=f"Comma separated, out of {', '.join(MODES)}.",
+        )
+        parser.add_argument("--processes", type=int, default=4)
+        parser.add_argument("--threads", type=int, default=4)
+        parser.add_argument(
+            "--count", type=int, default=200, help="Orders per process."
+        )
+        parser.add_argument("--lines", type=int, default=3)
+        # run by the command itself in the worker processes
+        parser.add_argument("--role", choices=("setup", "worker", "cleanup"))
+        parser.add_argument("--start-at", type=float)
+        parser.add_argument("--user", type=int)
+
+    def spawn(self, env, *args):
+        return subprocess.Popen(
+            [sys.executable, "manage.py", "bench_database_writes", *map(str, args)],
+            cwd=settings.BASE_DIR,
+            env=env,
+            stdout=subprocess.PIPE,
+        )
+
+    def call(self, env, *args):
+        process = self.spawn(env, *args)
+        output, _ = process.communicate()
+        if process.returncode:
+            raise CommandError(f"{' '.join(map(str, args))} failed")
+        return json.loads(output.splitlines()[-1]) if output.strip() else None
+
+    def setup(self):
+        user = User.objects.create_user(
+            email=f"{uuid.uuid4().hex}@{BENCH_DOMAIN}", password=None, is_verfied=True
+        )
+        Dish.objects.bulk_create(
+            Dish(name=f"Bench dish {user.pk}-{number}", image="", price=100 + number)
+            for number in range(50)
+        )
+        return {"user": user.pk}
+
+    def cleanup(self, user_id):
+        Order.objects.filter(user_id=user_id).delete()
+        Dish.objects.filter(name__startswith=f"Bench dish {user_id}-").delete()
+        User.objects.filter(pk=user_id).delete()
+
+    def work(self, options):
+        token = str(AccessToken.for_user(User.objects.get(pk=options["user"])))
+        ids = list(
+            Dish.objects.filter(
+                name__startswith=f"Bench dish {options['user']}-"
+            ).values_list("pk", flat=True)
+        )
+        close_old_connections()
+
+        def place(_):
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+            start = time.perf_counter()
+            response = client.post(
+                "/api/orders/",
+                {
+                    "lines": [
+                        {"dish": pk, "quantity": random.randint(1, 3)}
+                        for pk in random.sample(ids, options["lines"])
+                    ]
+                },
+                format="json",
+            )
+            # what the server does at the end of a request, the test client doesn't
+            close_old_connections()
+            return response.status_code, time.perf_counter() - start
+
+        time.sleep(max(options["start_at"] - time.time(), 0))
+        with ThreadPoolExecutor(options["threads"]) as executor:
+            results = list(executor.map(place, range(options["count"])))
+        return {
+            "end": time.time(),
+            "created": sum(1 for status_code, _ in results if status_code == 201),
+            "latencies": [latency for _, latency in results],
+        }
+
+    def measure(self, mode, env, options):
+        if mode.startswith("sqlite"):
+            # a fresh file per mode, the journal mode sticks to the file
+            env["DB_NAME"] = os.path.join(env["BENCH_DIR"], f"{mode}.sqlite3")
+            migrate = subprocess.run(
+                [sys.executable, "manage.py", "migrate", "-v0"],
+                cwd=settings.BASE_DIR,
+                env=env,
+                capture_output=True,
+            )
+            if migrate.returncode:
+                raise CommandError(migrate.stderr.decode())
+
+        user = self.call(env, "--role", "setup")["user"]
+        try:
+            # every process starts together once they're all booted
+            start_at = time.time() + 3
+            workers = [
+                self.spawn(
+                    env,
+                    "--role", "worker",
+                    "--user", user,
+                    "--start-at", start_at,
+                    "--threads", options["threads"],
+                    "--count", options["count"],
+                    "--lines", options["lines"],
+                )
+                for _ in range(options["processes"])
+            ]
+            results = []
+            for worker in workers:
+                output, _ = worker.communicate()
+                if worker.returncode:
+                    raise CommandError(f"a {mode} worker failed")
+                results.append(json.loads(output.splitlines()[-1]))
+        finally:
+            self.call(env, "--role", "cleanup", "--user", user)
+
+        elapsed = max(result["end"] for result in results) - start_at
+        created = sum(result["created"] for result in results)
+        latencies = sorted(
+            latency for result in results for latency in result["latencies"]
+        )
+        total = options["processes"] * options["count"]
+        self.stdout.write(
+            f"{mode:>21}: {created / elapsed:8,.1f} orders/s  "
+            f"p50 {latencies[len(latencies) // 2] * 1000:7.1f} ms  "
+            f"p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:7.1f} ms  "
+            f"failed {total - created}"
+        )
+
+    def handle(self, *args, **options):
+        role = options["role"]
+        if role == "setup":
+            self.stdout.write(json.dumps(self.setup()))
+            return
+        if role == "cleanup":
+            self.cleanup(options["user"])
+            return
+        if role == "worker":
+            self.stdout.write(json.dumps(self.work(options)))
+            return
+
+        modes = options["modes"].split(",")
+        unknown = set(modes) - set(MODES)
+        if unknown:
+            raise CommandError(f"Unknown modes: {', '.join(sorted(unknown))}")
+
+        self.stdout.write(
+            f"{options['processes']} processes x {options['threads']} threads, "
+            f"{options['count']} orders of {options['lines']} lines per process"
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            for mode in modes:
+                env = {
+                    **os.environ,
+                    **{
+                        name: value.format(threads=options["threads"])
+                        for name, value in MODES[mode].items()
+                    },
+                    "BENCH_DIR": directory,
+                }
+                self.measure(mode, env, options)
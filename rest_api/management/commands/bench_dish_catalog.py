@@ -0,0 +1,91 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient, APIRequestFactory
+
+from rest_api.models import Dish
+from rest_api.serializers import DishSerializer
+
+
+BENCH_PREFIX = "bench-dish-"
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure GET /api/dishes/ over a large catalog: queries per page and "
+        "rows per second, walking every page and compared with serializing "
+        "model instances. Creates throwaway dishes and removes them afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dishes", type=int, default=100_000)
+        parser.add_argument("--limit", type=int, default=500)
+        parser.add_argument("--fields", default="")
+
+    def create_dishes(self, count):
+        renditions = {
+            name: {"width": width, "formats": {"jpeg": f"dishes/renditions/{name}.jpg"}}
+            for name, width in (("thumbnail", 320), ("detail", 800))
+        }
+        batch = 5_000
+        for start in range(0, count, batch):
+            Dish.objects.bulk_create(
+                Dish(
+                    name=f"{BENCH_PREFIX}{number}",
+                    image=f"dishes/{number}.jpg",
+                    price=number % 100,
+                    renditions=renditions,
+                )
+                for number in range(start, min(start + batch, count))
+            )
+
+    def walk(self, client, limit, fields):
+        url = f"/api/dishes/?limit={limit}"
+        if fields:
+            url += f"&fields={fields}"
+        rows = pages = 0
+        queries = set()
+        start = time.perf_counter()
+        while url:
+            with CaptureQueriesContext(connection) as captured:
+                body = client.get(url).json()
+            queries.add(len(captured))
+            rows += len(body["results"])
+            pages += 1
+            url = body["next"]
+        return rows, pages, queries, time.perf_counter() - start
+
+    def handle(self, *args, **options):
+        client = APIClient()
+        limit = options["limit"]
+        try:
+            self.create_dishes(options["dishes"])
+
+            for page_size in (10, 100, limit):
+                with CaptureQueriesContext(connection) as captured:
+                    client.get(f"/api/dishes/?limit={page_size}")
+                self.stdout.write(f"limit={page_size}: {len(captured)} queries")
+
+            rows, pages, queries, elapsed = self.walk(client, limit, options["fields"])
+            self.stdout.write(
+                f"walked {rows:,} dishes in {pages} pages: {rows / elapsed:,.0f} rows/s, "
+                f"{elapsed / pages * 1000:.1f} ms/page, queries per page: {sorted(queries)}"
+            )
+
+            # baseline: the same page through model instances and DishSerializer
+            request = APIRequestFactory().get("/api/dishes/")
+            start = time.perf_counter()
+            serialized = 0
+            for offset in range(0, min(rows, 20 * limit), limit):
+                dishes = Dish.objects.order_by("id")[offset : offset + limit]
+                serialized += len(
+                    DishSerializer(dishes, many=True, context={"request": request}).data
+                )
+            elapsed = time.perf_counter() - start
+            self.stdout.write(
+                f"DishSerializer over instances: {serialized / elapsed:,.0f} rows/s"
+            )
+        finally:
+            Dish.objects.filter(name__startswith=BENCH_PREFIX).delete()
@@ -0,0 +1,116 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models.functions import Length
+
+from rest_api.models import Dish
+from rest_api.search import PrefixIndex, search_dish_ids
+
+
+WORDS = (
+    "beef chicken lamb pork tofu paneer shrimp salmon tuna falafel halloumi "
+    "burger wrap bowl salad soup curry stew pasta pizza taco burrito noodles "
+    "grilled fried roasted smoked spicy crispy glazed creamy garlic lemon "
+    "pepper honey chili basil mango sesame teriyaki barbecue cheddar truffle"
+).split()
+
+
+SYLLABLES = "ba ko ri ta me lu sa no pi de gu ha ve zo mi ra ne to ka li".split()
+
+
+def make_vocabulary(generator, size=3000):
+    """
+    The food words plus made-up ones, a real menu's vocabulary is far larger
+    than WORDS and a handful of common words would make every query match most rows.
+    """
+    words = set(WORDS)
+    while len(words) < size:
+        words.add("".join(generator.choices(SYLLABLES, k=generator.randint(2, 4))))
+    words = sorted(words)
+    generator.shuffle(words)
+    # zipf-like, a few words are common and most are rare
+    weights = [1 / (rank + 1) for rank in range(len(words))]
+    return words, weights
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    pick = lambda q: samples[min(int(len(samples) * q), len(samples) - 1)] * 1000
+    return (
+        f"p50 {pick(0.5):.3f} ms, p95 {pick(0.95):.3f} ms, p99 {pick(0.99):.3f} ms, "
+        f"mean {statistics.fmean(samples) * 1000:.3f} ms"
+    )
+
+
+def measure(function, queries):
+    samples = []
+    for query in queries:
+        start = time.perf_counter()
+        function(query)
+        samples.append(time.perf_counter() - start)
+    return percentiles(samples)
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure dish search latency: the full-text index, a LIKE '%%x%%' scan "
+        "and the in-memory autocomplete trie. Creates throwaway dishes and "
+        "removes them afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dishes", type=int, default=100_000)
+        parser.add_argument("--queries", type=int, default=500)
+
+    def handle(self, *args, **options):
+        generator = random.Random(0)
+        words, weights = make_vocabulary(generator)
+
+        def phrase(count):
+            return " ".join(generator.choices(words, weights, k=count))
+
+        # names are kept realistic, the benchmark's dishes are told apart by id
+        first_id = (Dish.objects.order_by("-id").values_list("id", flat=True).first() or 0) + 1
+        try:
+            batch = 5_000
+            for start in range(0, options["dishes"], batch):
+                Dish.objects.bulk_create(
+                    Dish(
+                        name=phrase(generator.randint(2, 4)),
+                        image="",
+                    )
+                    for number in range(start, min(start + batch, options["dishes"]))
+                )
+
+            # what autocomplete sees while typing: "b", "be", ..., "beef gr"
+            queries = []
+            for _ in range(options["queries"]):
+                typed = phrase(2)
+                queries.append(typed[: generator.randint(1, len(typed))])
+
+            self.stdout.write(f"{options['dishes']:,} dishes on {connection.vendor}")
+            self.stdout.write(
+                f"full-text index: {measure(lambda q: search_dish_ids(q, 20), queries)}"
+            )
+
+            def like(query):
+                # ranked the cheapest way, shortest names first, so it has to see every match
+                dishes = Dish.objects.all()
+                for word in query.split():
+                    dishes = dishes.filter(name__icontains=word)
+                return list(
+                    dishes.order_by(Length("name"), "id").values_list("id", flat=True)[:20]
+                )
+
+            self.stdout.write(f"LIKE scan: {measure(like, queries)}")
+
+            index = PrefixIndex(refresh_interval=3600)
+            start = time.perf_counter()
+            index.sync()
+            self.stdout.write(f"trie build: {time.perf_counter() - start:.2f} s")
+            self.stdout.write(f"trie autocomplete: {measure(index.complete, queries)}")
+        finally:
+            Dish.objects.filter(id__gte=first_id).delete()
@@ -0,0 +1,86 @@
+import random
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from rest_api.models import Dish, Order
+from users.models import User
+
+
+BENCH_DOMAIN = "bench.example.com"
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure orders per second through POST /api/orders/ and the queries "
+        "one order takes as it grows. Creates a throwaway user and dishes in "
+        "the configured database and removes them afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=500)
+        parser.add_argument("--concurrency", type=int, default=4)
+        parser.add_argument("--lines", type=int, default=5)
+        parser.add_argument("--dishes", type=int, default=200)
+
+    def handle(self, *args, **options):
+        user = User.objects.create_user(
+            email=f"{uuid.uuid4().hex}@{BENCH_DOMAIN}", password=None, is_verfied=True
+        )
+        token = str(AccessToken.for_user(user))
+        dishes = Dish.objects.bulk_create(
+            Dish(name=f"Bench dish {number}", image="", price=100 + number)
+            for number in range(options["dishes"])
+        )
+        ids = [dish.pk for dish in dishes]
+
+        def place(lines, _=None):
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+            response = client.post(
+                "/api/orders/",
+                {
+                    "lines": [
+                        {"dish": pk, "quantity": random.randint(1, 3)}
+                        for pk in random.sample(ids, lines)
+                    ]
+                },
+                format="json",
+            )
+            connection.close()
+            return response.status_code
+
+        try:
+            place(1)  # warms the authentication cache
+            for lines in (1, 10, min(100, len(ids))):
+                with CaptureQueriesContext(connection) as queries:
+                    status_code = place(lines)
+                self.stdout.write(
+                    f"{lines} lines: {status_code}, {len(queries)} queries "
+                    f"({', '.join(query['sql'].split(' ')[0] for query in queries)})"
+                )
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(options["concurrency"]) as executor:
+                statuses = list(
+                    executor.map(
+                        lambda _: place(options["lines"]), range(options["count"])
+                    )
+                )
+            elapsed = time.perf_counter() - start
+
+            self.stdout.write(
+                f"{options['count']} orders of {options['lines']} lines with "
+                f"{options['concurrency']} threads: {options['count'] / elapsed:,.1f} orders/s, "
+                f"{statuses.count(201)} created"
+            )
+        finally:
+            Order.objects.filter(user=user).delete()
+            Dish.objects.filter(pk__in=ids).delete()
+            user.delete()
@@ -0,0 +1,190 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+# environment of the booted processes per mode
+MODES = {
+    "docs": {"API_DOCS": "True"},
+    "no-docs": {"API_DOCS": "False"},
+}
+
+# what a wsgi worker does up to its first response, run in a fresh
+# interpreter under -X importtime. Nothing but the app is imported, the
+# request is a bare environ rather than the test client
+BOOT = """
+import io, json, sys, time
+started = time.time()
+start = time.perf_counter()
+import django
+django.setup(set_prefix=False)
+set_up = time.perf_counter()
+from django.core.handlers.wsgi import WSGIHandler
+application = WSGIHandler()
+loaded = time.perf_counter()
+statuses = []
+response = application(
+    {
+        "REQUEST_METHOD": "GET",
+        "PATH_INFO": sys.argv[1],
+        "QUERY_STRING": "",
+        "SERVER_NAME": "localhost",
+        "SERVER_PORT": "80",
+        "HTTP_HOST": "localhost",
+        "wsgi.url_scheme": "http",
+        "wsgi.input": io.BytesIO(),
+        "wsgi.errors": sys.stderr,
+    },
+    lambda status, headers, exc_info=None: statuses.append(status),
+)
+b"".join(response)
+response.close()
+end = time.perf_counter()
+print(json.dumps({
+    "started": started,
+    "ended": time.time(),
+    "setup": set_up - start,
+    "application": loaded - set_up,
+    "first_request": end - loaded,
+    "status": statuses[0],
+}))
+"""
+
+
+def parse_import_times(stderr):
+    """
+    {module: (self, cumulative)} in seconds out of -X importtime output.
+    """
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_time, cumulative, name = line[len("import time:"):].split("|")
+        if not self_time.strip().isdigit():
+            # the header
+            continue
+        modules[name.strip()] = (int(self_time) / 1e6, int(cumulative) / 1e6)
+    return modules
+
+
+class Command(BaseCommand):
+    help = (
+        "Boot the app in fresh processes like a wsgi worker and report the time "
+        "to its first response, split into django.setup(), loading the middleware "
+        "and the first request (which imports the urls and views), along with the "
+        "import time per package and module. Needs a migrated database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--modes",
+            default="docs,no-docs",
+            help=f"Comma separated, out of {', '.join(MODES)}.",
+        )
+        parser.add_argument("--path", default="/api/menu/")
+        parser.add_argument(
+            "--runs", type=int, default=5, help="Boots per mode, medians are reported."
+        )
+        parser.add_argument("--top", type=int, default=15)
+        parser.add_argument(
+            "--json", action="store_true", help="Print the results as JSON."
+        )
+
+    def boot(self, env, path):
+        launched = time.time()
+        process = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", BOOT, path],
+            cwd=settings.BASE_DIR,
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+        if process.returncode:
+            raise CommandError(process.stderr)
+        timings = json.loads(process.stdout.splitlines()[-1])
+        timings["interpreter"] = timings.pop("started") - launched
+        timings["total"] = timings.pop("ended") - launched
+        return timings, parse_import_times(process.stderr)
+
+    def measure(self, env, options):
+        runs = [self.boot(env, options["path"]) for _ in range(options["runs"])]
+        timings = {
+            name: statistics.median(run[0][name] for run in runs)
+            for name in ("interpreter", "setup", "application", "first_request", "total")
+        }
+
+        modules = defaultdict(list)
+        for _, imports in runs:
+            for name, times in imports.items():
+                modules[name].append(times)
+        modules = {
+            name: (
+                statistics.median(self_time for self_time, _ in times),
+                statistics.median(cumulative for _, cumulative in times),
+            )
+            for name, times in modules.items()
+        }
+        packages = defaultdict(float)
+        for name, (self_time, _) in modules.items():
+            packages[name.split(".")[0]] += self_time
+
+        return {
+            "status": runs[-1][0]["status"],
+            "timings": timings,
+            "imports": sum(self_time for self_time, _ in modules.values()),
+            "modules": len(modules),
+            "packages": dict(sorted(packages.items(), key=lambda item: -item[1])),
+            "slowest": dict(
+                sorted(modules.items(), key=lambda item: -item[1][0])[: options["top"]]
+            ),
+        }
+
+    def report(self, mode, result, top):
+        timings = result["timings"]
+        self.stdout.write(
+            f"{mode}: first response after {timings['total'] * 1000:.0f} ms "
+            f"({result['status']})\n"
+            f"  interpreter      {timings['interpreter'] * 1000:7.1f} ms\n"
+            f"  django.setup()   {timings['setup'] * 1000:7.1f} ms\n"
+            f"  middleware       {timings['application'] * 1000:7.1f} ms\n"
+            f"  first request    {timings['first_request'] * 1000:7.1f} ms\n"
+            f"  {result['modules']} modules imported in "
+            f"{result['imports'] * 1000:.1f} ms"
+        )
+        self.stdout.write("  by package:")
+        for package, self_time in list(result["packages"].items())[:top]:
+            self.stdout.write(f"    {self_time * 1000:7.1f} ms  {package}")
+        self.stdout.write("  slowest modules (self / cumulative):")
+        for name, (self_time, cumulative) in result["slowest"].items():
+            self.stdout.write(
+                f"    {self_time * 1000:7.1f} / {cumulative * 1000:7.1f} ms  {name}"
+            )
+
+    def handle(self, *args, **options):
+        modes = options["modes"].split(",")
+        unknown = set(modes) - set(MODES)
+        if unknown:
+            raise CommandError(f"Unknown modes: {', '.join(sorted(unknown))}")
+
+        results = {}
+        for mode in modes:
+            env = {
+                **os.environ,
+                **MODES[mode],
+                "DJANGO_SETTINGS_MODULE": os.environ.get(
+                    "DJANGO_SETTINGS_MODULE", "knight_meat_tatse.settings"
+                ),
+            }
+            results[mode] = self.measure(env, options)
+            if not options["json"]:
+                self.report(mode, results[mode], options["top"])
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
@@ -0,0 +1,37 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from rest_api.schema import FORMATS, get_path, render_schema
+
+
+class Command(BaseCommand):
+    help = (
+        "Write the OpenAPI schema as JSON and YAML to OPENAPI_SCHEMA['DIRECTORY'], "
+        "served by /api/swagger.json and /api/swagger.yaml. Run it on every deploy, "
+        "after collectstatic, with API_DOCS=True."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--url",
+            help="Base url of the API, like https://api.example.com. By default the "
+            "docs use the host they're served from.",
+        )
+
+    def handle(self, *args, **options):
+        if not settings.API_DOCS:
+            raise CommandError(
+                "The schema comes from the views' docs decorators, "
+                "run with API_DOCS=True."
+            )
+        for format in FORMATS:
+            body = render_schema(format, options["url"])
+            path = get_path(format)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # running workers may read it at any time, never half written
+            with open(f"{path}.tmp", "wb") as file:
+                file.write(body)
+            os.replace(f"{path}.tmp", path)
+            self.stdout.write(f"{path}: {len(body):,} bytes")
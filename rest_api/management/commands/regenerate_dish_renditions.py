@@ -0,0 +1,55 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+
+from rest_api.menu import rebuild_menu
+from rest_api.models import Dish
+from rest_api.renditions import generate_dish_renditions
+from rest_api.search import invalidate_search_results
+
+
+def regenerate(dish_id, force):
+    try:
+        return generate_dish_renditions(dish_id, force=force)
+    finally:
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = "Render the image renditions of every dish, spread over a process pool."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Render dishes whose renditions are already up to date too.",
+        )
+
+    def handle(self, *args, **options):
+        ids = list(
+            Dish.objects.exclude(image="").order_by("pk").values_list("pk", flat=True)
+        )
+        # forked workers mustn't share the parent's database connection
+        connections.close_all()
+
+        rendered = failed = 0
+        with ProcessPoolExecutor(options["workers"]) as executor:
+            futures = [executor.submit(regenerate, pk, options["force"]) for pk in ids]
+            for pk, future in zip(ids, futures):
+                try:
+                    rendered += future.result()
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f"dish {pk}: {e}")
+
+        if rendered:
+            rebuild_menu()
+            invalidate_search_results()
+
+        self.stdout.write(
+            f"{rendered} of {len(ids)} dishes rendered, "
+            f"{len(ids) - rendered - failed} up to date, {failed} failed"
+        )
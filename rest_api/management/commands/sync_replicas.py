@@ -0,0 +1,45 @@
+import sqlite3
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from knight_meat_tatse.db.router import get_replicas
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy the SQLite primary onto the SQLite replica files, the stand-in "
+        "for replication when trying DB_REPLICAS locally. With --interval it "
+        "keeps copying, the interval being the replication lag."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--interval", type=float, default=0)
+
+    def sync(self, replicas):
+        primary = sqlite3.connect(connections[DEFAULT_DB_ALIAS].settings_dict["NAME"])
+        try:
+            for alias in replicas:
+                replica = sqlite3.connect(connections[alias].settings_dict["NAME"])
+                try:
+                    primary.backup(replica)
+                finally:
+                    replica.close()
+        finally:
+            primary.close()
+
+    def handle(self, *args, **options):
+        replicas = get_replicas()
+        if not replicas:
+            raise CommandError("No replicas are configured, set DB_REPLICAS.")
+        aliases = [DEFAULT_DB_ALIAS, *replicas]
+        if any(connections[alias].vendor != "sqlite" for alias in aliases):
+            raise CommandError("Only SQLite databases can be copied.")
+
+        while True:
+            self.sync(replicas)
+            self.stdout.write(f"copied to {', '.join(replicas)}")
+            if not options["interval"]:
+                return
+            time.sleep(options["interval"])
@@ -0,0 +1,144 @@
+import gzip
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.utils.http import quote_etag
+from rest_framework.renderers import JSONRenderer
+
+from knight_meat_tatse.db.router import use_primary
+
+
+logger = logging.getLogger(__name__)
+
+MENU_KEY = "rest_api:menu"
+LOCK_KEY = "rest_api:menu:lock"
+DIRTY_KEY = "rest_api:menu:dirty"
+
+
+def get_config(key, default):
+    return getattr(settings, "MENU_SNAPSHOT", {}).get(key, default)
+
+
+def get_cache():
+    return caches[get_config("CACHE", "default")]
+
+
+def build_menu():
+    """
+    The serialized menu: {"version", "etag", "last_modified", "body", "gzip"}.
+    Dish media URLs are site-relative since there is no request to build them from.
+    """
+    from rest_api.catalog import dish_row_to_data, get_dish_columns, get_dish_fields
+    from rest_api.models import Dish
+
+    fields = get_dish_fields()
+    # cached for everyone, it must not lag behind the change that triggered it
+    with use_primary():
+        dishes = [
+            dish_row_to_data(row, fields)
+            for row in Dish.objects.order_by("id").values(*get_dish_columns(fields))
+        ]
+    version = time.time_ns()
+    body = JSONRenderer().render({"version": version, "dishes": dishes})
+    return {
+        "version": version,
+        "etag": quote_etag(str(version)),
+        "last_modified": version // 1000000000,
+        "body": body,
+        "gzip": gzip.compress(body, 6),
+    }
+
+
+def rebuild_menu():
+    """
+    Rebuild and store the snapshot unless another rebuild holds the lock,
+    in which case that one is told to run again so it picks up this change.
+    """
+    cache = get_cache()
+    wait = get_config("REBUILD_WAIT", 5)
+    token = uuid.uuid4().hex
+    cache.set(DIRTY_KEY, token, wait * 2)
+    snapshot = None
+    while cache.add(LOCK_KEY, token, wait * 2):
+        try:
+            while cache.get(DIRTY_KEY) is not None:
+                cache.delete(DIRTY_KEY)
+                snapshot = build_menu()
+                cache.set(MENU_KEY, snapshot, get_config("TIMEOUT", 300))
+        finally:
+            if cache.get(LOCK_KEY) == token:
+                cache.delete(LOCK_KEY)
+        # a change that came in between the last check and the release
+        if cache.get(DIRTY_KEY) is None:
+            break
+    return snapshot
+
+
+_local_lock = threading.Lock()
+
+
+def get_menu():
+    """
+    The current snapshot. On a miss only one request per process, and only
+    one process, builds it; the others wait up to REBUILD_WAIT seconds for it.
+    """
+    cache = get_cache()
+    snapshot = cache.get(MENU_KEY)
+    if snapshot is not None:
+        return snapshot
+
+    with _local_lock:
+        snapshot = cache.get(MENU_KEY)
+        if snapshot is not None:
+            return snapshot
+
+        snapshot = rebuild_menu()
+        deadline = time.monotonic() + get_config("REBUILD_WAIT", 5)
+        while snapshot is None and time.monotonic() < deadline:
+            time.sleep(0.05)
+            snapshot = cache.get(MENU_KEY)
+
+    # the other builder died or is too slow, serve a fresh one without storing it
+    return snapshot if snapshot is not None else build_menu()
+
+
+def rebuild_in_background():
+    global _pending
+    with _pending_lock:
+        _pending = False
+    try:
+        rebuild_menu()
+    except Exception:
+        logger.exception("Rebuilding the menu snapshot failed")
+    finally:
+        connection.close()
+
+
+_pool = None
+_pending = False
+_pending_lock = threading.Lock()
+
+
+def schedule_menu_rebuild():
+    """
+    Rebuild once the transaction commits, saves that arrive while a rebuild
+    is queued share it.
+    """
+
+    def submit():
+        global _pool, _pending
+        with _pending_lock:
+            if _pending:
+                return
+            _pending = True
+            if _pool is None:
+                _pool = ThreadPoolExecutor(1, thread_name_prefix="menu")
+        _pool.submit(rebuild_in_background)
+
+    transaction.on_commit(submit)
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.1 on 2026-10-18 08:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rest_api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dish',
+            name='renditions',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='dish',
+            name='renditions_source',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+    ]
@@ -0,0 +1,73 @@
+from django.db import migrations
+
+
+SQLITE_FORWARDS = [
+    """
+    CREATE VIRTUAL TABLE rest_api_dish_fts USING fts5(
+        name, content='rest_api_dish', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='1 2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER rest_api_dish_fts_insert AFTER INSERT ON rest_api_dish BEGIN
+        INSERT INTO rest_api_dish_fts(rowid, name) VALUES (new.id, new.name);
+    END
+    """,
+    """
+    CREATE TRIGGER rest_api_dish_fts_delete AFTER DELETE ON rest_api_dish BEGIN
+        INSERT INTO rest_api_dish_fts(rest_api_dish_fts, rowid, name)
+        VALUES ('delete', old.id, old.name);
+    END
+    """,
+    """
+    CREATE TRIGGER rest_api_dish_fts_update AFTER UPDATE OF name ON rest_api_dish BEGIN
+        INSERT INTO rest_api_dish_fts(rest_api_dish_fts, rowid, name)
+        VALUES ('delete', old.id, old.name);
+        INSERT INTO rest_api_dish_fts(rowid, name) VALUES (new.id, new.name);
+    END
+    """,
+    "INSERT INTO rest_api_dish_fts(rest_api_dish_fts) VALUES ('rebuild')",
+]
+
+SQLITE_BACKWARDS = [
+    "DROP TRIGGER IF EXISTS rest_api_dish_fts_update",
+    "DROP TRIGGER IF EXISTS rest_api_dish_fts_delete",
+    "DROP TRIGGER IF EXISTS rest_api_dish_fts_insert",
+    "DROP TABLE IF EXISTS rest_api_dish_fts",
+]
+
+# must stay the same expression rest_api.search queries with, or the index isn't used
+POSTGRESQL_FORWARDS = [
+    "CREATE INDEX rest_api_dish_name_search ON rest_api_dish "
+    "USING GIN (to_tsvector('simple', name))",
+]
+
+POSTGRESQL_BACKWARDS = [
+    "DROP INDEX IF EXISTS rest_api_dish_name_search",
+]
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+
+    return operation
+
+
+class Migration(migrations.Migration):
+    """
+    Full-text index over Dish.name: an FTS5 table kept in sync by triggers on
+    SQLite, a GIN index over to_tsvector on PostgreSQL, nothing elsewhere.
+    """
+
+    dependencies = [
+        ("rest_api", "0002_dish_renditions"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({"sqlite": SQLITE_FORWARDS, "postgresql": POSTGRESQL_FORWARDS}),
+            run({"sqlite": SQLITE_BACKWARDS, "postgresql": POSTGRESQL_BACKWARDS}),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.1 on 2026-10-18 09:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rest_api', '0006_order_event'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='orderevent',
+            index=models.Index(fields=['created_at'], name='rest_api_or_created_889933_idx'),
+        ),
+    ]
@@ -1,4 +1,6 @@
+from django.conf import settings
 from django.db import models
+from django.utils import timezone
 
 
 class Dish(models.Model):
@@ -6,8 +8,102 @@ class Dish(models.Model):
     image = models.ImageField(upload_to="dishes/")
     price = models.IntegerField(default=0)
 
+    # {rendition: {"width": .., "formats": {format: name}}}, see rest_api.renditions
+    renditions = models.JSONField(default=dict, blank=True)
+    # image name the renditions were built from
+    renditions_source = models.CharField(max_length=255, null=True, blank=True)
+
     def __str__(self):
         return self.name
 
 
 # Order Model
+class Order(models.Model):
+    STATUS_CHOICES = (
+        (1, "Pending"),
+        (2, "Preparing"),
+        (3, "Ready"),
+        (4, "Completed"),
+        (5, "Cancelled"),
+    )
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="orders"
+    )
+    status = models.PositiveSmallIntegerField(choices=STATUS_CHOICES, default=1)
+    # sum of the lines' unit_price * quantity when the order was placed
+    total = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ("-created_at", "-id")
+        indexes = [
+            models.Index(fields=["status", "created_at"]),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # lets post_save tell a status change apart from other saves
+        instance._loaded_status = instance.__dict__.get("status")
+        return instance
+
+    def __str__(self):
+        return f"Order #{self.pk}"
+
+
+class OrderLine(models.Model):
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="lines")
+    # kept when the dish is deleted, name and price are snapshots anyway
+    dish = models.ForeignKey(Dish, on_delete=models.SET_NULL, null=True)
+    name = models.CharField(max_length=255)
+    unit_price = models.IntegerField()
+    quantity = models.PositiveSmallIntegerField(default=1)
+
+    def __str__(self):
+        return f"{self.quantity} x {self.name}"
+
+
+class OrderEvent(models.Model):
+    """
+    Order feed events, written by rest_api.feed.DatabaseBackend so every node
+    can fan them out and a reconnecting client can resume from its last id.
+    """
+
+    type = models.CharField(max_length=50)
+    data = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["created_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.type} #{self.pk}"
+
+
+class IdempotencyKey(models.Model):
+    """
+    The first response to a POST sent with an Idempotency-Key header, replayed
+    for retries of it by rest_api.idempotency.IdempotencyMiddleware.
+    """
+
+    # sha256 of the key, method, path and user, so keys can't collide across users
+    digest = models.CharField(max_length=64, unique=True)
+    # sha256 of the request body, a reused key with another body is refused
+    fingerprint = models.CharField(max_length=64)
+    # null while the first request is still running
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    content_type = models.CharField(max_length=255, blank=True)
+    body = models.BinaryField(null=True, blank=True)
+    locked_at = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["expires_at"]),
+        ]
+
+    def __str__(self):
+        return self.digest
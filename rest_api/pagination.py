@@ -0,0 +1,13 @@
+from rest_framework.pagination import CursorPagination
+
+
+class DishCursorPagination(CursorPagination):
+    """
+    Keyset pagination on the primary key, every page is a single
+    `WHERE id > cursor ORDER BY id LIMIT n + 1` query however deep it is.
+    """
+
+    ordering = "id"
+    page_size = 50
+    page_size_query_param = "limit"
+    max_page_size = 500
@@ -0,0 +1,183 @@
+import hashlib
+import io
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage, storages
+from django.db import connection, transaction
+from django.utils.encoding import filepath_to_uri
+from PIL import Image, ImageOps
+
+
+logger = logging.getLogger(__name__)
+
+RENDITION_DIR = "dishes/renditions"
+
+# name: width, heights follow the image's aspect ratio
+RENDITIONS = {
+    "thumbnail": 320,
+    "detail": 800,
+    "retina": 1600,
+}
+
+FORMATS = {
+    "jpeg": (
+        "jpg",
+        {"format": "JPEG", "quality": 82, "optimize": True, "progressive": True},
+    ),
+    "webp": ("webp", {"format": "WEBP", "quality": 80, "method": 4}),
+    "avif": ("avif", {"format": "AVIF", "quality": 60}),
+}
+
+
+def get_formats():
+    """
+    The formats this Pillow build can encode, AVIF needs a plugin.
+    """
+    Image.init()
+    return {
+        name: spec for name, spec in FORMATS.items() if spec[1]["format"] in Image.SAVE
+    }
+
+
+def render_renditions(data):
+    """
+    ({(rendition, format): bytes}, {rendition: width}) for every rendition
+    and supported format, images are never upscaled.
+    """
+    largest = max(RENDITIONS.values())
+    with Image.open(io.BytesIO(data)) as image:
+        scale = min(largest / image.width, 1)
+        image.draft("RGB", (int(image.width * scale), int(image.height * scale)))
+        image = ImageOps.exif_transpose(image).convert("RGB")
+
+    renditions = {}
+    widths = {}
+    formats = get_formats()
+    source = image
+    for name, width in sorted(RENDITIONS.items(), key=lambda item: -item[1]):
+        width = min(width, image.width)
+        height = max(round(image.height * width / image.width), 1)
+        # each rendition is scaled from the previous, larger one
+        source = source.resize((width, height), Image.LANCZOS, reducing_gap=3.0)
+        widths[name] = width
+        for format_name, (_, options) in formats.items():
+            buffer = io.BytesIO()
+            source.save(buffer, **options)
+            renditions[(name, format_name)] = buffer.getvalue()
+    return renditions, widths
+
+
+def store_renditions(data):
+    """
+    Save the renditions under content-hashed names,
+    returns {rendition: {"width": width, "formats": {format: name}}}.
+    """
+    renditions, widths = render_renditions(data)
+    stored = {name: {"width": width, "formats": {}} for name, width in widths.items()}
+    formats = get_formats()
+    for (name, format_name), content in renditions.items():
+        digest = hashlib.sha256(content).hexdigest()[:16]
+        path = f"{RENDITION_DIR}/{name}-{digest}.{formats[format_name][0]}"
+        if not default_storage.exists(path):
+            default_storage.save(path, ContentFile(content))
+        stored[name]["formats"][format_name] = path
+    return stored
+
+
+def generate_dish_renditions(dish_id, force=False):
+    """
+    Render and record the renditions of one dish, skipped when they're
+    already built for its current image. Returns True if it rendered.
+    """
+    from rest_api.models import Dish
+
+    dish = Dish.objects.filter(pk=dish_id).only("image", "renditions_source").first()
+    if dish is None or not dish.image:
+        return False
+    if not force and dish.renditions_source == dish.image.name:
+        return False
+
+    with default_storage.open(dish.image.name, "rb") as image:
+        renditions = store_renditions(image.read())
+
+    # update() so post_save doesn't schedule another run
+    Dish.objects.filter(pk=dish_id, image=dish.image.name).update(
+        renditions=renditions, renditions_source=dish.image.name
+    )
+    return True
+
+
+def run_in_background(dish_id):
+    from rest_api.menu import schedule_menu_rebuild
+    from rest_api.search import invalidate_search_results
+
+    try:
+        # update() skips post_save, the menu and search results have to pick
+        # up the new urls themselves
+        if generate_dish_renditions(dish_id):
+            schedule_menu_rebuild()
+            invalidate_search_results()
+    except Exception:
+        logger.exception("Rendering the renditions of dish %s failed", dish_id)
+    finally:
+        connection.close()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def schedule_dish_renditions(dish_id):
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(1, thread_name_prefix="dish-renditions")
+
+    transaction.on_commit(lambda: _pool.submit(run_in_background, dish_id))
+
+
+def get_media_url_builder(request=None):
+    """
+    name -> (absolute) url for default_storage. For the filesystem storage the
+    prefix is resolved once, list endpoints build thousands of these per page.
+    """
+    if isinstance(storages["default"], FileSystemStorage):
+        prefix = default_storage.url("")
+        if request is not None:
+            prefix = request.build_absolute_uri(prefix)
+        return lambda name: prefix + filepath_to_uri(name).lstrip("/")
+
+    def url(name):
+        location = default_storage.url(name)
+        return request.build_absolute_uri(location) if request else location
+
+    return url
+
+
+def get_rendition_urls(renditions, request=None, url=None):
+    """
+    Per-rendition URLs plus a srcset string per format.
+    """
+    url = url or get_media_url_builder(request)
+    renditions = renditions or {}
+    urls = {
+        name: {
+            format_name: url(path)
+            for format_name, path in rendition["formats"].items()
+        }
+        for name, rendition in renditions.items()
+    }
+    srcset = {}
+    for name, rendition in sorted(renditions.items(), key=lambda item: item[1]["width"]):
+        for format_name, location in urls[name].items():
+            srcset.setdefault(format_name, []).append(
+                f"{location} {rendition['width']}w"
+            )
+    return {
+        "renditions": urls,
+        "srcset": {name: ", ".join(entries) for name, entries in srcset.items()},
+    }
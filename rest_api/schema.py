@@ -0,0 +1,161 @@
+import gzip
+import hashlib
+import os
+import threading
+
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+# format suffix of the url: file name, content type
+FORMATS = {
+    ".json": ("swagger.json", "application/json; charset=utf-8"),
+    ".yaml": ("swagger.yaml", "application/yaml; charset=utf-8"),
+}
+
+
+def get_config(key, default):
+    return getattr(settings, "OPENAPI_SCHEMA", {}).get(key, default)
+
+
+def get_path(format):
+    return os.path.join(get_config("DIRECTORY", "openapi"), FORMATS[format][0])
+
+
+def get_api_info():
+    from drf_yasg import openapi
+
+    return openapi.Info(
+        title="Knight Meat Taste API",
+        default_version="v1",
+        description="Testing api endpoints",
+        terms_of_service="https://www.google.com/policies/terms/",
+        contact=openapi.Contact(email="tetobobo1@gmail.com"),
+        license=openapi.License(name="BSD License"),
+    )
+
+
+_schema_view = None
+_schema_view_lock = threading.Lock()
+
+
+def get_schema_view():
+    """
+    drf_yasg's schema view class, imported on first use. Needs API_DOCS.
+    """
+    global _schema_view
+    if _schema_view is None:
+        with _schema_view_lock:
+            if _schema_view is None:
+                from drf_yasg import views
+                from rest_framework import permissions
+
+                _schema_view = views.get_schema_view(
+                    get_api_info(),
+                    public=True,
+                    permission_classes=[permissions.AllowAny],
+                )
+    return _schema_view
+
+
+def render_schema(format, url=None):
+    """
+    The whole schema encoded as `format`, what the live view would return
+    minus the host, which the docs pages take from the page they're on.
+    """
+    from drf_yasg.codecs import OpenAPICodecJson, OpenAPICodecYaml
+
+    generator = get_schema_view().generator_class(get_api_info(), url=url)
+    schema = generator.get_schema(request=None, public=True)
+    codec = {".json": OpenAPICodecJson, ".yaml": OpenAPICodecYaml}[format]
+    return codec(validators=[]).encode(schema)
+
+
+def load_artifact(format):
+    path = get_path(format)
+    try:
+        with open(path, "rb") as file:
+            body = file.read()
+    except FileNotFoundError:
+        return None
+    return {
+        "etag": quote_etag(hashlib.sha256(body).hexdigest()[:32]),
+        "last_modified": int(os.path.getmtime(path)),
+        "body": body,
+        "gzip": gzip.compress(body, 9),
+    }
+
+
+# read once per process, a new schema comes with a deploy and so a restart
+_artifacts = {}
+_artifacts_lock = threading.Lock()
+
+
+def get_artifact(format):
+    if format not in _artifacts:
+        with _artifacts_lock:
+            if format not in _artifacts:
+                _artifacts[format] = load_artifact(format)
+    return _artifacts[format]
+
+
+_live_view = None
+
+
+def live_view(request, format):
+    global _live_view
+    if _live_view is None:
+        _live_view = get_schema_view().without_ui(cache_timeout=0)
+    return _live_view(request, format=format)
+
+
+def schema_file(request, format):
+    """
+    The schema written by `manage.py build_openapi_schema`, from memory and
+    cacheable by browsers and proxies for MAX_AGE seconds. With DEBUG the
+    schema is generated on each request instead, so it follows the code.
+    """
+    if settings.DEBUG and settings.API_DOCS:
+        return live_view(request, format)
+
+    artifact = get_artifact(format)
+    if artifact is None:
+        return JsonResponse(
+            {"message": "The API schema hasn't been built."}, status=404
+        )
+
+    etag, last_modified = artifact["etag"], artifact["last_modified"]
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified
+    )
+    if response is None:
+        content_type = FORMATS[format][1]
+        if "gzip" in request.headers.get("Accept-Encoding", ""):
+            response = HttpResponse(artifact["gzip"], content_type=content_type)
+            response["Content-Encoding"] = "gzip"
+        else:
+            response = HttpResponse(artifact["body"], content_type=content_type)
+
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    response["Cache-Control"] = f"public, max-age={get_config('MAX_AGE', 86400)}"
+    response["Vary"] = "Accept-Encoding"
+    return response
+
+
+def schema_ui(renderer):
+    """
+    The swagger or redoc page. It loads the schema from schema_file(), see
+    SPEC_URL in SWAGGER_SETTINGS, and only renders the page itself, so it
+    is cached server side outside DEBUG. `?format=openapi`, which would
+    generate the schema, isn't served. Needs API_DOCS.
+    """
+    from drf_yasg.renderers import ReDocRenderer, SwaggerUIRenderer
+
+    renderer_class = {"swagger": SwaggerUIRenderer, "redoc": ReDocRenderer}[renderer]
+    return get_schema_view().as_cached_view(
+        0 if settings.DEBUG else get_config("MAX_AGE", 86400),
+        renderer_classes=(renderer_class,),
+    )
@@ -0,0 +1,244 @@
+import logging
+import re
+import threading
+import time
+import unicodedata
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+from knight_meat_tatse.cache import get_namespace
+
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = "rest_api:dish-search-version"
+
+TOKEN = re.compile(r"\w+")
+
+
+def get_config(key, default):
+    return getattr(settings, "DISH_SEARCH", {}).get(key, default)
+
+
+def normalize(text):
+    """
+    Lowercase without accents, "Crème Brûlée" -> "creme brulee".
+    """
+    text = unicodedata.normalize("NFKD", text.lower())
+    return "".join(char for char in text if not unicodedata.combining(char))
+
+
+def tokenize(text):
+    return TOKEN.findall(normalize(text))
+
+
+def search_dish_ids(query, limit=20):
+    """
+    Ids of the dishes whose name contains every word of `query` (the last one
+    as a prefix), best match first.
+    """
+    tokens = tokenize(query)
+    if not tokens:
+        return []
+
+    if connection.vendor == "sqlite":
+        # "beef" "bur"*, every token quoted so FTS5 syntax in user input is inert
+        match = " ".join(f'"{token}"' for token in tokens[:-1])
+        match = f'{match} "{tokens[-1]}"*'.strip()
+        sql = (
+            "SELECT rowid FROM rest_api_dish_fts WHERE rest_api_dish_fts MATCH %s "
+            "ORDER BY bm25(rest_api_dish_fts), rowid LIMIT %s"
+        )
+        params = [match, limit]
+    elif connection.vendor == "postgresql":
+        tsquery = " & ".join(tokens[:-1] + [f"{tokens[-1]}:*"])
+        sql = (
+            "SELECT id FROM rest_api_dish "
+            "WHERE to_tsvector('simple', name) @@ to_tsquery('simple', %s) "
+            "ORDER BY ts_rank(to_tsvector('simple', name), to_tsquery('simple', %s)) DESC, "
+            "id LIMIT %s"
+        )
+        params = [tsquery, tsquery, limit]
+    else:
+        from rest_api.models import Dish
+
+        dishes = Dish.objects.all()
+        for token in tokens:
+            dishes = dishes.filter(name__icontains=token)
+        return list(dishes.order_by("id").values_list("id", flat=True)[:limit])
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search_dishes(query, columns, limit=20):
+    """
+    `values(*columns)` rows of the matching dishes in rank order, two queries
+    on a miss of the dish-search cache.
+    """
+    from rest_api.models import Dish
+
+    def find():
+        ids = search_dish_ids(query, limit)
+        rows = {row["id"]: row for row in Dish.objects.filter(id__in=ids).values(*columns)}
+        return [rows[pk] for pk in ids if pk in rows]
+
+    tokens = tokenize(query)
+    if not tokens:
+        return []
+    key = f"{' '.join(tokens)}|{','.join(columns)}|{limit}"
+    return get_namespace("dish-search").get_or_set(key, find)
+
+
+class TrieNode:
+    __slots__ = ("children", "entries")
+
+    def __init__(self):
+        self.children = {}
+        self.entries = []
+
+
+class PrefixIndex:
+    """
+    Per-worker trie for autocomplete. Every word start of a dish name is a
+    key ("beef burger" and "burger"), and every node keeps its best `limit`
+    entries so a lookup is one walk down the query. Nodes at `max_depth`
+    keep all their entries and longer queries are filtered from those.
+
+    It is rebuilt in the background when a dish change bumped the version in
+    django's cache, checked at most every `refresh_interval` seconds.
+    """
+
+    def __init__(self, limit=10, max_depth=12, refresh_interval=1):
+        self.limit = limit
+        self.max_depth = max_depth
+        self.refresh_interval = refresh_interval
+        self.lock = threading.Lock()
+        self.root = None
+        self.version = None
+        self.last_check = 0.0
+        self.rebuilding = False
+        self.size = 0
+
+    @staticmethod
+    def rank(name, is_start):
+        # names starting with the query first, then shorter names
+        return (not is_start, len(name), name.lower())
+
+    def build(self, dishes):
+        entries = []
+        for pk, name in dishes:
+            words = tokenize(name)
+            for position in range(len(words)):
+                key = " ".join(words[position:])
+                entries.append((self.rank(name, position == 0), pk, name, key))
+        entries.sort()
+
+        root = TrieNode()
+        # a dish can reach a node through several words, above max_depth
+        # only its best key is kept, at max_depth all of them for filtering
+        seen = set()
+        for entry in entries:
+            node = root
+            for depth, char in enumerate(entry[3][: self.max_depth], 1):
+                child = node.children.get(char)
+                if child is None:
+                    child = node.children[char] = TrieNode()
+                node = child
+                if depth == self.max_depth:
+                    node.entries.append(entry)
+                elif len(node.entries) < self.limit and (id(node), entry[1]) not in seen:
+                    seen.add((id(node), entry[1]))
+                    node.entries.append(entry)
+        return root, len(dishes)
+
+    def load(self):
+        from rest_api.models import Dish
+
+        return self.build(list(Dish.objects.values_list("id", "name").iterator()))
+
+    def rebuild(self, version):
+        try:
+            root, size = self.load()
+            with self.lock:
+                self.root, self.size, self.version = root, size, version
+        except Exception:
+            logger.exception("Rebuilding the dish prefix index failed")
+        finally:
+            self.rebuilding = False
+            connection.close()
+
+    def sync(self):
+        now = time.monotonic()
+        if self.root is not None and now - self.last_check < self.refresh_interval:
+            return
+        with self.lock:
+            if self.root is not None and now - self.last_check < self.refresh_interval:
+                return
+            self.last_check = now
+            version = cache.get(VERSION_KEY)
+            if self.root is None:
+                self.root, self.size = self.load()
+                self.version = version
+            elif version != self.version and not self.rebuilding:
+                # keep answering from the current trie while the new one is built
+                self.rebuilding = True
+                threading.Thread(target=self.rebuild, args=(version,), daemon=True).start()
+
+    def complete(self, query, limit=None):
+        """
+        [(id, name)] of the best dishes with a word starting with `query`.
+        """
+        self.sync()
+        limit = min(limit or self.limit, self.limit)
+        prefix = " ".join(tokenize(query))
+        if not prefix:
+            return []
+        if query[-1:].isspace():
+            prefix += " "
+
+        node = self.root
+        for char in prefix[: self.max_depth]:
+            node = node.children.get(char)
+            if node is None:
+                return []
+
+        results = {}
+        for _, pk, name, key in node.entries:
+            if pk not in results and key.startswith(prefix):
+                results[pk] = name
+                if len(results) == limit:
+                    break
+        return list(results.items())
+
+    def stats(self):
+        return {"dishes": self.size, "version": self.version}
+
+
+def invalidate_search_results():
+    get_namespace("dish-search").invalidate()
+
+
+def bump_search_version():
+    cache.set(VERSION_KEY, time.time_ns(), None)
+    invalidate_search_results()
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_prefix_index():
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = PrefixIndex(
+                    limit=get_config("AUTOCOMPLETE_LIMIT", 10),
+                    max_depth=get_config("MAX_PREFIX_LENGTH", 12),
+                    refresh_interval=get_config("REFRESH_INTERVAL", 1),
+                )
+    return _index
@@ -0,0 +1,58 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from rest_api.feed import publish_order_event
+from rest_api.menu import schedule_menu_rebuild
+from rest_api.models import Dish, Order
+from rest_api.renditions import schedule_dish_renditions
+from rest_api.search import bump_search_version
+
+
+@receiver(post_save, sender=Dish)
+def render_dish_image(sender, instance, **kwargs):
+    if instance.image and instance.renditions_source != instance.image.name:
+        schedule_dish_renditions(instance.pk)
+
+
+@receiver(post_save, sender=Dish)
+@receiver(post_delete, sender=Dish)
+def rebuild_menu_snapshot(sender, **kwargs):
+    schedule_menu_rebuild()
+
+
+@receiver(post_save, sender=Dish)
+@receiver(post_delete, sender=Dish)
+def refresh_prefix_index(sender, **kwargs):
+    # the FTS index follows through database triggers, the per-worker tries don't
+    bump_search_version()
+
+
+def get_order_data(order, lines=None):
+    from rest_api.serializers import OrderLineSerializer, OrderSerializer
+
+    data = OrderSerializer(order).data
+    data["user"] = order.user_id
+    if lines is not None:
+        data["lines"] = OrderLineSerializer(lines, many=True).data
+    return data
+
+
+@receiver(post_save, sender=Order)
+def publish_order_change(sender, instance, created, **kwargs):
+    if created:
+        # built at commit time, when the lines have been written too.
+        # CreateOrderSerializer hands them over, orders saved elsewhere query them
+        publish_order_event(
+            "order.created",
+            lambda: get_order_data(
+                instance,
+                getattr(instance, "created_lines", None) or instance.lines.all(),
+            ),
+        )
+    else:
+        previous = getattr(instance, "_loaded_status", None)
+        if previous is not None and previous != instance.status:
+            data = get_order_data(instance)
+            data["previous_status"] = previous
+            publish_order_event("order.status_changed", data)
+    instance._loaded_status = instance.status
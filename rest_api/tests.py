@@ -1,3 +1,873 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import psycopg2
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.core.management import CommandError, call_command
+from django.core.files.storage import default_storage
+from django.db import OperationalError, connection
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from knight_meat_tatse.cache import CacheNamespace, get_local_cache
+from knight_meat_tatse.db import router
+from knight_meat_tatse.db.postgresql import base as postgresql
+from knight_meat_tatse.db.sqlite3 import base as sqlite3
+from knight_meat_tatse.docs import OpenAPIPlaceholders, skip_schema
+from rest_api import feed, menu, renditions, schema
+from rest_api.idempotency import IdempotencyMiddleware
+from rest_api.maintenance import delete_superseded_renditions
+from rest_api.management.commands.bench_startup import parse_import_times
+from rest_api.models import Dish, IdempotencyKey, Order, OrderEvent, OrderLine
+from rest_api.search import PrefixIndex, search_dish_ids
+from rest_api.serializers import CreateOrderSerializer, DishSerializer
+from users.maintenance import JOBS, delete_unverified_accounts
+from users.models import User
+from users.tokens import IndexedRefreshToken
+from users.tests import MediaTestCase, assert_off_the_event_loop, make_jpeg
+
+
+def make_user(email="jane@example.com", **fields):
+    fields.setdefault("is_verfied", True)
+    return User.objects.create_user(email=email, password=None, **fields)
+
+
+def make_dish(name="Steak", price=12, **fields):
+    if "image" not in fields:
+        fields["image"] = default_storage.save(
+            "dishes/steak.jpg", ContentFile(make_jpeg())
+        )
+    return Dish.objects.create(name=name, price=price, **fields)
+
+
+def age_file(name, seconds=7200):
+    modified = time.time() - seconds
+    os.utime(default_storage.path(name), (modified, modified))
+
+
+class MaintenanceTests(TestCase):
+    def test_keeps_unverified_customers_with_orders(self):
+        customer = make_user("customer@example.com", is_verfied=False)
+        Order.objects.create(user=customer)
+        User.objects.filter(pk=customer.pk).update(
+            date_joined=timezone.now() - timedelta(days=30)
+        )
+
+        self.assertEqual(delete_unverified_accounts(), (0, 0))
+        self.assertTrue(Order.objects.filter(user=customer).exists())
+
+    def test_rest_api_jobs_are_registered(self):
+        IdempotencyKey.objects.create(
+            digest="a" * 64, fingerprint="b" * 64, expires_at=timezone.now()
+        )
+        _, delete_expired_idempotency_keys = JOBS["delete_expired_idempotency_keys"]
+
+        self.assertEqual(delete_expired_idempotency_keys(), (1, 0))
+        self.assertIn("delete_old_order_events", JOBS)
+
+
+class DishRenditionTests(MediaTestCase):
+    def test_renders_each_rendition_once_per_image(self):
+        dish = make_dish()
+
+        self.assertTrue(renditions.generate_dish_renditions(dish.pk))
+        self.assertFalse(renditions.generate_dish_renditions(dish.pk))
+
+        dish.refresh_from_db()
+        self.assertEqual(dish.renditions_source, dish.image.name)
+        # never upscaled past the 300px source
+        self.assertEqual(dish.renditions["retina"]["width"], 300)
+        for rendition in dish.renditions.values():
+            for name in rendition["formats"].values():
+                self.assertTrue(default_storage.exists(name))
+
+    @mock.patch("rest_api.renditions.connection")
+    def test_logs_failures(self, connection):
+        dish = make_dish()
+        default_storage.delete(dish.image.name)
+
+        with self.assertLogs("rest_api.renditions", "ERROR") as logs:
+            renditions.run_in_background(dish.pk)
+
+        self.assertIn(f"dish {dish.pk} failed", logs.output[0])
+        self.assertIn("Traceback", logs.output[0])
+        connection.close.assert_called_once()
+
+    def test_serializer_builds_the_urls_once_per_dish(self):
+        dish = make_dish()
+        renditions.generate_dish_renditions(dish.pk)
+        dish.refresh_from_db()
+
+        with mock.patch(
+            "rest_api.serializers.get_rendition_urls", wraps=renditions.get_rendition_urls
+        ) as get_rendition_urls:
+            data = DishSerializer([dish, dish], many=True).data
+
+        self.assertEqual(get_rendition_urls.call_count, 2)
+        self.assertEqual(set(data[0]["renditions"]), set(renditions.RENDITIONS))
+        self.assertIn("thumbnail-", data[0]["srcset"]["jpeg"])
+
+    def test_deletes_superseded_renditions(self):
+        dish = make_dish()
+        renditions.generate_dish_renditions(dish.pk)
+        dish.refresh_from_db()
+        current = dish.renditions["thumbnail"]["formats"]["jpeg"]
+        superseded = default_storage.save(
+            f"{renditions.RENDITION_DIR}/thumbnail-old.jpg", ContentFile(b"old")
+        )
+        fresh = default_storage.save(
+            f"{renditions.RENDITION_DIR}/thumbnail-new.jpg", ContentFile(b"new")
+        )
+        age_file(current)
+        age_file(superseded)
+
+        self.assertEqual(delete_superseded_renditions(), (1, 3))
+        self.assertTrue(default_storage.exists(current))
+        self.assertTrue(default_storage.exists(fresh))
+        self.assertFalse(default_storage.exists(superseded))
+
+    def test_superseded_renditions_without_directory(self):
+        self.assertEqual(delete_superseded_renditions(), (0, 0))
+
+
+class DishListTests(TestCase):
+    def setUp(self):
+        Dish.objects.bulk_create(
+            Dish(name=f"Dish {number}", price=number, image=f"dishes/{number}.jpg")
+            for number in range(5)
+        )
+
+    def test_pages_through_every_dish_once(self):
+        names = []
+        url = "/api/dishes/?limit=2"
+        while url:
+            with self.assertNumQueries(1):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            names += [dish["name"] for dish in response.data["results"]]
+            url = response.data["next"]
+
+        self.assertEqual(names, [f"Dish {number}" for number in range(5)])
+
+    def test_rows_render_like_the_serializer(self):
+        response = self.client.get("/api/dishes/")
+
+        expected = DishSerializer(
+            Dish.objects.order_by("id"),
+            many=True,
+            context={"request": response.wsgi_request},
+        ).data
+        self.assertEqual(response.data["results"], expected)
+
+    def test_returns_the_requested_fields(self):
+        response = self.client.get("/api/dishes/?fields=name,price")
+
+        self.assertEqual(response.data["results"][0], {"name": "Dish 0", "price": 0})
+
+    def test_rejects_unknown_fields(self):
+        response = self.client.get("/api/dishes/?fields=name,secret")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["fields"], ["Unknown field: secret."])
+
+
+class MenuTests(TestCase):
+    def setUp(self):
+        menu.get_cache().clear()
+        Dish.objects.bulk_create(
+            Dish(name=name, price=10, image=f"dishes/{name}.jpg")
+            for name in ("Soup", "Stew")
+        )
+
+    def test_serves_the_cached_snapshot_without_queries(self):
+        self.client.get("/api/menu/")
+
+        with self.assertNumQueries(0):
+            response = self.client.get("/api/menu/")
+
+        self.assertEqual(
+            [dish["name"] for dish in response.json()["dishes"]], ["Soup", "Stew"]
+        )
+        self.assertEqual(response["Cache-Control"], "public, no-cache")
+
+    def test_revalidates_with_the_etag(self):
+        etag = self.client.get("/api/menu/")["ETag"]
+
+        response = self.client.get("/api/menu/", HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+
+    def test_serves_the_compressed_body(self):
+        response = self.client.get("/api/menu/", HTTP_ACCEPT_ENCODING="gzip, br")
+
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(response.content, menu.get_menu()["gzip"])
+
+    def test_rebuild_picks_up_changes(self):
+        version = menu.get_menu()["version"]
+        Dish.objects.filter(name="Soup").update(name="Broth")
+
+        snapshot = menu.rebuild_menu()
+
+        self.assertGreater(snapshot["version"], version)
+        self.assertIn(b"Broth", menu.get_menu()["body"])
+
+    @mock.patch("rest_api.menu.connection")
+    @mock.patch("rest_api.menu.rebuild_menu", side_effect=RuntimeError("cache down"))
+    def test_logs_failed_rebuilds(self, rebuild_menu, connection):
+        with self.assertLogs("rest_api.menu", "ERROR") as logs:
+            menu.rebuild_in_background()
+
+        self.assertIn("RuntimeError: cache down", logs.output[0])
+        connection.close.assert_called_once()
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.dishes = {
+            name: Dish.objects.create(name=name, price=10, image="dishes/dish.jpg").pk
+            for name in ("Beef Burger", "Burger Royale", "Crème Brûlée", "Beef Stew")
+        }
+
+    def test_matches_every_word_and_the_last_as_a_prefix(self):
+        self.assertEqual(search_dish_ids("beef bur"), [self.dishes["Beef Burger"]])
+        self.assertEqual(
+            set(search_dish_ids("burg")),
+            {self.dishes["Beef Burger"], self.dishes["Burger Royale"]},
+        )
+
+    def test_ignores_accents_and_query_syntax(self):
+        self.assertEqual(search_dish_ids("creme brul"), [self.dishes["Crème Brûlée"]])
+        self.assertEqual(search_dish_ids('beef" OR "stew'), [])
+        self.assertEqual(search_dish_ids("  "), [])
+
+    def test_search_view_returns_the_requested_fields(self):
+        response = self.client.get("/api/dishes/search/?q=stew&fields=id,name")
+
+        self.assertEqual(
+            response.data["results"],
+            [{"id": self.dishes["Beef Stew"], "name": "Beef Stew"}],
+        )
+
+    def test_autocomplete_suggests_dishes_by_any_word(self):
+        index = PrefixIndex(limit=3)
+
+        self.assertEqual(
+            index.complete("bur"),
+            [
+                (self.dishes["Burger Royale"], "Burger Royale"),
+                (self.dishes["Beef Burger"], "Beef Burger"),
+            ],
+        )
+        self.assertEqual(
+            index.complete("beef b"), [(self.dishes["Beef Burger"], "Beef Burger")]
+        )
+        self.assertEqual(index.complete("pizza"), [])
+
+    @mock.patch("rest_api.search.connection")
+    def test_logs_failed_rebuilds(self, connection):
+        index = PrefixIndex()
+        index.rebuilding = True
+
+        with mock.patch.object(index, "load", side_effect=RuntimeError("database down")):
+            with self.assertLogs("rest_api.search", "ERROR") as logs:
+                index.rebuild(1)
+
+        self.assertIn("RuntimeError: database down", logs.output[0])
+        self.assertFalse(index.rebuilding)
+        self.assertIsNone(index.root)
+
+
+class CreateOrderTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.soup = Dish.objects.create(name="Soup", price=5, image="dishes/soup.jpg")
+        self.stew = Dish.objects.create(name="Stew", price=12, image="dishes/stew.jpg")
+
+    def test_places_the_order_at_the_current_prices(self):
+        lines = [
+            {"dish": self.soup.pk, "quantity": 2},
+            {"dish": self.stew.pk},
+            {"dish": self.soup.pk, "quantity": 1},
+        ]
+        # dish lookup, savepoint, order, lines in one INSERT, release
+        with self.assertNumQueries(5):
+            response = self.client.post("/api/orders/", {"lines": lines}, format="json")
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["order"]["total"], 27)
+        self.assertEqual(response.data["order"]["status_display"], "Pending")
+        order = Order.objects.get(user=self.user)
+        self.assertEqual(
+            sorted(order.lines.values_list("name", "unit_price", "quantity")),
+            [("Soup", 5, 3), ("Stew", 12, 1)],
+        )
+
+        Dish.objects.filter(pk=self.soup.pk).update(price=50)
+        self.assertEqual(OrderLine.objects.get(name="Soup").unit_price, 5)
+
+    def test_refuses_unknown_dishes(self):
+        response = self.client.post(
+            "/api/orders/", {"lines": [{"dish": 999}]}, format="json"
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["lines"], ["Unknown dish ids: 999."])
+        self.assertFalse(Order.objects.exists())
+
+    def test_refuses_empty_and_oversized_orders(self):
+        too_many = [{"dish": self.soup.pk}] * (CreateOrderSerializer.MAX_LINES + 1)
+        for lines in ([], too_many):
+            response = self.client.post("/api/orders/", {"lines": lines}, format="json")
+            self.assertEqual(response.status_code, 400)
+
+    def test_needs_a_user(self):
+        response = APIClient().post(
+            "/api/orders/", {"lines": [{"dish": self.soup.pk}]}, format="json"
+        )
+
+        self.assertEqual(response.status_code, 401)
+
+
+class IdempotencyTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user()
+        self.client = self.client_for(self.user)
+        self.dish = Dish.objects.create(name="Soup", price=5, image="dishes/soup.jpg")
+        self.order = {"lines": [{"dish": self.dish.pk}]}
+
+    def client_for(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user)}")
+        return client
+
+    def post(self, client, data, key="order-1"):
+        return client.post(
+            "/api/orders/", data, format="json", HTTP_IDEMPOTENCY_KEY=key
+        )
+
+    def test_replays_retries_without_placing_the_order_again(self):
+        first = self.post(self.client, self.order)
+        retry = self.post(self.client, self.order)
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.content, first.content)
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_keys_are_scoped_to_the_user(self):
+        self.post(self.client, self.order)
+        response = self.post(self.client_for(make_user("joe@example.com")), self.order)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(response.has_header("Idempotent-Replayed"))
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_refuses_a_key_reused_for_another_body(self):
+        self.post(self.client, self.order)
+        response = self.post(
+            self.client, {"lines": [{"dish": self.dish.pk, "quantity": 2}]}
+        )
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_refuses_overlong_keys(self):
+        response = self.post(self.client, self.order, key="k" * 256)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_server_errors_are_not_stored(self):
+        middleware = IdempotencyMiddleware(lambda request: HttpResponse(status=503))
+        request = RequestFactory().post(
+            "/api/orders/", b"{}", "application/json", HTTP_IDEMPOTENCY_KEY="order-1"
+        )
+
+        self.assertEqual(middleware(request).status_code, 503)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    @override_settings(IDEMPOTENCY={"PATHS": ("/api/orders/",), "WAIT": 0})
+    def test_duplicates_of_a_running_request_get_a_conflict(self):
+        request = RequestFactory().post(
+            "/api/orders/", b"{}", "application/json", HTTP_IDEMPOTENCY_KEY="order-1"
+        )
+        middleware = IdempotencyMiddleware(lambda request: HttpResponse(status=201))
+        middleware.claim(*middleware.check(request))
+
+        self.assertEqual(middleware(request).status_code, 409)
+
+    @override_settings(IDEMPOTENCY={"PATHS": ("/api/orders/",), "LOCK_TIMEOUT": 60})
+    def test_takes_over_abandoned_keys(self):
+        request = RequestFactory().post(
+            "/api/orders/", b"{}", "application/json", HTTP_IDEMPOTENCY_KEY="order-1"
+        )
+        middleware = IdempotencyMiddleware(lambda request: HttpResponse(status=201))
+        middleware.claim(*middleware.check(request))
+        IdempotencyKey.objects.update(locked_at=timezone.now() - timedelta(minutes=5))
+
+        self.assertEqual(middleware(request).status_code, 201)
+        self.assertEqual(IdempotencyKey.objects.get().status_code, 201)
+
+
+class FakeHistoryBackend(feed.LocalBackend):
+    def __init__(self, history):
+        super().__init__()
+        self.events = history
+        self.positions = []
+
+    def history(self, last_id, limit):
+        return [event for event in self.events if event.id > last_id]
+
+    def subscribers_changed(self, count, last_id=None):
+        self.positions.append((count, last_id))
+
+
+class OrderFeedTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.events = []
+        # polling=True keeps subscribers_changed from starting the poller thread
+        self.backend = feed.DatabaseBackend(overlap=10)
+        self.backend.attach(self.events.append)
+        self.backend.polling = True
+
+    def create_event(self, **fields):
+        return OrderEvent.objects.create(type="order.created", data={}, **fields).pk
+
+    def test_polls_events_committed_out_of_order_once(self):
+        first = self.create_event()
+        self.backend.subscribers_changed(1, first - 1)
+        third = self.create_event(id=first + 2)
+        self.backend.poll_once()
+
+        # the transaction holding the id in between commits late
+        second = self.create_event(id=first + 1)
+        self.backend.poll_once()
+        self.backend.poll_once()
+
+        self.assertEqual([event.id for event in self.events], [first, third, second])
+
+    def test_polling_starts_where_the_history_ended(self):
+        first = self.create_event()
+        history = self.backend.history(0, 100)
+        # published between the history fetch and the first poll
+        second = self.create_event()
+
+        self.backend.subscribers_changed(1, history[-1].id)
+        self.backend.poll_once()
+
+        self.assertEqual([event.id for event in history], [first])
+        self.assertEqual([event.id for event in self.events], [second])
+
+    def test_polling_without_a_position_starts_with_the_next_event(self):
+        self.create_event()
+        self.backend.subscribers_changed(1)
+        self.backend.poll_once()
+        second = self.create_event()
+        self.backend.poll_once()
+
+        self.assertEqual([event.id for event in self.events], [second])
+
+    def test_history_too_far_behind_needs_a_reset(self):
+        for _ in range(3):
+            self.create_event()
+
+        self.assertIsNone(self.backend.history(0, 2))
+
+    @mock.patch("rest_api.feed.connection")
+    def test_logs_failed_polls(self, connection):
+        self.backend.subscribers = 1
+        with mock.patch.object(
+            self.backend, "poll_once", side_effect=RuntimeError("database down")
+        ):
+            with self.assertLogs("rest_api.feed", "ERROR") as logs:
+                self.backend.poll()
+
+        self.assertIn("RuntimeError: database down", logs.output[0])
+        self.assertFalse(self.backend.polling)
+
+    def test_subscribers_skip_live_repeats_of_missed_events(self):
+        backend = FakeHistoryBackend([feed.Event(4, "a", {}), feed.Event(5, "b", {})])
+        broker = feed.Broker(backend, buffer_size=10)
+
+        async def receive():
+            subscriber = await broker.subscribe(last_id=3)
+            broker.dispatch(feed.Event(5, "b", {}))
+            broker.dispatch(feed.Event(6, "c", {}))
+            await asyncio.sleep(0)
+            queue = subscriber.queue
+            return [queue.get_nowait().id for _ in range(queue.qsize())]
+
+        self.assertEqual(asyncio.run(receive()), [4, 5, 6])
+        self.assertEqual(backend.positions, [(1, 5)])
+
+    def token_for(self, user_type):
+        user = make_user(f"type{user_type}@example.com", user_type=user_type)
+        return IndexedRefreshToken.for_user(user).access_token
+
+    async def test_feed_is_for_cashiers(self):
+        customer = await sync_to_async(self.token_for)(1)
+        cashier = await sync_to_async(self.token_for)(2)
+
+        response = await self.async_client.get(
+            "/api/orders/feed/", HTTP_AUTHORIZATION=f"Bearer {customer}"
+        )
+        self.assertEqual(response.status_code, 403)
+
+        response = await self.async_client.get(f"/api/orders/feed/?token={cashier}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+
+    async def test_authenticates_off_the_event_loop(self):
+        def authenticate(raw_token):
+            with self.assertRaises(RuntimeError):
+                asyncio.get_running_loop()
+
+        with mock.patch("rest_api.feed.authenticate", side_effect=authenticate) as mocked:
+            response = await self.async_client.get("/api/orders/feed/?token=x")
+
+        self.assertEqual(response.status_code, 403)
+        mocked.assert_called_once_with("x")
+
+    def test_feed_is_not_served_over_wsgi(self):
+        cashier = self.token_for(2)
+
+        response = self.client.get(f"/api/orders/feed/?token={cashier}")
+
+        self.assertEqual(response.status_code, 501)
+        self.assertFalse(response.streaming)
+
+
+class FakeConnection:
+    def __init__(self, usable=True):
+        self.closed = False
+        self.usable = usable
+
+    def close(self):
+        self.closed = True
+
+    def cursor(self):
+        if not self.usable:
+            raise psycopg2.OperationalError("server closed the connection")
+        return mock.MagicMock()
+
+
+class ConnectionPoolTests(TestCase):
+    def test_hands_out_the_most_recently_returned_connection(self):
+        pool = postgresql.ConnectionPool(max_size=2)
+        first, second = pool.acquire(FakeConnection), pool.acquire(FakeConnection)
+        pool.release(first)
+        pool.release(second)
+
+        self.assertIs(pool.acquire(FakeConnection), second)
+
+    def test_waits_at_most_timeout_for_a_free_connection(self):
+        pool = postgresql.ConnectionPool(max_size=1, timeout=0.01)
+        pool.acquire(FakeConnection)
+
+        with self.assertRaises(OperationalError):
+            pool.acquire(FakeConnection)
+
+    def test_replaces_idle_connections_that_fail_the_ping(self):
+        pool = postgresql.ConnectionPool(max_size=1, check_after=0)
+        broken = pool.acquire(lambda: FakeConnection(usable=False))
+        pool.release(broken)
+
+        connection = pool.acquire(FakeConnection)
+
+        self.assertIsNot(connection, broken)
+        self.assertTrue(broken.closed)
+
+    def test_discarded_connections_free_their_slot(self):
+        pool = postgresql.ConnectionPool(max_size=1, timeout=0.01)
+        connection = pool.acquire(FakeConnection)
+        pool.release(connection, discard=True)
+
+        self.assertTrue(connection.closed)
+        self.assertIsNot(pool.acquire(FakeConnection), connection)
+
+    def test_pooling_needs_conn_max_age_zero(self):
+        wrapper = postgresql.DatabaseWrapper(
+            {**connection.settings_dict, "CONN_MAX_AGE": 60, "OPTIONS": {"pool": True}}
+        )
+
+        with self.assertRaises(ImproperlyConfigured):
+            wrapper.pool
+
+
+class TunedSQLiteTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.wrapper = sqlite3.DatabaseWrapper(
+            {**connection.settings_dict, "NAME": os.path.join(directory, "db.sqlite3")}
+        )
+        self.addCleanup(self.wrapper.close)
+
+    def pragma(self, name):
+        with self.wrapper.cursor() as cursor:
+            cursor.execute(f"PRAGMA {name}")
+            return cursor.fetchone()[0]
+
+    def test_runs_the_init_command_on_new_connections(self):
+        self.assertEqual(self.pragma("journal_mode"), "wal")
+        self.assertEqual(self.pragma("synchronous"), 1)
+        self.assertEqual(self.pragma("temp_store"), 2)
+
+    def test_transactions_take_the_write_lock_up_front(self):
+        statements = []
+        self.wrapper.ensure_connection()
+
+        with self.wrapper.execute_wrapper(
+            lambda execute, sql, *args: statements.append(sql) or execute(sql, *args)
+        ):
+            self.wrapper._start_transaction_under_autocommit()
+        self.wrapper.connection.rollback()
+
+        self.assertEqual(statements, ["BEGIN IMMEDIATE"])
+
+
+@mock.patch("knight_meat_tatse.db.router.get_replicas", lambda: ["replica"])
+class ReplicaRoutingTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.reads = []
+
+    def middleware(self, write=False):
+        def get_response(request):
+            self.reads.append(router.ReplicaRouter().db_for_read(Dish))
+            if write:
+                router.ReplicaRouter().db_for_write(Dish)
+            return HttpResponse()
+
+        middleware = router.ReplicaPinningMiddleware(get_response)
+        middleware.get_token_user_id = lambda request: "7"
+        return middleware
+
+    def test_reads_outside_requests_go_to_the_primary(self):
+        self.assertEqual(router.ReplicaRouter().db_for_read(Dish), "default")
+
+    def test_pins_the_user_to_the_primary_after_a_write(self):
+        request = RequestFactory().get("/api/menu/")
+
+        self.middleware(write=True)(request)
+        self.middleware()(request)
+
+        self.assertEqual(self.reads, ["replica", "default"])
+
+    def test_primary_paths_read_from_the_primary(self):
+        self.middleware()(RequestFactory().get("/admin/"))
+
+        self.assertEqual(self.reads, ["default"])
+
+    def test_use_primary_overrides_the_replica(self):
+        def get_response(request):
+            with router.use_primary():
+                self.reads.append(router.ReplicaRouter().db_for_read(Dish))
+            return HttpResponse()
+
+        router.ReplicaPinningMiddleware(get_response)(RequestFactory().get("/"))
+
+        self.assertEqual(self.reads, ["default"])
+
+    async def test_async_requests_read_the_pin_off_the_event_loop(self):
+        async def get_response(request):
+            self.reads.append(router.ReplicaRouter().db_for_read(Dish))
+            router.ReplicaRouter().db_for_write(Dish)
+            return HttpResponse()
+
+        middleware = router.ReplicaPinningMiddleware(get_response)
+        middleware.get_token_user_id = lambda request: "7"
+        middleware.cache = mock.Mock(wraps=cache)
+        middleware.cache.get.side_effect = assert_off_the_event_loop(cache.get)
+        middleware.cache.set.side_effect = assert_off_the_event_loop(cache.set)
+
+        for _ in range(2):
+            await middleware(RequestFactory().get("/api/menu/"))
+
+        self.assertEqual(self.reads, ["replica", "default"])
+
+
+class CacheNamespaceTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        get_local_cache().clear()
+        self.namespace = CacheNamespace("test", local_timeout=60, wait=1)
+
+    def test_builds_a_missing_value_once(self):
+        build = mock.Mock(return_value={"name": "Soup"})
+
+        for _ in range(3):
+            self.assertEqual(self.namespace.get_or_set("soup", build), {"name": "Soup"})
+
+        build.assert_called_once()
+        self.assertEqual(self.namespace.stats()["misses"], 1)
+        self.assertEqual(self.namespace.stats()["local_hits"], 2)
+
+    def test_invalidate_drops_every_key(self):
+        self.namespace.set("soup", 1)
+        self.namespace.invalidate()
+
+        self.assertIsNone(self.namespace.get("soup"))
+
+    def test_hashes_keys_memcached_would_refuse(self):
+        key = self.namespace.make_key("beef burger " * 30)
+
+        self.assertNotIn(" ", key)
+        self.assertLess(len(key), 250)
+
+    def test_waits_for_another_process_without_blocking_other_keys(self):
+        # one stripe, so both keys share it
+        self.namespace.build_locks = [threading.Lock()]
+        cache.set(f"{self.namespace.make_key('soup')}:lock", "other process", 10)
+        results = []
+
+        def wait():
+            results.append(self.namespace.get_or_set("soup", lambda: "mine"))
+
+        waiter = threading.Thread(target=wait)
+        waiter.start()
+        self.addCleanup(waiter.join)
+        time.sleep(0.1)
+
+        started = time.monotonic()
+        self.assertEqual(self.namespace.get_or_set("stew", lambda: "stew"), "stew")
+        self.assertLess(time.monotonic() - started, 0.5)
+
+        cache.set(self.namespace.make_key("soup"), "theirs")
+        waiter.join()
+        self.assertEqual(results, ["theirs"])
+        self.assertEqual(self.namespace.stats()["waits"], 1)
+
+    def test_builds_itself_when_the_other_process_gives_up(self):
+        self.namespace.wait = 0
+        cache.set(f"{self.namespace.make_key('soup')}:lock", "other process", 10)
+
+        self.assertEqual(self.namespace.get_or_set("soup", lambda: "mine"), "mine")
+
+
+class SchemaTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        settings_override = override_settings(
+            OPENAPI_SCHEMA={"DIRECTORY": directory, "MAX_AGE": 600}
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        schema._artifacts.clear()
+        self.addCleanup(schema._artifacts.clear)
+
+    def build(self):
+        call_command("build_openapi_schema", stdout=io.StringIO())
+
+    def test_not_built_yet(self):
+        response = self.client.get("/api/swagger.json")
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_serves_the_built_schema(self):
+        self.build()
+
+        response = self.client.get("/api/swagger.json")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("/orders/", response.json()["paths"])
+        self.assertEqual(response["Cache-Control"], "public, max-age=600")
+        yaml = self.client.get("/api/swagger.yaml")
+        self.assertEqual(yaml["Content-Type"], "application/yaml; charset=utf-8")
+
+    def test_revalidates_and_compresses(self):
+        self.build()
+        etag = self.client.get("/api/swagger.json")["ETag"]
+
+        not_modified = self.client.get("/api/swagger.json", HTTP_IF_NONE_MATCH=etag)
+        compressed = self.client.get("/api/swagger.json", HTTP_ACCEPT_ENCODING="gzip")
+
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(compressed["Content-Encoding"], "gzip")
+        self.assertEqual(
+            gzip.decompress(compressed.content), schema.get_artifact(".json")["body"]
+        )
+
+    @override_settings(DEBUG=True)
+    def test_debug_generates_the_schema_per_request(self):
+        response = self.client.get("/api/swagger.json")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("/orders/", response.json()["paths"])
+        self.assertEqual(schema._artifacts, {})
+
+    @override_settings(API_DOCS=False)
+    def test_building_needs_the_docs(self):
+        with self.assertRaises(CommandError):
+            self.build()
+
+
+class DocsModeTests(SimpleTestCase):
+    def test_placeholders_stand_in_for_drf_yasg(self):
+        openapi = OpenAPIPlaceholders()
+
+        self.assertEqual(openapi.IN_QUERY, "IN_QUERY")
+        self.assertIsNone(openapi.Parameter("limit", in_=openapi.IN_QUERY))
+
+        def view(request):
+            pass
+
+        self.assertIs(skip_schema(method="GET", tags=["Dishes"])(view), view)
+
+    def test_boots_without_drf_yasg(self):
+        script = (
+            "import sys, django; django.setup(); "
+            "from django.urls import resolve; resolve('/api/menu/'); "
+            "print('drf_yasg' in sys.modules)"
+        )
+        process = subprocess.run(
+            [sys.executable, "-c", script],
+            cwd=settings.BASE_DIR,
+            env={
+                **os.environ,
+                "API_DOCS": "False",
+                "DJANGO_SETTINGS_MODULE": "knight_meat_tatse.settings",
+            },
+            capture_output=True,
+            text=True,
+        )
+
+        self.assertEqual(process.returncode, 0, process.stderr)
+        self.assertEqual(process.stdout.strip(), "False")
+
+    def test_parses_import_times(self):
+        stderr = (
+            "import time: self [us] | cumulative | imported package\n"
+            "import time:       150 |        150 |   django.utils\n"
+            "import time:      2000 |       2150 | django\n"
+        )
+
+        self.assertEqual(
+            parse_import_times(stderr),
+            {"django.utils": (0.00015, 0.00015), "django": (0.002, 0.00215)},
+        )
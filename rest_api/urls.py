@@ -1,51 +1,46 @@
-# drf yasg
-from drf_yasg.views import get_schema_view
-from drf_yasg import openapi
-
-# restframework
-from rest_framework import permissions
-
 # restframework_simplejwt
 from rest_framework_simplejwt import views as jwt_views
 
 # django
+from django.conf import settings
 from django.urls import path, re_path
 
-
-schema_view = get_schema_view(
-    openapi.Info(
-        title="Knight Meat Taste API",
-        default_version="v1",
-        description="Testing api endpoints",
-        terms_of_service="https://www.google.com/policies/terms/",
-        contact=openapi.Contact(email="tetobobo1@gmail.com"),
-        license=openapi.License(name="BSD License"),
-    ),
-    public=True,
-    permission_classes=[permissions.AllowAny],
-)
+# views
+from rest_api.feed import order_feed
+from rest_api.schema import schema_file, schema_ui
+from rest_api.views import OrderView, UserView
 
 
-urlpatterns = []
+urlpatterns = [
+    path("dishes/", UserView.list_dishes, name="dish-list"),
+    path("dishes/search/", UserView.search_dishes, name="dish-search"),
+    path(
+        "dishes/autocomplete/",
+        UserView.autocomplete_dishes,
+        name="dish-autocomplete",
+    ),
+    path("menu/", UserView.menu, name="menu"),
+    path("orders/", OrderView.create_order, name="order-create"),
+    path("orders/feed/", order_feed, name="order-feed"),
+]
 
 
-# API documentation
+# API documentation, the schema is prebuilt with manage.py build_openapi_schema
 urlpatterns += [
     re_path(
         r"^swagger(?P<format>\.json|\.yaml)$",
-        schema_view.without_ui(cache_timeout=0),
+        schema_file,
         name="schema-json",
     ),
-    re_path(
-        r"^swagger/$",
-        schema_view.with_ui("swagger", cache_timeout=0),
-        name="schema-swagger-ui",
-    ),
-    re_path(
-        r"^redoc/$", schema_view.with_ui("redoc", cache_timeout=0), name="schema-redoc"
-    ),
 ]
 
+# the pages need drf_yasg, see API_DOCS
+if settings.API_DOCS:
+    urlpatterns += [
+        re_path(r"^swagger/$", schema_ui("swagger"), name="schema-swagger-ui"),
+        re_path(r"^redoc/$", schema_ui("redoc"), name="schema-redoc"),
+    ]
+
 
 # token and refresh tokem=n with jwt
 urlpatterns += [
@@ -1,15 +1,17 @@
-# drf yasg
-from drf_yasg.utils import swagger_auto_schema
-from drf_yasg import openapi
+# api docs, drf yasg's or no-ops without API_DOCS
+from knight_meat_tatse.docs import openapi, swagger_auto_schema
 
 
 # django
 from django.contrib.auth import get_user_model
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 from django.utils.crypto import get_random_string
 
 # restframework
 from rest_framework import status
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.decorators import (
     api_view,
     permission_classes,
@@ -20,9 +22,19 @@ from rest_framework.response import Response
 from rest_framework.parsers import FormParser, MultiPartParser
 
 
+from rest_api.catalog import dish_row_to_data, get_dish_columns, get_dish_fields
+from rest_api.menu import get_menu
 from rest_api.models import Dish
+from rest_api.pagination import DishCursorPagination
+from rest_api.renditions import get_media_url_builder
+from rest_api.search import get_prefix_index, search_dishes
 
-from rest_api.serializers import DishSerializer
+from rest_api.serializers import (
+    CreateOrderSerializer,
+    DishSerializer,
+    OrderLineSerializer,
+    OrderSerializer,
+)
 
 User = get_user_model()
 
@@ -54,3 +66,184 @@ class UserView:
         serializer = DishSerializer(data=data, context={"request": request})
 
         pass
+
+    @swagger_auto_schema(
+        method="GET",
+        tags=["Dishes"],
+        manual_parameters=[
+            openapi.Parameter(
+                "cursor",
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                description="cursor from the previous page's next/previous link",
+            ),
+            openapi.Parameter(
+                "limit",
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_INTEGER,
+                description=f"page size, at most {DishCursorPagination.max_page_size}",
+            ),
+            openapi.Parameter(
+                "fields",
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                description="comma separated fields to return, e.g. id,name,price",
+            ),
+        ],
+        responses={200: DishSerializer(many=True)},
+    )
+    @api_view(["GET"])
+    @authentication_classes(())
+    @permission_classes((AllowAny,))
+    def list_dishes(request):
+        fields = get_dish_fields(request.query_params.get("fields"))
+        dishes = Dish.objects.values(*get_dish_columns(fields))
+
+        paginator = DishCursorPagination()
+        page = paginator.paginate_queryset(dishes, request)
+
+        url = get_media_url_builder(request)
+        return paginator.get_paginated_response(
+            [dish_row_to_data(row, fields, request, url) for row in page]
+        )
+
+    @swagger_auto_schema(
+        method="GET",
+        tags=["Dishes"],
+        responses={200: DishSerializer(many=True), 304: "Not Modified"},
+    )
+    @api_view(["GET"])
+    @authentication_classes(())
+    @permission_classes((AllowAny,))
+    def menu(request):
+        """
+        The whole menu from the cached snapshot, never touches the database
+        while the snapshot is cached.
+        """
+        menu = get_menu()
+        etag, last_modified = menu["etag"], menu["last_modified"]
+
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            if "gzip" in request.headers.get("Accept-Encoding", ""):
+                response = HttpResponse(menu["gzip"], content_type="application/json")
+                response["Content-Encoding"] = "gzip"
+            else:
+                response = HttpResponse(menu["body"], content_type="application/json")
+
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(last_modified)
+        response["Cache-Control"] = "public, no-cache"
+        response["Vary"] = "Accept-Encoding"
+        return response
+
+    @swagger_auto_schema(
+        method="GET",
+        tags=["Dishes"],
+        manual_parameters=[
+            openapi.Parameter(
+                "q",
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                description="words of the dish name, the last one may be partial",
+            ),
+            openapi.Parameter(
+                "limit",
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_INTEGER,
+                description="number of results, at most 100",
+            ),
+            openapi.Parameter(
+                "fields",
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                description="comma separated fields to return, e.g. id,name,price",
+            ),
+        ],
+        responses={200: DishSerializer(many=True)},
+    )
+    @api_view(["GET"])
+    @authentication_classes(())
+    @permission_classes((AllowAny,))
+    def search_dishes(request):
+        """
+        Full-text search over dish names, best match first.
+        """
+        fields = get_dish_fields(request.query_params.get("fields"))
+        try:
+            limit = min(int(request.query_params.get("limit", 20)), 100)
+        except ValueError:
+            limit = 20
+
+        rows = search_dishes(
+            request.query_params.get("q", ""), get_dish_columns(fields), max(limit, 1)
+        )
+        url = get_media_url_builder(request)
+        return Response(
+            {"results": [dish_row_to_data(row, fields, request, url) for row in rows]},
+            status=status.HTTP_200_OK,
+        )
+
+    @swagger_auto_schema(
+        method="GET",
+        tags=["Dishes"],
+        manual_parameters=[
+            openapi.Parameter(
+                "q",
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                description="what has been typed so far",
+            ),
+        ],
+    )
+    @api_view(["GET"])
+    @authentication_classes(())
+    @permission_classes((AllowAny,))
+    def autocomplete_dishes(request):
+        """
+        Dish name suggestions from the in-memory prefix index, no database query
+        unless the index is stale.
+        """
+        suggestions = get_prefix_index().complete(request.query_params.get("q", ""))
+        return Response(
+            {"results": [{"id": pk, "name": name} for pk, name in suggestions]},
+            status=status.HTTP_200_OK,
+        )
+
+
+class OrderView:
+    """
+    in this class there are all views for orders
+    """
+
+    @swagger_auto_schema(
+        method="POST",
+        tags=["Orders"],
+        request_body=CreateOrderSerializer,
+        manual_parameters=[
+            openapi.Parameter(
+                "Authorization",
+                in_=openapi.IN_HEADER,
+                type=openapi.TYPE_STRING,
+                description="Bearer {token}",
+            ),
+        ],
+    )
+    @api_view(["POST"])
+    @permission_classes((IsAuthenticated,))
+    def create_order(request):
+        """
+        Place an order for the logged in user, totals come from the dishes' current prices.
+        """
+        serializer = CreateOrderSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        order = serializer.save(user=request.user)
+
+        data = OrderSerializer(order).data
+        data["lines"] = OrderLineSerializer(order.created_lines, many=True).data
+        return Response({"order": data}, status=status.HTTP_201_CREATED)
+
@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from users.forms import UserCreationForm, UserChangeForm
-from .models import User
+from .models import User, EmailOutbox, MaintenanceRun
 
 admin.site.site_header = "Mentor Administration"
 
@@ -76,3 +76,21 @@ class UserAdmin(UserAdmin):
 
 
 admin.site.register(User, UserAdmin)
+
+
+class EmailOutboxAdmin(admin.ModelAdmin):
+    list_display = ("recipient", "kind", "status", "attempts", "next_attempt_at", "sent_at")
+    list_filter = ("kind", "status")
+    search_fields = ("recipient",)
+    readonly_fields = ("created_at", "sent_at")
+
+
+admin.site.register(EmailOutbox, EmailOutboxAdmin)
+
+
+class MaintenanceRunAdmin(admin.ModelAdmin):
+    list_display = ("job", "started_at", "finished_at", "rows", "bytes", "error")
+    list_filter = ("job",)
+
+
+admin.site.register(MaintenanceRun, MaintenanceRunAdmin)
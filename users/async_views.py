@@ -0,0 +1,323 @@
+import functools
+import json
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.http import HttpResponse, QueryDict
+from django.utils.cache import get_conditional_response
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotAuthenticated, ParseError
+from rest_framework.renderers import JSONRenderer
+
+from users import hashing
+from users.authentication import CachedJWTAuthentication
+from users.profiles import (
+    get_cached_profile,
+    get_profile_validators,
+    set_conditional_headers,
+)
+from users.serializers import (
+    ChangeProfilePictureSerializer,
+    ForgotPasswordSerializer,
+    PhoneNumberSerializer,
+    RegisterUserSerializer,
+    ResetPasswordSerializer,
+    UserChangeNamesSerializer,
+    UserLocationSerializer,
+    UserSerializer,
+)
+from users.tokens import (
+    IndexedRefreshToken,
+    make_email_verification_token,
+    make_password_reset_token,
+)
+from users.utils import aqueue_reset_password_email, queue_verification_email
+from users.views import get_profile_data
+
+
+User = get_user_model()
+
+
+def respond(data, status_code=status.HTTP_200_OK):
+    return HttpResponse(
+        JSONRenderer().render(data), content_type="application/json", status=status_code
+    )
+
+
+def parse_data(request):
+    """
+    request.data as DRF would build it for JSON, form and multipart bodies.
+    """
+    content_type = request.content_type or ""
+    if content_type == "application/json":
+        try:
+            return json.loads(request.body or b"{}")
+        except ValueError as e:
+            raise ParseError(f"JSON parse error - {e}")
+    if content_type == "multipart/form-data":
+        # django only parses multipart bodies of POST requests by itself
+        data, files = request.parse_file_upload(request.META, request)
+        data = data.copy()
+        data.update(files)
+        return data
+    if content_type == "application/x-www-form-urlencoded":
+        return QueryDict(request.body)
+    return {}
+
+
+def async_api_view(methods, authenticated=False):
+    """
+    The parts of @api_view these views use, for native async views that DRF
+    3.14 can't run: method check, request.data, JWT authentication against
+    the user cache, and APIException responses in DRF's format.
+    """
+
+    def decorator(view):
+        @csrf_exempt
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                return respond(
+                    {"detail": f'Method "{request.method}" not allowed.'},
+                    status.HTTP_405_METHOD_NOT_ALLOWED,
+                )
+            authentication = CachedJWTAuthentication()
+            try:
+                request.data = parse_data(request)
+                if authenticated:
+                    result = await authentication.aauthenticate(request)
+                    if result is None:
+                        raise NotAuthenticated()
+                    request.user, request.auth = result
+                return await view(request, *args, **kwargs)
+            except APIException as exc:
+                detail = exc.detail
+                response = respond(
+                    detail if isinstance(detail, (list, dict)) else {"detail": detail},
+                    exc.status_code,
+                )
+                if exc.status_code == status.HTTP_401_UNAUTHORIZED:
+                    response["WWW-Authenticate"] = authentication.authenticate_header(
+                        request
+                    )
+                if getattr(exc, "wait", None):
+                    response["Retry-After"] = str(int(exc.wait))
+                return response
+
+        return wrapper
+
+    return decorator
+
+
+def create_user(serializer, password):
+    with transaction.atomic():
+        user = serializer.save(password=password)
+        queue_verification_email(user.email, user.id, make_email_verification_token(user))
+    return user
+
+
+class AsyncUserView:
+    """
+    async versions of the UserView endpoints that wait on hashing, the
+    database or the cache, for deployments served by asgi.py. Responses are
+    the same as the sync views'.
+    """
+
+    @async_api_view(["POST"])
+    async def register(request):
+        serializer = RegisterUserSerializer(data=request.data)
+        if not serializer.is_valid():
+            return respond(serializer.errors, status.HTTP_400_BAD_REQUEST)
+
+        password = await hashing.amake_password(serializer.validated_data["password1"])
+        # the user and its verification email are committed together,
+        # the async ORM has no transactions
+        await sync_to_async(create_user)(serializer, password)
+
+        return respond(
+            {
+                "message": "account created successfully. Check your email to verify your account.",
+            },
+            status.HTTP_201_CREATED,
+        )
+
+    @async_api_view(["POST"])
+    async def login(request):
+        email = request.data.get("email")
+        password = request.data.get("password")
+
+        if not email or not password:
+            return respond(
+                {"message": "Both email and password are required."},
+                status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            user = await User.objects.aget(email=email)
+        except User.DoesNotExist:
+            return respond(
+                {"message": "User with that email doesn't exist."},
+                status.HTTP_401_UNAUTHORIZED,
+            )
+
+        if not user.is_verfied:
+            return respond(
+                {
+                    "message": "Please Acticate your account first, check your email inbox."
+                },
+                status.HTTP_400_BAD_REQUEST,
+            )
+
+        if not await hashing.acheck_user_password(user, password):
+            return respond(
+                {"message": "Incorrect email or password"},
+                status.HTTP_401_UNAUTHORIZED,
+            )
+
+        logged_user = UserSerializer(user, context={"request": request}).data
+        # records the OutstandingToken row
+        refresh = await sync_to_async(IndexedRefreshToken.for_user)(user)
+        return respond(
+            {
+                "message": "Logged In successfully",
+                "user": {
+                    "id": logged_user["id"],
+                    "first_name": logged_user["first_name"],
+                    "last_name": logged_user["last_name"],
+                    "email": logged_user["email"],
+                    "phone_number": logged_user["phone_number"],
+                    "address_1": logged_user["address_1"],
+                    "address_2": logged_user["address_2"],
+                    "city": logged_user["city"],
+                    "country": logged_user["country"],
+                    "profile_picture": logged_user["profile_picture"],
+                },
+                "access": str(refresh.access_token),
+            }
+        )
+
+    @async_api_view(["GET"], authenticated=True)
+    async def get_user_data(request):
+        user = request.user
+        # these read django's cache, which may be Redis
+        version, etag, last_modified = await sync_to_async(get_profile_validators)(
+            user.pk
+        )
+
+        not_modified = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if not_modified is not None:
+            return set_conditional_headers(not_modified, etag, last_modified)
+
+        data = await sync_to_async(get_cached_profile)(
+            user.pk, request, version, get_profile_data
+        )
+        return set_conditional_headers(respond({"user": data}), etag, last_modified)
+
+    @async_api_view(["POST"])
+    async def forgot_password(request):
+        serializer = ForgotPasswordSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        try:
+            user = await User.objects.aget(email=serializer.validated_data["email"])
+        except User.DoesNotExist:
+            return respond(
+                {"message": "User with this email does not exist."},
+                status.HTTP_400_BAD_REQUEST,
+            )
+
+        # the outbox worker does the SMTP part
+        await aqueue_reset_password_email(user.email, make_password_reset_token(user))
+
+        return respond(
+            {
+                "message": "An email has been sent to your email address. Please check your email to reset your password."
+            }
+        )
+
+    @async_api_view(["POST"], authenticated=True)
+    async def change_password(request):
+        user = request.user
+        serializer = ResetPasswordSerializer(data=request.data)
+
+        if not serializer.is_valid():
+            return respond(serializer.errors, status.HTTP_400_BAD_REQUEST)
+
+        if not await hashing.acheck_user_password(
+            user, request.data.get("old_password", "")
+        ):
+            return respond(
+                {"message": "Incorrect old password"}, status.HTTP_400_BAD_REQUEST
+            )
+
+        user.password = await hashing.amake_password(serializer.validated_data["password1"])
+        await user.asave(update_fields=["password"])
+        return respond({"message": "Password changed successfully."})
+
+    @async_api_view(["PATCH"], authenticated=True)
+    async def change_phone_number(request):
+        user = request.user
+        serializer = PhoneNumberSerializer(data=request.data)
+
+        if serializer.is_valid():
+            user.phone_number = serializer.validated_data["phone_number"]
+            await user.asave(update_fields=["phone_number"])
+            return respond({"message": "Phone number Updated successfully."})
+        return respond(
+            {"message": "Phone number Failed To be updated"},
+            status.HTTP_400_BAD_REQUEST,
+        )
+
+    @async_api_view(["PUT"], authenticated=True)
+    async def change_location(request):
+        user = request.user
+        serializer = UserLocationSerializer(data=request.data)
+
+        if serializer.is_valid():
+            user.address_1 = serializer.validated_data["address_1"]
+            user.address_2 = serializer.validated_data["address_2"]
+            user.city = serializer.validated_data["city"]
+            user.country = serializer.validated_data["country"]
+            await user.asave(update_fields=["address_1", "address_2", "city", "country"])
+            return respond({"message": "Location Updated successfully."})
+        return respond(
+            {"message": "Location Failed To be updated."},
+            status.HTTP_400_BAD_REQUEST,
+        )
+
+    @async_api_view(["PUT"], authenticated=True)
+    async def change_names(request):
+        user = request.user
+        serializer = UserChangeNamesSerializer(data=request.data)
+
+        if serializer.is_valid():
+            user.first_name = serializer.validated_data["first_name"]
+            user.last_name = serializer.validated_data["last_name"]
+            await user.asave(update_fields=["first_name", "last_name"])
+            return respond({"message": "Names Updated successfully."})
+        return respond(
+            {"message": "Names Failed To be updated."},
+            status.HTTP_400_BAD_REQUEST,
+        )
+
+    @async_api_view(["PUT"], authenticated=True)
+    async def change_profile_picture(request):
+        user = request.user
+        serializer = ChangeProfilePictureSerializer(data=request.data)
+
+        if serializer.is_valid():
+            user.profile_picture = serializer.validated_data["profile_picture"]
+            await user.asave(update_fields=["profile_picture"])
+            return respond(
+                {
+                    "message": "Profile Picture Updated successfully, it may take minute to appear here reload to see changes."
+                }
+            )
+        return respond(
+            {"message": "Profile Picture Failed To be updated."},
+            status.HTTP_400_BAD_REQUEST,
+        )
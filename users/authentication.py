@@ -0,0 +1,269 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import (
+    JWTAuthentication,
+    JWTStatelessUserAuthentication,
+)
+from rest_framework_simplejwt.exceptions import (
+    AuthenticationFailed,
+    InvalidToken,
+    TokenError,
+)
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import UntypedToken
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+
+TOKEN_VERSION_CLAIM = "token_version"
+
+
+def publish_token_version(user_id, token_version, replace=True):
+    """
+    Let TokenUserAuthentication reject tokens with an older version and
+    refreshes skip the row while the token's version is current. The entry
+    has to outlive the refresh tokens it invalidates.
+    """
+    (cache.set if replace else cache.add)(
+        f"users:token-version:{user_id}",
+        token_version,
+        max(
+            api_settings.ACCESS_TOKEN_LIFETIME, api_settings.REFRESH_TOKEN_LIFETIME
+        ).total_seconds(),
+    )
+
+
+def get_published_token_version(user_id):
+    return cache.get(f"users:token-version:{user_id}")
+
+
+def get_token_user_id(request):
+    """
+    The user id from the bearer token, checked only for its signature since
+    the view authenticates it anyway. "" for anonymous requests.
+    """
+    header = request.headers.get("Authorization", "").split()
+    if len(header) != 2 or header[0] not in api_settings.AUTH_HEADER_TYPES:
+        return ""
+    try:
+        return str(UntypedToken(header[1]).get(api_settings.USER_ID_CLAIM, ""))
+    except TokenError:
+        return ""
+
+
+def raise_token_outdated():
+    raise AuthenticationFailed(
+        _("The user's role has changed, log in again."), code="token_outdated"
+    )
+
+
+class UserCache:
+    """
+    Bounded LRU of authenticated users with a TTL, keyed by (user id, token version).
+    With shared invalidation on, every entry also remembers the generation
+    stored for its user in the shared django cache so a save in another
+    worker makes it stale.
+    """
+
+    def __init__(self, max_size=1024, ttl=60, shared_invalidation=False):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.shared_invalidation = shared_invalidation
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def generation_key(user_id):
+        return f"users:auth-generation:{user_id}"
+
+    def get_generation(self, user_id):
+        if not self.shared_invalidation:
+            return None
+        return cache.get(self.generation_key(user_id))
+
+    def get(self, user_id, version):
+        key = (str(user_id), version)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self.entries.move_to_end(key)
+            else:
+                entry = None
+
+        if entry is not None and entry[2] != self.get_generation(user_id):
+            entry = None
+
+        with self.lock:
+            if entry is None:
+                self.misses += 1
+                self.entries.pop(key, None)
+                return None
+            self.hits += 1
+        return copy.copy(entry[0])
+
+    def set(self, user_id, version, user):
+        key = (str(user_id), version)
+        entry = (copy.copy(user), time.monotonic() + self.ttl, self.get_generation(user_id))
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        user_id = str(user_id)
+        with self.lock:
+            for key in [key for key in self.entries if key[0] == user_id]:
+                del self.entries[key]
+            self.invalidations += 1
+        if self.shared_invalidation:
+            cache.set(self.generation_key(user_id), time.time_ns(), None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "invalidations": self.invalidations,
+            }
+
+
+_user_cache = None
+_user_cache_lock = threading.Lock()
+
+
+def get_user_cache():
+    global _user_cache
+    if _user_cache is None:
+        with _user_cache_lock:
+            if _user_cache is None:
+                config = getattr(settings, "USER_CACHE", {})
+                _user_cache = UserCache(
+                    max_size=config.get("MAX_SIZE", 1024),
+                    ttl=config.get("TTL", 60),
+                    shared_invalidation=config.get("SHARED_INVALIDATION", False),
+                )
+    return _user_cache
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that serves the user from the per-process UserCache
+    instead of querying users_user on every request.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        version = validated_token.get(TOKEN_VERSION_CLAIM, 0)
+        user_cache = get_user_cache()
+        user = user_cache.get(user_id, version)
+
+        if user is None:
+            user = super().get_user(validated_token)
+            user_cache.set(user_id, version, user)
+        elif api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(
+                api_settings.REVOKE_TOKEN_CLAIM
+            ) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(
+                    _("The user's password has been changed."), code="password_changed"
+                )
+
+        # tokens issued before role claims existed have no version
+        if TOKEN_VERSION_CLAIM in validated_token and version != user.token_version:
+            raise_token_outdated()
+
+        return user
+
+    async def aget_user(self, validated_token):
+        """
+        get_user() for async views, a cache miss is loaded with the async ORM.
+        """
+        from users.models import User
+
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        version = validated_token.get(TOKEN_VERSION_CLAIM, 0)
+        user_cache = get_user_cache()
+        # with shared invalidation the entries are checked against django's cache
+        if user_cache.shared_invalidation:
+            user = await sync_to_async(user_cache.get)(user_id, version)
+        else:
+            user = user_cache.get(user_id, version)
+
+        if user is None:
+            try:
+                user = await User.objects.aget(**{api_settings.USER_ID_FIELD: user_id})
+            except User.DoesNotExist:
+                raise AuthenticationFailed(_("User not found"), code="user_not_found")
+            if not user.is_active:
+                raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+            if user_cache.shared_invalidation:
+                await sync_to_async(user_cache.set)(user_id, version, user)
+            else:
+                user_cache.set(user_id, version, user)
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(
+                api_settings.REVOKE_TOKEN_CLAIM
+            ) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(
+                    _("The user's password has been changed."), code="password_changed"
+                )
+
+        if TOKEN_VERSION_CLAIM in validated_token and version != user.token_version:
+            raise_token_outdated()
+
+        return user
+
+    async def aauthenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        validated_token = self.get_validated_token(raw_token)
+        return await self.aget_user(validated_token), validated_token
+
+
+class TokenUserAuthentication(JWTStatelessUserAuthentication):
+    """
+    Authenticates from the token claims alone, request.user is a TokenUser
+    whose user_type/is_verfied come from the claims. Meant for role-gated
+    endpoints that don't need the user row. Tokens older than the last role
+    change published for the user are rejected.
+    """
+
+    def get_user(self, validated_token):
+        user = super().get_user(validated_token)
+        current = get_published_token_version(validated_token[api_settings.USER_ID_CLAIM])
+        if current is not None and validated_token.get(TOKEN_VERSION_CLAIM, 0) != current:
+            raise_token_outdated()
+        return user
@@ -0,0 +1,163 @@
+import hashlib
+import io
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image, ImageOps
+
+from users import hashing
+
+
+logger = logging.getLogger(__name__)
+
+AVATAR_DIR = "avatars"
+ORIGINAL_MAX_SIZE = 1024
+
+
+def get_config(key, default):
+    return getattr(settings, "AVATAR_PROCESSING", {}).get(key, default)
+
+
+def get_sizes():
+    return tuple(get_config("SIZES", (64, 128, 256)))
+
+
+def variant_name(digest, label, extension):
+    return f"{AVATAR_DIR}/{digest}/{label}.{extension}"
+
+
+def is_processed(name):
+    """
+    Processed pictures live in avatars/<sha256>/, raw uploads directly in avatars/.
+    """
+    parts = str(name).split("/")
+    return len(parts) == 3 and parts[0] == AVATAR_DIR and len(parts[1]) == 64
+
+
+def render_variants(data, sizes):
+    """
+    Decode an uploaded picture and return {filename: bytes} for the
+    EXIF-free original plus a JPEG and a WebP square of every size.
+    Pure function so it can run in a process pool.
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        # let the JPEG decoder downscale by a power of two, nothing we keep is larger
+        scale = min(ORIGINAL_MAX_SIZE / max(image.size), 1)
+        image.draft("RGB", (int(image.width * scale), int(image.height * scale)))
+        image = ImageOps.exif_transpose(image).convert("RGB")
+
+    variants = {}
+
+    original = image.copy()
+    original.thumbnail((ORIGINAL_MAX_SIZE, ORIGINAL_MAX_SIZE), Image.LANCZOS)
+    buffer = io.BytesIO()
+    original.save(buffer, "JPEG", quality=85, optimize=True, progressive=True)
+    variants["original.jpg"] = buffer.getvalue()
+
+    # crop once to the largest square and scale that down, resampling the
+    # full image for every size is most of the cost
+    largest = max(sizes)
+    square = ImageOps.fit(original, (largest, largest), Image.LANCZOS)
+    for size in sorted(sizes, reverse=True):
+        thumbnail = square if size == largest else square.resize((size, size), Image.LANCZOS)
+        for extension, options in (
+            ("jpg", {"format": "JPEG", "quality": 85, "optimize": True}),
+            ("webp", {"format": "WEBP", "quality": 80, "method": 4}),
+        ):
+            buffer = io.BytesIO()
+            thumbnail.save(buffer, **options)
+            variants[f"{size}.{extension}"] = buffer.getvalue()
+
+    return variants
+
+
+def process_avatar(name, sizes):
+    """
+    Write the variants of an uploaded picture under avatars/<sha256>/ and
+    return the digest. Pictures already processed for any user are reused.
+    """
+    with default_storage.open(name, "rb") as upload:
+        data = upload.read()
+    digest = hashlib.sha256(data).hexdigest()
+
+    if default_storage.exists(variant_name(digest, "original", "jpg")):
+        return digest
+
+    for filename, content in render_variants(data, sizes).items():
+        path = f"{AVATAR_DIR}/{digest}/{filename}"
+        if not default_storage.exists(path):
+            default_storage.save(path, ContentFile(content))
+    return digest
+
+
+def store_processed_avatar(user_id, name, future):
+    from users.models import User
+
+    try:
+        digest = future.result()
+        user = User.objects.filter(pk=user_id, profile_picture=name).first()
+        if user is None:
+            # replaced by a newer upload in the meantime
+            return
+        user.profile_picture = variant_name(digest, "original", "jpg")
+        user.avatar_hash = digest
+        user.save(update_fields=["profile_picture", "avatar_hash"])
+    except Exception:
+        logger.exception("Processing the avatar %s of user %s failed", name, user_id)
+    finally:
+        connection.close()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_avatar_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                workers = get_config("WORKERS", 2)
+                if get_config("EXECUTOR", "thread") == "process":
+                    # children may be spawned, they need django set up first
+                    _pool = ProcessPoolExecutor(
+                        workers, initializer=hashing.init_process_worker
+                    )
+                else:
+                    _pool = ThreadPoolExecutor(workers, thread_name_prefix="avatars")
+    return _pool
+
+
+def schedule_avatar_processing(user_id, name):
+    """
+    Process the picture in the avatar pool once the upload is committed.
+    """
+
+    def submit():
+        future = get_avatar_pool().submit(process_avatar, name, get_sizes())
+        future.add_done_callback(partial(store_processed_avatar, user_id, name))
+
+    transaction.on_commit(submit)
+
+
+def get_avatar_urls(avatar_hash, request=None):
+    """
+    {size: {"jpeg": url, "webp": url}} for a processed avatar.
+    """
+    if not avatar_hash:
+        return None
+
+    def url(label, extension):
+        location = default_storage.url(variant_name(avatar_hash, label, extension))
+        return request.build_absolute_uri(location) if request else location
+
+    return {
+        str(size): {"jpeg": url(size, "jpg"), "webp": url(size, "webp")}
+        for size in get_sizes()
+    }
@@ -0,0 +1,169 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import hashers
+from rest_framework.exceptions import Throttled
+
+
+class HashingQueueFull(Throttled):
+    """
+    Raised when the hashing pool can't take more work, rest_framework turns it into a 429.
+    """
+
+    default_detail = "Too many password requests right now, try again shortly."
+
+
+def run_hasher(name, *args):
+    """
+    Runs inside the pool worker (thread or process) and times the hash.
+    """
+    start = time.perf_counter()
+    result = getattr(hashers, name)(*args)
+    return result, time.perf_counter() - start
+
+
+def init_process_worker():
+    import django
+
+    django.setup()
+
+
+class PasswordHashingPool:
+    """
+    Bounded executor for PBKDF2 work so password hashing can't pin every request thread.
+    """
+
+    def __init__(self, executor="thread", workers=None, max_queue=32):
+        self.workers = workers or os.cpu_count() or 1
+        self.capacity = self.workers + max_queue
+
+        if executor == "process":
+            self.executor = ProcessPoolExecutor(
+                self.workers, initializer=init_process_worker
+            )
+        else:
+            self.executor = ThreadPoolExecutor(
+                self.workers, thread_name_prefix="password-hashing"
+            )
+
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+    def submit(self, name, *args):
+        with self.lock:
+            if self.in_flight >= self.capacity:
+                self.rejected += 1
+                raise HashingQueueFull(wait=1)
+            self.in_flight += 1
+
+        try:
+            future = self.executor.submit(run_hasher, name, *args)
+        except Exception:
+            with self.lock:
+                self.in_flight -= 1
+            raise
+        future.add_done_callback(self.on_done)
+        return future
+
+    def on_done(self, future):
+        with self.lock:
+            self.in_flight -= 1
+            if future.cancelled() or future.exception() is not None:
+                return
+            elapsed = future.result()[1]
+            self.completed += 1
+            self.total_time += elapsed
+            self.max_time = max(self.max_time, elapsed)
+
+    def call(self, name, *args):
+        return self.submit(name, *args).result()[0]
+
+    async def acall(self, name, *args):
+        result, _ = await asyncio.wrap_future(self.submit(name, *args))
+        return result
+
+    def metrics(self):
+        with self.lock:
+            return {
+                "workers": self.workers,
+                "capacity": self.capacity,
+                "in_flight": self.in_flight,
+                "queue_depth": max(self.in_flight - self.workers, 0),
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "avg_hash_ms": (
+                    self.total_time / self.completed * 1000 if self.completed else 0.0
+                ),
+                "max_hash_ms": self.max_time * 1000,
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_hashing_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                config = getattr(settings, "PASSWORD_HASHING", {})
+                _pool = PasswordHashingPool(
+                    executor=config.get("EXECUTOR", "thread"),
+                    workers=config.get("WORKERS"),
+                    max_queue=config.get("MAX_QUEUE", 32),
+                )
+    return _pool
+
+
+def make_password(raw_password):
+    return get_hashing_pool().call("make_password", raw_password)
+
+
+def check_password(raw_password, encoded):
+    return get_hashing_pool().call("check_password", raw_password, encoded)
+
+
+async def amake_password(raw_password):
+    return await get_hashing_pool().acall("make_password", raw_password)
+
+
+async def acheck_password(raw_password, encoded):
+    return await get_hashing_pool().acall("check_password", raw_password, encoded)
+
+
+def must_update(user):
+    try:
+        return hashers.identify_hasher(user.password).must_update(user.password)
+    except ValueError:
+        return False
+
+
+def check_user_password(user, raw_password):
+    """
+    Same as user.check_password() but hashed in the pool, including the
+    rehash when the hasher settings changed.
+    """
+    if not check_password(raw_password, user.password):
+        return False
+    if must_update(user):
+        user.password = make_password(raw_password)
+        user.save(update_fields=["password"])
+    return True
+
+
+async def acheck_user_password(user, raw_password):
+    if not await acheck_password(raw_password, user.password):
+        return False
+    if must_update(user):
+        user.password = await amake_password(raw_password)
+        await user.asave(update_fields=["password"])
+    return True
@@ -0,0 +1,83 @@
+import html
+import re
+from functools import lru_cache
+
+from django.template.loader import get_template
+
+
+COMMENT_RE = re.compile(r"<!--(?!\[if).*?-->", re.S)
+CSS_COMMENT_RE = re.compile(r"/\*.*?\*/", re.S)
+BETWEEN_TAGS_RE = re.compile(r">\s+<")
+WHITESPACE_RE = re.compile(r"\s+")
+
+HEAD_RE = re.compile(r"<head.*?</head>", re.S | re.I)
+BLOCK_END_RE = re.compile(r"<br\s*/?>|</(p|h[1-6]|tr|div|table)>", re.I)
+TAG_RE = re.compile(r"<[^>]+>")
+
+
+def minify_html(content):
+    content = COMMENT_RE.sub("", content)
+    content = CSS_COMMENT_RE.sub("", content)
+    content = WHITESPACE_RE.sub(" ", content)
+    content = BETWEEN_TAGS_RE.sub("><", content)
+    return content.strip()
+
+
+def html_to_text(content):
+    """
+    Plain-text alternative of an HTML email, one line per paragraph/row.
+    """
+    content = HEAD_RE.sub("", content)
+    content = BLOCK_END_RE.sub("\n", content)
+    content = html.unescape(TAG_RE.sub("", content))
+    lines = (WHITESPACE_RE.sub(" ", line).strip() for line in content.splitlines())
+    return "\n\n".join(line for line in lines if line)
+
+
+class CompiledEmailTemplate:
+    """
+    A template rendered once with placeholders, minified and split around them,
+    so each send only joins the static parts with the per-user values.
+    """
+
+    def __init__(self, template_name, fields):
+        self.template_name = template_name
+        markers = {field: f"@@{field.upper()}@@" for field in fields}
+        shell = minify_html(get_template(template_name).render(markers))
+        pattern = re.compile("|".join(re.escape(marker) for marker in markers.values()))
+        by_marker = {marker: field for field, marker in markers.items()}
+
+        self.html_parts = self.split(shell, pattern, by_marker)
+        self.text_parts = self.split(html_to_text(shell), pattern, by_marker)
+
+    @staticmethod
+    def split(shell, pattern, by_marker):
+        parts = []
+        position = 0
+        for match in pattern.finditer(shell):
+            parts.append(shell[position : match.start()])
+            parts.append(by_marker[match.group()])
+            position = match.end()
+        parts.append(shell[position:])
+        # static strings on even indexes, field names on odd indexes
+        return parts
+
+    @staticmethod
+    def join(parts, values):
+        return "".join(
+            part if index % 2 == 0 else values[part]
+            for index, part in enumerate(parts)
+        )
+
+    def render(self, **values):
+        """
+        Returns a (text, html) tuple.
+        """
+        values = {key: str(value) for key, value in values.items()}
+        escaped = {key: html.escape(value) for key, value in values.items()}
+        return self.join(self.text_parts, values), self.join(self.html_parts, escaped)
+
+
+@lru_cache(maxsize=None)
+def get_email_template(template_name, fields=("token", "url")):
+    return CompiledEmailTemplate(template_name, fields)
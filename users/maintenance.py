@@ -0,0 +1,205 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db.models import Q
+from django.utils import timezone
+
+from users.avatars import is_processed
+from users.models import EmailOutbox, MaintenanceRun, User
+from users.revocation import prune_expired_tokens
+
+
+JOBS = {}
+
+
+def job(interval):
+    """
+    Register a cleanup job. The function returns a (rows, bytes) tuple of what it reclaimed.
+    Other apps register theirs from their AppConfig.ready().
+    """
+
+    def register(function):
+        JOBS[function.__name__] = (interval, function)
+        return function
+
+    return register
+
+
+def get_config(key, default):
+    return getattr(settings, "MAINTENANCE", {}).get(key, default)
+
+
+def in_batches(queryset, action):
+    """
+    Apply `action` to the queryset's primary keys `BATCH_SIZE` at a time,
+    pausing between batches. Returns the number of rows handled.
+    """
+    batch_size = get_config("BATCH_SIZE", 500)
+    pause = get_config("PAUSE", 0.1)
+    total = 0
+    while True:
+        pks = list(queryset.values_list("pk", flat=True)[:batch_size])
+        if not pks:
+            return total
+        action(queryset.model.objects.filter(pk__in=pks))
+        total += len(pks)
+        if len(pks) < batch_size:
+            return total
+        time.sleep(pause)
+
+
+def delete_file(name):
+    try:
+        size = default_storage.size(name)
+        default_storage.delete(name)
+    except FileNotFoundError:
+        return 0
+    return size
+
+
+@job(interval=timedelta(hours=1))
+def clear_password_reset_tokens():
+    expired = User.objects.filter(password_reset_token__isnull=False).filter(
+        Q(password_reset_token_expiry__lte=timezone.now())
+        | Q(password_reset_token_expiry__isnull=True)
+    )
+    rows = in_batches(
+        expired,
+        lambda users: users.update(
+            password_reset_token=None, password_reset_token_expiry=None
+        ),
+    )
+    return rows, 0
+
+
+@job(interval=timedelta(hours=6))
+def clear_used_email_tokens():
+    used = User.objects.filter(is_verfied=True, email_token__isnull=False)
+    return in_batches(used, lambda users: users.update(email_token=None)), 0
+
+
+@job(interval=timedelta(days=1))
+def delete_unverified_accounts():
+    """
+    Unverified customers can still log in and order, deleting them would
+    cascade to their orders, so only the ones that never ordered go.
+    """
+    cutoff = timezone.now() - timedelta(days=get_config("UNVERIFIED_ACCOUNT_DAYS", 7))
+    stale = User.objects.filter(
+        is_verfied=False,
+        date_joined__lt=cutoff,
+        user_type=1,
+        is_staff=False,
+        is_superuser=False,
+        orders__isnull=True,
+    )
+    rows = reclaimed = 0
+
+    def delete(users):
+        nonlocal rows, reclaimed
+        # one may have ordered since the batch was picked
+        users = users.filter(orders__isnull=True)
+        for name in users.exclude(profile_picture="").values_list(
+            "profile_picture", flat=True
+        ):
+            # shared avatars/<sha256>/ variants are left to delete_orphaned_avatars
+            if name and not is_processed(name):
+                reclaimed += delete_file(name)
+        # what was removed, with the rows that cascaded, not what was picked
+        rows += users.delete()[0]
+
+    in_batches(stale, delete)
+    return rows, reclaimed
+
+
+@job(interval=timedelta(days=1))
+def delete_orphaned_avatars():
+    """
+    Remove files under avatars/ no user points to anymore, e.g. raw uploads
+    after processing or pictures replaced through change_profile_picture,
+    and variant directories no user's avatar_hash refers to. Files newer than
+    AVATAR_GRACE_SECONDS are kept so in-flight uploads aren't removed.
+    """
+    try:
+        directories, files = default_storage.listdir("avatars")
+    except FileNotFoundError:
+        return 0, 0
+
+    referenced = set(
+        User.objects.exclude(profile_picture="")
+        .exclude(profile_picture__isnull=True)
+        .values_list("profile_picture", flat=True)
+        .iterator()
+    )
+    cutoff = timezone.now() - timedelta(seconds=get_config("AVATAR_GRACE_SECONDS", 3600))
+    rows = reclaimed = 0
+    for filename in files:
+        name = f"avatars/{filename}"
+        if name in referenced or default_storage.get_modified_time(name) > cutoff:
+            continue
+        reclaimed += delete_file(name)
+        rows += 1
+
+    # processed variants in avatars/<sha256>/ are shared by every user with that picture
+    hashes = set(
+        User.objects.exclude(avatar_hash__isnull=True)
+        .values_list("avatar_hash", flat=True)
+        .iterator()
+    )
+    for directory in directories:
+        if len(directory) != 64 or directory in hashes:
+            continue
+        _, variants = default_storage.listdir(f"avatars/{directory}")
+        names = [f"avatars/{directory}/{variant}" for variant in variants]
+        if any(default_storage.get_modified_time(name) > cutoff for name in names):
+            continue
+        for name in names:
+            reclaimed += delete_file(name)
+        rows += 1
+    return rows, reclaimed
+
+
+@job(interval=timedelta(days=1))
+def delete_sent_emails():
+    cutoff = timezone.now() - timedelta(days=get_config("SENT_EMAIL_DAYS", 30))
+    sent = EmailOutbox.objects.filter(status=2, sent_at__lt=cutoff)
+    return in_batches(sent, lambda emails: emails.delete()), 0
+
+
+@job(interval=timedelta(hours=6))
+def delete_expired_tokens():
+    batch_size = get_config("BATCH_SIZE", 500)
+    return prune_expired_tokens(batch_size, get_config("PAUSE", 0.1)), 0
+
+
+def is_due(name, interval, now):
+    last = MaintenanceRun.objects.filter(job=name).only("started_at").first()
+    return last is None or last.started_at + interval <= now
+
+
+def run_job(name):
+    _, function = JOBS[name]
+    run = MaintenanceRun.objects.create(job=name)
+    try:
+        run.rows, run.bytes = function()
+    except Exception as e:
+        run.error = str(e)
+    run.finished_at = timezone.now()
+    run.save()
+    return run
+
+
+def run_due_jobs(names=None, force=False):
+    """
+    Run every registered job (or only `names`) whose interval has passed since its last run.
+    """
+    now = timezone.now()
+    runs = []
+    for name, (interval, _) in JOBS.items():
+        if names and name not in names:
+            continue
+        if force or is_due(name, interval, now):
+            runs.append(run_job(name))
+    return runs
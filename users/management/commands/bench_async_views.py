@@ -0,0 +1,163 @@
+import http.client
+import json
+import os
+import socket
+import subprocess
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+
+from users.models import User
+
+
+BENCH_DOMAIN = "bench.example.com"
+PASSWORD = "Bench!pass-2024"
+
+SERVERS = {
+    # sync DRF views behind gunicorn and wsgi.py
+    "gunicorn": (
+        ["gunicorn", "knight_meat_tatse.wsgi:application", "--bind", "127.0.0.1:{port}"],
+        {"ASYNC_VIEWS": "False"},
+    ),
+    # users.async_views behind asgi.py
+    "uvicorn": (
+        [
+            "uvicorn",
+            "knight_meat_tatse.asgi:application",
+            "--host",
+            "127.0.0.1",
+            "--port",
+            "{port}",
+            "--no-access-log",
+        ],
+        {"ASYNC_VIEWS": "True"},
+    ),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the auth and profile endpoints served by gunicorn (sync views) "
+        "and uvicorn (async views) under concurrent clients. Starts both servers "
+        "against the configured database, creates a throwaway user and removes it afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=400)
+        parser.add_argument("--concurrency", type=int, default=32)
+        parser.add_argument(
+            "--workers", type=int, default=1, help="Worker processes per server."
+        )
+        parser.add_argument("--port", type=int, default=8701)
+        parser.add_argument(
+            "--endpoints",
+            default="login,user-details,change-names",
+            help="Comma separated, out of login, user-details and change-names.",
+        )
+
+    def start_server(self, name, port, workers):
+        command, env = SERVERS[name]
+        command = [part.format(port=port) for part in command] + ["--workers", str(workers)]
+        process = subprocess.Popen(
+            command,
+            cwd=settings.BASE_DIR,
+            env={**os.environ, **env},
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise CommandError(f"{name} exited, is it installed?")
+            try:
+                socket.create_connection(("127.0.0.1", port), 0.5).close()
+                return process
+            except OSError:
+                time.sleep(0.2)
+        process.terminate()
+        raise CommandError(f"{name} didn't start listening on port {port}")
+
+    def request(self, port, method, path, body=None, token=None):
+        headers = {"Content-Type": "application/json"}
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        try:
+            start = time.perf_counter()
+            connection.request(
+                method, path, json.dumps(body) if body is not None else None, headers
+            )
+            response = connection.getresponse()
+            content = response.read()
+            return response.status, content, time.perf_counter() - start
+        finally:
+            connection.close()
+
+    def get_calls(self, email, token):
+        return {
+            "login": ("POST", "/api/auth/login/", {"email": email, "password": PASSWORD}, None),
+            "user-details": ("GET", "/api/auth/user-details/", None, token),
+            "change-names": (
+                "PUT",
+                "/api/auth/change-names/",
+                {"first_name": "Bench", "last_name": "User"},
+                token,
+            ),
+        }
+
+    def run(self, port, call, count, concurrency):
+        method, path, body, token = call
+        # one request first so lazy setup isn't timed
+        self.request(port, method, path, body, token)
+        with ThreadPoolExecutor(concurrency) as executor:
+            start = time.perf_counter()
+            results = list(
+                executor.map(
+                    lambda _: self.request(port, method, path, body, token), range(count)
+                )
+            )
+            elapsed = time.perf_counter() - start
+        latencies = sorted(result[2] for result in results)
+        errors = sum(1 for result in results if result[0] >= 400)
+        return (
+            count / elapsed,
+            latencies[len(latencies) // 2] * 1000,
+            latencies[int(len(latencies) * 0.95) - 1] * 1000,
+            errors,
+        )
+
+    def handle(self, *args, **options):
+        endpoints = options["endpoints"].split(",")
+        email = f"{uuid.uuid4().hex}@{BENCH_DOMAIN}"
+        user = User.objects.create_user(email=email, password=PASSWORD)
+        User.objects.filter(pk=user.pk).update(is_verfied=True)
+
+        try:
+            for offset, name in enumerate(SERVERS):
+                port = options["port"] + offset
+                process = self.start_server(name, port, options["workers"])
+                try:
+                    status, content, _ = self.request(
+                        port, "POST", "/api/auth/login/", {"email": email, "password": PASSWORD}
+                    )
+                    if status != 200:
+                        raise CommandError(f"{name} login failed: {status} {content[:200]}")
+                    calls = self.get_calls(email, json.loads(content)["access"])
+                    for endpoint in endpoints:
+                        rate, p50, p95, errors = self.run(
+                            port, calls[endpoint], options["requests"], options["concurrency"]
+                        )
+                        self.stdout.write(
+                            f"{name:>9} {endpoint:<13} {rate:8,.1f} req/s  "
+                            f"p50 {p50:7.1f} ms  p95 {p95:7.1f} ms  errors {errors}"
+                        )
+                finally:
+                    process.terminate()
+                    process.wait()
+        finally:
+            OutstandingToken.objects.filter(user=user).delete()
+            user.delete()
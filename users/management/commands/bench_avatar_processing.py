@@ -0,0 +1,61 @@
+import io
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from PIL import Image
+
+from users.avatars import get_sizes, render_variants
+
+
+def make_photo(width, height, seed):
+    """
+    Noisy JPEG with EXIF, closer to a phone photo than a flat color image.
+    """
+    image = Image.effect_noise((width, height), 64 + seed % 32).convert("RGB")
+    exif = Image.Exif()
+    exif[0x0112] = 6  # orientation: rotate 90
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=90, exif=exif)
+    return buffer.getvalue()
+
+
+class Command(BaseCommand):
+    help = "Measure profile pictures processed per second, per core and across a process pool."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--images", type=int, default=24)
+        parser.add_argument("--width", type=int, default=3000)
+        parser.add_argument("--height", type=int, default=2000)
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+
+    def handle(self, *args, **options):
+        sizes = get_sizes()
+        photos = [
+            make_photo(options["width"], options["height"], seed)
+            for seed in range(options["images"])
+        ]
+        megabytes = sum(len(photo) for photo in photos) / len(photos) / 1024 / 1024
+        self.stdout.write(
+            f"{len(photos)} photos of {options['width']}x{options['height']} "
+            f"(~{megabytes:.1f} MB), sizes {sizes}"
+        )
+
+        start = time.perf_counter()
+        for photo in photos:
+            render_variants(photo, sizes)
+        single = len(photos) / (time.perf_counter() - start)
+        self.stdout.write(f"1 core: {single:,.2f} images/s")
+
+        workers = options["workers"]
+        with ProcessPoolExecutor(workers) as executor:
+            # warm the workers up before timing
+            list(executor.map(render_variants, photos[:workers], [sizes] * workers))
+            start = time.perf_counter()
+            list(executor.map(render_variants, photos, [sizes] * len(photos)))
+            pooled = len(photos) / (time.perf_counter() - start)
+        self.stdout.write(
+            f"{workers} processes: {pooled:,.2f} images/s "
+            f"({pooled / workers:,.2f} images/s per core)"
+        )
@@ -0,0 +1,44 @@
+import time
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.template.loader import get_template
+
+from users.mail_templates import get_email_template
+
+
+class Command(BaseCommand):
+    help = "Compare renders per second of the Django template path and the compiled email templates."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--renders", type=int, default=2000)
+
+    def render_with_django(self, template_name, token, url):
+        return get_template(template_name).render({"token": token, "url": url})
+
+    def render_compiled(self, template_name, token, url):
+        return get_email_template(template_name).render(token=token, url=url)
+
+    def measure(self, render, template_name, renders):
+        tokens = [uuid.uuid4() for _ in range(renders)]
+        urls = [
+            f"{settings.CLIENT_URL}/account/verify-email/{pk}/{token}/"
+            for pk, token in enumerate(tokens)
+        ]
+        start = time.perf_counter()
+        for token, url in zip(tokens, urls):
+            render(template_name, token, url)
+        return renders / (time.perf_counter() - start)
+
+    def handle(self, *args, **options):
+        renders = options["renders"]
+        for template_name in ("mail.html", "forget_password.html"):
+            before = self.measure(self.render_with_django, template_name, renders)
+            after = self.measure(self.render_compiled, template_name, renders)
+            html_before = len(self.render_with_django(template_name, "t", "u"))
+            html_after = len(self.render_compiled(template_name, "t", "u")[1])
+            self.stdout.write(
+                f"{template_name}: {before:,.0f} -> {after:,.0f} renders/s "
+                f"({after / before:.1f}x), {html_before:,} -> {html_after:,} bytes"
+            )
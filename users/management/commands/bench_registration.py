@@ -0,0 +1,67 @@
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from users.models import EmailOutbox, User
+
+
+BENCH_DOMAIN = "bench.example.com"
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure signups per second through POST /api/auth/register/. "
+        "Creates throwaway users in the configured database and removes them afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=50)
+        parser.add_argument("--concurrency", type=int, default=4)
+
+    def register(self, _=None):
+        email = f"{uuid.uuid4().hex}@{BENCH_DOMAIN}"
+        response = APIClient().post(
+            "/api/auth/register/",
+            {
+                "first_name": "Bench",
+                "last_name": "User",
+                "email": email,
+                "password1": "Bench!pass-2024",
+                "password2": "Bench!pass-2024",
+            },
+            format="json",
+        )
+        connection.close()
+        return response.status_code
+
+    def handle(self, *args, **options):
+        try:
+            with CaptureQueriesContext(connection) as queries:
+                self.register()
+            writes = [
+                query["sql"].split(" ")[0]
+                for query in queries
+                if query["sql"].startswith(("INSERT", "UPDATE", "DELETE"))
+            ]
+            self.stdout.write(
+                f"one signup: {len(queries)} queries, writes: {', '.join(writes)}"
+            )
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(options["concurrency"]) as executor:
+                statuses = list(executor.map(self.register, range(options["count"])))
+            elapsed = time.perf_counter() - start
+
+            self.stdout.write(
+                f"{options['count']} signups with {options['concurrency']} threads: "
+                f"{options['count'] / elapsed:,.1f} signups/s, "
+                f"{statuses.count(201)} created"
+            )
+        finally:
+            EmailOutbox.objects.filter(recipient__endswith=BENCH_DOMAIN).delete()
+            User.objects.filter(email__endswith=BENCH_DOMAIN).delete()
@@ -0,0 +1,98 @@
+import time
+import uuid
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework_simplejwt.token_blacklist.models import (
+    BlacklistedToken,
+    OutstandingToken,
+)
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.utils import aware_utcnow
+
+from users.models import User
+from users.revocation import RevocationIndex
+from users.tokens import IndexedRefreshToken
+from users import revocation
+
+
+BENCH_PREFIX = "bench-"
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure refresh token blacklist checks as the blacklist grows. "
+        "Inserts throwaway rows into the configured database and removes them afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rows",
+            default="10000,100000,1000000",
+            help="Comma separated blacklist sizes to measure at.",
+        )
+        parser.add_argument("--lookups", type=int, default=2000)
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def grow_blacklist(self, count, batch_size):
+        expires_at = aware_utcnow() + timedelta(days=15)
+        while count > 0:
+            size = min(batch_size, count)
+            outstanding = OutstandingToken.objects.bulk_create(
+                OutstandingToken(
+                    jti=f"{BENCH_PREFIX}{uuid.uuid4().hex}",
+                    token="",
+                    expires_at=expires_at,
+                )
+                for _ in range(size)
+            )
+            if outstanding[0].pk is None:
+                outstanding = OutstandingToken.objects.filter(
+                    jti__in=[token.jti for token in outstanding]
+                )
+            BlacklistedToken.objects.bulk_create(
+                BlacklistedToken(token=token) for token in outstanding
+            )
+            count -= size
+
+    def measure(self, token_class, token, lookups):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            for _ in range(lookups):
+                token_class(token)
+            elapsed = time.perf_counter() - start
+        return elapsed / lookups * 1000000, len(queries) / lookups
+
+    def handle(self, *args, **options):
+        sizes = sorted(int(size) for size in options["rows"].split(","))
+        user = User.objects.create(email=f"{BENCH_PREFIX}{uuid.uuid4().hex}@example.com")
+        token = str(RefreshToken.for_user(user))
+
+        try:
+            current = 0
+            for size in sizes:
+                self.grow_blacklist(size - current, options["batch_size"])
+                current = size
+
+                # a fresh index per size, built before timing like a warm worker
+                revocation._index = RevocationIndex()
+                revocation._index.sync()
+
+                plain_us, plain_queries = self.measure(
+                    RefreshToken, token, options["lookups"]
+                )
+                indexed_us, indexed_queries = self.measure(
+                    IndexedRefreshToken, token, options["lookups"]
+                )
+                self.stdout.write(
+                    f"{size:>10,} blacklisted: "
+                    f"db {plain_us:,.1f} us ({plain_queries:.2f} queries), "
+                    f"indexed {indexed_us:,.1f} us ({indexed_queries:.2f} queries)"
+                )
+        finally:
+            OutstandingToken.objects.filter(jti__startswith=BENCH_PREFIX).delete()
+            OutstandingToken.objects.filter(user=user).delete()
+            user.delete()
+            revocation._index = None
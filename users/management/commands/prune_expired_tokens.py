@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from users.revocation import prune_expired_tokens
+
+
+class Command(BaseCommand):
+    help = "Delete expired outstanding and blacklisted refresh tokens in small batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--pause",
+            type=float,
+            default=0,
+            help="Seconds to sleep between batches.",
+        )
+
+    def handle(self, *args, **options):
+        deleted = prune_expired_tokens(
+            batch_size=options["batch_size"], pause=options["pause"]
+        )
+        self.stdout.write(f"deleted {deleted} expired tokens")
@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from users.maintenance import JOBS, run_due_jobs
+
+
+class Command(BaseCommand):
+    help = "Run the cleanup jobs registered with users.maintenance that are due."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--job",
+            action="append",
+            choices=sorted(JOBS),
+            help="Only run this job, can be repeated.",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Run the jobs even if their interval hasn't passed.",
+        )
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep running and check for due jobs every --interval seconds.",
+        )
+        parser.add_argument("--interval", type=float, default=60)
+
+    def handle(self, *args, **options):
+        while True:
+            for run in run_due_jobs(options["job"], options["force"]):
+                if run.error:
+                    self.stderr.write(f"{run.job}: failed: {run.error}")
+                else:
+                    self.stdout.write(
+                        f"{run.job}: reclaimed {run.rows} rows, {run.bytes} bytes"
+                    )
+
+            if not options["loop"]:
+                break
+            options["force"] = False
+            time.sleep(options["interval"])
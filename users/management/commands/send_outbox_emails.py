@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from users.outbox import deliver_batch
+
+
+class Command(BaseCommand):
+    help = "Deliver pending transactional emails from the outbox."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=None)
+        parser.add_argument("--max-attempts", type=int, default=None)
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=5,
+            help="Seconds to sleep when the outbox is empty.",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Drain the outbox once and exit instead of running forever.",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                sent, failed = deliver_batch(
+                    batch_size=options["batch_size"],
+                    max_attempts=options["max_attempts"],
+                )
+            except Exception as e:
+                self.stderr.write(f"Outbox delivery failed: {e}")
+                sent, failed = 0, 0
+
+            if sent or failed:
+                self.stdout.write(f"sent={sent} failed={failed}")
+                continue
+
+            if options["once"]:
+                break
+            time.sleep(options["interval"])
@@ -1,5 +1,6 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from users.managers import UserManager
 from django.conf import settings
@@ -20,6 +21,8 @@ class User(AbstractUser):
     password_reset_token = models.CharField(max_length=32, null=True, blank=True)
     password_reset_token_expiry = models.DateTimeField(null=True, blank=True)
     phone_number = models.CharField(max_length=155, null=True, blank=True)
+    # bumped whenever a field that's copied into JWT claims changes
+    token_version = models.PositiveIntegerField(default=0)
 
     # location
     address_1 = models.CharField(max_length=250, null=True, blank=True)
@@ -29,15 +32,46 @@ class User(AbstractUser):
 
     # profile picture
     profile_picture = models.ImageField(upload_to="avatars/", null=True, blank=True)
+    # sha256 of the processed picture, variants live in avatars/<avatar_hash>/
+    avatar_hash = models.CharField(max_length=64, null=True, blank=True)
 
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = ["first_name", "last_name"]
 
     objects = UserManager()
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            models.Index(fields=["is_verfied", "date_joined"]),
+            models.Index(fields=["password_reset_token_expiry"]),
+        ]
+
+    # a change bumps token_version, is_active too so refreshes re-read the
+    # row and refuse deactivated users
+    CLAIM_FIELDS = ("user_type", "is_verfied", "is_active")
+
     def __str__(self):
         return self.email
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_claims = instance.get_claim_values()
+        return instance
+
+    def get_claim_values(self):
+        return tuple(self.__dict__.get(field) for field in self.CLAIM_FIELDS)
+
+    def save(self, *args, **kwargs):
+        loaded = getattr(self, "_loaded_claims", None)
+        claims = self.get_claim_values()
+        if loaded is not None and claims != loaded:
+            self.token_version += 1
+            if kwargs.get("update_fields") is not None:
+                kwargs["update_fields"] = {*kwargs["update_fields"], "token_version"}
+        super().save(*args, **kwargs)
+        self._loaded_claims = claims
+
     def get_full_name(self):
         if self.first_name != "" and self.last_name != "":
             return self.first_name + " " + self.last_name
@@ -47,3 +81,60 @@ class User(AbstractUser):
     def get_user_type_display(self):
         return dict(self.USER_TYPE_CHOICES).get(self.user_type)
 
+
+class EmailOutbox(models.Model):
+    """
+    Transactional emails waiting to be delivered by the `send_outbox_emails` worker.
+    """
+
+    KIND_CHOICES = (
+        ("verification", "Email Verification"),
+        ("reset_password", "Reset Password"),
+    )
+
+    STATUS_CHOICES = (
+        (1, "Pending"),
+        (2, "Sent"),
+        (3, "Failed"),
+    )
+
+    kind = models.CharField(max_length=50, choices=KIND_CHOICES)
+    recipient = models.EmailField()
+    context = models.JSONField(default=dict, blank=True)
+    status = models.PositiveSmallIntegerField(choices=STATUS_CHOICES, default=1)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ("next_attempt_at", "id")
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} to {self.recipient}"
+
+
+class MaintenanceRun(models.Model):
+    """
+    One run of a cleanup job from `users.maintenance`, with what it reclaimed.
+    """
+
+    job = models.CharField(max_length=100)
+    started_at = models.DateTimeField(default=timezone.now)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    rows = models.PositiveIntegerField(default=0)
+    bytes = models.PositiveBigIntegerField(default=0)
+    error = models.TextField(null=True, blank=True)
+
+    class Meta:
+        ordering = ("-started_at",)
+        indexes = [
+            models.Index(fields=["job", "-started_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.job} at {self.started_at}"
@@ -0,0 +1,84 @@
+import smtplib
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from users.models import EmailOutbox
+from users.utils import build_outbox_email
+
+
+def get_retry_delay(attempts):
+    """
+    Exponential backoff in seconds for the given number of attempts.
+    """
+    base = getattr(settings, "EMAIL_OUTBOX_RETRY_BACKOFF", 60)
+    max_delay = getattr(settings, "EMAIL_OUTBOX_MAX_BACKOFF", 3600)
+    return min(base * (2 ** max(attempts - 1, 0)), max_delay)
+
+
+def claim_batch(batch_size):
+    """
+    Lock a batch of due entries and push their next_attempt_at forward so that
+    other workers skip them. If this worker dies mid-send, the entries become
+    due again once the backoff expires.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        entries = list(
+            EmailOutbox.objects.select_for_update(skip_locked=True).filter(
+                status=1, next_attempt_at__lte=now
+            )[:batch_size]
+        )
+        for entry in entries:
+            entry.attempts += 1
+            entry.next_attempt_at = now + timedelta(
+                seconds=get_retry_delay(entry.attempts)
+            )
+        EmailOutbox.objects.bulk_update(entries, ["attempts", "next_attempt_at"])
+    return entries
+
+
+def deliver_batch(batch_size=None, max_attempts=None, connection=None):
+    """
+    Send one batch of due outbox entries over a single SMTP connection.
+    Returns a (sent, failed) tuple.
+    """
+    batch_size = batch_size or getattr(settings, "EMAIL_OUTBOX_BATCH_SIZE", 50)
+    max_attempts = max_attempts or getattr(settings, "EMAIL_OUTBOX_MAX_ATTEMPTS", 5)
+
+    entries = claim_batch(batch_size)
+    if not entries:
+        return 0, 0
+
+    sent = failed = 0
+    connection = connection or get_connection()
+    try:
+        connection.open()
+        for entry in entries:
+            try:
+                message = build_outbox_email(entry)
+                message.connection = connection
+                message.send()
+            except Exception as e:
+                if isinstance(e, smtplib.SMTPServerDisconnected):
+                    # reconnect for the rest of the batch
+                    connection.close()
+                    connection.open()
+                entry.last_error = str(e)
+                if entry.attempts >= max_attempts:
+                    entry.status = 3
+                entry.save(update_fields=["status", "last_error"])
+                failed += 1
+            else:
+                entry.status = 2
+                entry.sent_at = timezone.now()
+                entry.last_error = None
+                entry.save(update_fields=["status", "sent_at", "last_error"])
+                sent += 1
+    finally:
+        connection.close()
+
+    return sent, failed
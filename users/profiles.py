@@ -0,0 +1,81 @@
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.http import http_date, quote_etag
+
+from knight_meat_tatse.cache import get_namespace
+from knight_meat_tatse.db.router import use_primary
+from users.models import User
+
+
+PROFILE_TIMEOUT = 60 * 60 * 24
+
+
+# the versions live in django's default cache and every worker has to see
+# the same ones, with a per-process cache (locmem) a worker keeps serving
+# the profile it cached until PROFILE_TIMEOUT after another worker's save.
+# Deployments with several workers need REDIS_URL, see CACHES
+
+
+def version_key(user_id):
+    return f"users:profile-version:{user_id}"
+
+
+def get_profile_version(user_id):
+    """
+    Nanosecond timestamp of the user's last save, so it also serves as Last-Modified.
+    """
+    version = cache.get(version_key(user_id))
+    if version is None:
+        version = time.time_ns()
+        cache.add(version_key(user_id), version, PROFILE_TIMEOUT)
+        version = cache.get(version_key(user_id), version)
+    return version
+
+
+def bump_profile_version(user_id):
+    cache.set(version_key(user_id), time.time_ns(), PROFILE_TIMEOUT)
+
+
+def bump_profile_version_on_commit(user_id):
+    """
+    Bump now and again once the save commits, a profile built between the
+    two read the old row and must not stay cached under the new version.
+    """
+    bump_profile_version(user_id)
+    transaction.on_commit(lambda: bump_profile_version(user_id))
+
+
+def get_profile_validators(user_id):
+    """
+    (version, etag, last_modified) for conditional requests.
+    """
+    version = get_profile_version(user_id)
+    etag = quote_etag(f"{user_id}-{version}")
+    return version, etag, version // 1000000000
+
+
+def get_cached_profile(user_id, request, version, build):
+    """
+    The serialized profile for this version, `build(user, request)` only runs
+    on a miss. It's given the row from the primary rather than request.user,
+    which may be an older copy from the user cache, since what it returns is
+    kept for the whole version.
+    """
+
+    def build_from_row():
+        with use_primary():
+            user = User.objects.get(pk=user_id)
+        return build(user, request)
+
+    return get_namespace("profiles").get_or_set(
+        f"{user_id}:{version}:{request.get_host()}", build_from_row
+    )
+
+
+def set_conditional_headers(response, etag, last_modified):
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    response["Cache-Control"] = "private, no-cache"
+    return response
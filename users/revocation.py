@@ -0,0 +1,230 @@
+import hashlib
+import math
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Q
+from rest_framework_simplejwt.token_blacklist.models import (
+    BlacklistedToken,
+    OutstandingToken,
+)
+from rest_framework_simplejwt.utils import aware_utcnow
+
+
+WATERMARK_KEY = "users:blacklist-watermark"
+
+
+class BloomFilter:
+    """
+    Set membership with no false negatives, sized for `capacity` items at `error_rate`.
+    """
+
+    def __init__(self, capacity, error_rate=0.01):
+        capacity = max(capacity, 1)
+        self.size = max(int(-capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        self.hashes = max(int(round(self.size / capacity * math.log(2))), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def positions(self, value):
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, value):
+        for position in self.positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value):
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self.positions(value)
+        )
+
+
+class RevocationIndex:
+    """
+    Per-worker Bloom filter of blacklisted jtis. A negative answer skips the
+    database, a positive one is confirmed with the usual BlacklistedToken query.
+
+    New rows are picked up incrementally by BlacklistedToken id, at least every
+    `sync_interval` seconds, or sooner when the watermark another worker wrote
+    to django's cache is ahead of us. Ids skipped by a newer row may still
+    commit, they're looked up again on every sync for `gap_timeout` seconds.
+    The filter is rebuilt in the background every `rebuild_interval` seconds
+    so pruned rows stop taking space.
+    """
+
+    def __init__(
+        self,
+        capacity=1000000,
+        error_rate=0.01,
+        sync_interval=1,
+        rebuild_interval=3600,
+        gap_timeout=60,
+    ):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.sync_interval = sync_interval
+        self.rebuild_interval = rebuild_interval
+        self.gap_timeout = gap_timeout
+        self.lock = threading.Lock()
+        self.bloom = None
+        self.last_id = 0
+        self.gaps = {}
+        self.last_sync = 0.0
+        self.last_build = 0.0
+        self.rebuilding = False
+        self.db_checks = 0
+        self.skipped = 0
+
+    def load(self, bloom, last_id, gaps):
+        """
+        Add the rows after `last_id` and the ones that filled a gap. Returns
+        the new last id, `gaps` ({(low, high): blacklisted_at of the row
+        above}) is updated in place.
+
+        Ids are handed out at insert but show up at commit, so on PostgreSQL
+        a lower id can appear after a higher one was loaded. A gap behind a
+        row older than `gap_timeout` seconds counts as rolled back, which
+        also keeps the holes prune_expired_tokens() leaves out of `gaps`.
+        """
+        cutoff = aware_utcnow() - timedelta(seconds=self.gap_timeout)
+        for gap in [gap for gap, seen in gaps.items() if seen < cutoff]:
+            del gaps[gap]
+
+        query = Q(id__gt=last_id)
+        for low, high in gaps:
+            query |= Q(id__range=(low, high))
+        rows = (
+            BlacklistedToken.objects.filter(query)
+            .order_by("id")
+            .values_list("id", "token__jti", "blacklisted_at")
+        )
+        for row_id, jti, blacklisted_at in rows.iterator(chunk_size=10000):
+            bloom.add(jti)
+            if row_id <= last_id:
+                low, high = next(gap for gap in gaps if gap[0] <= row_id <= gap[1])
+                seen = gaps.pop((low, high))
+                if low < row_id:
+                    gaps[(low, row_id - 1)] = seen
+                if row_id < high:
+                    gaps[(row_id + 1, high)] = seen
+                continue
+            if row_id > last_id + 1 and blacklisted_at >= cutoff:
+                gaps[(last_id + 1, row_id - 1)] = blacklisted_at
+            last_id = row_id
+        return last_id
+
+    def build(self):
+        count = BlacklistedToken.objects.count()
+        bloom = BloomFilter(max(self.capacity, count * 2), self.error_rate)
+        gaps = {}
+        last_id = self.load(bloom, 0, gaps)
+        return bloom, last_id, gaps
+
+    def rebuild(self):
+        try:
+            bloom, last_id, gaps = self.build()
+            with self.lock:
+                last_id = self.load(bloom, last_id, gaps)
+                self.bloom, self.last_id, self.gaps = bloom, last_id, gaps
+                self.last_sync = self.last_build = time.monotonic()
+        finally:
+            self.rebuilding = False
+            connection.close()
+
+    def sync(self):
+        now = time.monotonic()
+        with self.lock:
+            if self.bloom is None:
+                self.bloom, self.last_id, self.gaps = self.build()
+                self.last_sync = self.last_build = now
+                return
+
+            watermark = cache.get(WATERMARK_KEY) or 0
+            if now - self.last_sync >= self.sync_interval or watermark > self.last_id:
+                self.last_id = self.load(self.bloom, self.last_id, self.gaps)
+                self.last_sync = now
+
+            if now - self.last_build >= self.rebuild_interval and not self.rebuilding:
+                self.rebuilding = True
+                threading.Thread(target=self.rebuild, daemon=True).start()
+
+    def is_blacklisted(self, jti):
+        self.sync()
+        if jti not in self.bloom:
+            self.skipped += 1
+            return False
+        self.db_checks += 1
+        return BlacklistedToken.objects.filter(token__jti=jti).exists()
+
+    def add(self, blacklisted):
+        """
+        Record a token this worker just blacklisted and tell the other workers.
+        """
+        with self.lock:
+            if self.bloom is not None:
+                self.bloom.add(blacklisted.token.jti)
+        if (cache.get(WATERMARK_KEY) or 0) < blacklisted.id:
+            cache.set(WATERMARK_KEY, blacklisted.id, None)
+
+    def stats(self):
+        return {
+            "size": self.bloom.count if self.bloom is not None else 0,
+            "last_id": self.last_id,
+            "gaps": len(self.gaps),
+            "db_checks": self.db_checks,
+            "skipped": self.skipped,
+        }
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_revocation_index():
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                config = getattr(settings, "TOKEN_REVOCATION", {})
+                _index = RevocationIndex(
+                    capacity=config.get("CAPACITY", 1000000),
+                    error_rate=config.get("ERROR_RATE", 0.01),
+                    sync_interval=config.get("SYNC_INTERVAL", 1),
+                    rebuild_interval=config.get("REBUILD_INTERVAL", 3600),
+                    gap_timeout=config.get("GAP_TIMEOUT", 60),
+                )
+    return _index
+
+
+def prune_expired_tokens(batch_size=1000, pause=0):
+    """
+    Delete expired OutstandingToken rows (and their BlacklistedToken rows) in
+    batches of `batch_size`. Expiry doesn't follow id order, blacklist()
+    creates rows for tokens issued long before, so every batch is picked by
+    expires_at. Returns the number of deleted rows.
+    """
+    now = aware_utcnow()
+    deleted = 0
+    while True:
+        expired = list(
+            OutstandingToken.objects.filter(expires_at__lte=now)
+            .order_by("id")
+            .values_list("id", flat=True)[:batch_size]
+        )
+        if not expired:
+            return deleted
+
+        BlacklistedToken.objects.filter(token_id__in=expired).delete()
+        OutstandingToken.objects.filter(id__in=expired).delete()
+        deleted += len(expired)
+        if pause:
+            time.sleep(pause)
@@ -1,12 +1,22 @@
 from rest_framework import serializers, validators
 from django.contrib.auth.password_validation import validate_password
+from django.db import IntegrityError, transaction
+from rest_framework_simplejwt.serializers import (
+    TokenObtainPairSerializer,
+    TokenRefreshSerializer,
+)
+from rest_framework_simplejwt.settings import api_settings
+from users.avatars import get_avatar_urls
 from users.models import User
+from users.hashing import make_password
+from users.tokens import IndexedRefreshToken, refresh_role_claims
 
 
 class UserSerializer(serializers.ModelSerializer):
     user_type_display = serializers.ChoiceField(
         choices=User.USER_TYPE_CHOICES, source="get_user_type_display", read_only=True
     )
+    profile_picture_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = User
@@ -22,14 +32,21 @@ class UserSerializer(serializers.ModelSerializer):
             "city",
             "country",
             "profile_picture",
+            "profile_picture_variants",
         )
 
+    def get_profile_picture_variants(self, user):
+        return get_avatar_urls(user.avatar_hash, self.context.get("request"))
+
 
 class RegisterUserSerializer(serializers.ModelSerializer):
     """
     Serializer for user registration.
     """
 
+    # declared explicitly so ModelSerializer doesn't add a UniqueValidator
+    # query, create() maps the unique constraint error instead
+    email = serializers.EmailField(max_length=254)
     password1 = serializers.CharField(
         write_only=True, required=True, validators=[validate_password]
     )
@@ -73,16 +90,25 @@ class RegisterUserSerializer(serializers.ModelSerializer):
         """
         Create and return a new user instance.
         """
-        first_name = validated_data.get("first_name")
-        last_name = validated_data.get("last_name")
-        email = validated_data.get("email")
-
-        user = User.objects.create(
-            first_name=first_name, last_name=last_name, email=email
+        user = User(
+            first_name=validated_data.get("first_name", ""),
+            last_name=validated_data.get("last_name", ""),
+            email=User.objects.normalize_email(validated_data.get("email")),
+            # the views hash first and pass it to save(password=...), outside
+            # of the transaction that inserts the user
+            password=validated_data.get("password")
+            or make_password(validated_data["password1"]),
         )
 
-        user.set_password(validated_data["password1"])
-        user.save()
+        try:
+            with transaction.atomic():
+                user.save(force_insert=True)
+        except IntegrityError:
+            message = User._meta.get_field("email").error_messages["unique"] % {
+                "model_name": User._meta.verbose_name,
+                "field_label": User._meta.get_field("email").verbose_name,
+            }
+            raise serializers.ValidationError({"email": [message]}, code="unique")
 
         return user
 
@@ -153,3 +179,48 @@ class ChangeProfilePictureSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ("profile_picture",)
+
+
+class ProfileUpdateSerializer(serializers.ModelSerializer):
+    """
+    Any subset of the editable profile fields, used with partial=True.
+    """
+
+    class Meta:
+        model = User
+        fields = (
+            "first_name",
+            "last_name",
+            "phone_number",
+            "address_1",
+            "address_2",
+            "city",
+            "country",
+            "profile_picture",
+        )
+
+
+class IndexedTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = IndexedRefreshToken
+
+
+class IndexedTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = IndexedRefreshToken
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs["refresh"])
+        refresh_role_claims(refresh)
+
+        data = {"access": str(refresh.access_token)}
+
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            if api_settings.BLACKLIST_AFTER_ROTATION:
+                refresh.blacklist()
+
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+
+            data["refresh"] = str(refresh)
+
+        return data
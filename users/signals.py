@@ -0,0 +1,27 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from users.avatars import is_processed, schedule_avatar_processing
+from users.authentication import get_user_cache, publish_token_version
+from users.models import User
+from users.profiles import bump_profile_version_on_commit
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    get_user_cache().invalidate(instance.pk)
+    bump_profile_version_on_commit(instance.pk)
+
+
+@receiver(post_save, sender=User)
+def publish_user_token_version(sender, instance, **kwargs):
+    publish_token_version(instance.pk, instance.token_version)
+
+
+@receiver(post_save, sender=User)
+def process_profile_picture(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and "profile_picture" not in update_fields:
+        return
+    if instance.profile_picture and not is_processed(instance.profile_picture.name):
+        schedule_avatar_processing(instance.pk, instance.profile_picture.name)
@@ -1,3 +1,571 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import shutil
+import tempfile
+import threading
+from concurrent.futures import Future
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.template.loader import render_to_string
+from django.test import AsyncRequestFactory, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.token_blacklist.models import (
+    BlacklistedToken,
+    OutstandingToken,
+)
+from rest_framework_simplejwt.tokens import AccessToken
+
+from rest_api.models import Order
+from users import avatars, hashing
+from users.async_views import AsyncUserView
+from users.authentication import CachedJWTAuthentication, get_user_cache
+from users.avatars import process_avatar, render_variants, store_processed_avatar
+from users.hashing import HashingQueueFull, PasswordHashingPool
+from users.mail_templates import get_email_template, minify_html
+from users.maintenance import delete_file, delete_unverified_accounts, in_batches
+from users.models import EmailOutbox, User
+from users.outbox import deliver_batch
+from users.profiles import bump_profile_version
+from users.revocation import RevocationIndex, prune_expired_tokens
+from users.tokens import (
+    IndexedRefreshToken,
+    check_email_verification_token,
+    get_password_reset_user,
+    make_email_verification_token,
+    make_password_reset_token,
+)
+from users.utils import queue_verification_email
+
+
+def make_user(email="jane@example.com", **fields):
+    fields.setdefault("is_verfied", True)
+    return User.objects.create_user(email=email, password=None, **fields)
+
+
+FAST_HASHERS = ["django.contrib.auth.hashers.MD5PasswordHasher"]
+
+
+def make_jpeg(size=(300, 200)):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, "red").save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+class MediaTestCase(TestCase):
+    """
+    Gives every test its own empty MEDIA_ROOT.
+    """
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+
+class CachedTestCase(TestCase):
+    """
+    Starts every test with empty per-process and django caches.
+    """
+
+    def setUp(self):
+        cache.clear()
+        get_user_cache().clear()
+
+
+class OutboxTests(TestCase):
+    def test_queued_email_is_sent_once(self):
+        entry = queue_verification_email("jane@example.com", 1, "token")
+
+        self.assertEqual(deliver_batch(), (1, 0))
+        self.assertEqual(deliver_batch(), (0, 0))
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ["jane@example.com"])
+        entry.refresh_from_db()
+        self.assertEqual(entry.status, 2)
+        self.assertEqual(entry.attempts, 1)
+
+    def test_failed_delivery_backs_off_then_gives_up(self):
+        entry = queue_verification_email("jane@example.com", 1, "token")
+
+        with mock.patch(
+            "users.outbox.build_outbox_email", side_effect=OSError("refused")
+        ):
+            self.assertEqual(deliver_batch(max_attempts=2), (0, 1))
+            entry.refresh_from_db()
+            self.assertEqual(entry.status, 1)
+            self.assertEqual(entry.last_error, "refused")
+            self.assertGreater(entry.next_attempt_at, timezone.now())
+
+            # not due again before the backoff expires
+            self.assertEqual(deliver_batch(max_attempts=2), (0, 0))
+
+            EmailOutbox.objects.filter(pk=entry.pk).update(
+                next_attempt_at=timezone.now() - timedelta(seconds=1)
+            )
+            self.assertEqual(deliver_batch(max_attempts=2), (0, 1))
+
+        entry.refresh_from_db()
+        self.assertEqual(entry.status, 3)
+        self.assertEqual(entry.attempts, 2)
+        self.assertEqual(mail.outbox, [])
+
+
+class EmailTemplateTests(TestCase):
+    def test_render_matches_the_django_template(self):
+        url = "https://example.com/verify/1/a&b/"
+        text, html = get_email_template("mail.html").render(token="a&b", url=url)
+
+        expected = minify_html(render_to_string("mail.html", {"url": url}))
+        self.assertEqual(html, expected)
+        self.assertIn("a&amp;b", html)
+        self.assertIn(url, text)
+        self.assertNotIn("<", text)
+
+
+class PasswordHashingPoolTests(TestCase):
+    def test_rejects_work_beyond_capacity(self):
+        pool = PasswordHashingPool(workers=1, max_queue=1)
+        release = threading.Event()
+
+        def blocked_hasher(name, *args):
+            release.wait(5)
+            return "hash", 0.01
+
+        with mock.patch("users.hashing.run_hasher", blocked_hasher):
+            futures = [pool.submit("make_password", "secret") for _ in range(2)]
+            with self.assertRaises(HashingQueueFull):
+                pool.submit("make_password", "secret")
+            release.set()
+            self.assertEqual([future.result()[0] for future in futures], ["hash"] * 2)
+        # the done callbacks run after result() returns
+        pool.executor.shutdown()
+
+        metrics = pool.metrics()
+        self.assertEqual(metrics["completed"], 2)
+        self.assertEqual(metrics["rejected"], 1)
+        self.assertEqual(metrics["in_flight"], 0)
+
+
+class CachedJWTAuthenticationTests(CachedTestCase):
+    def authenticate(self, user):
+        request = RequestFactory().get(
+            "/", headers={"Authorization": f"Bearer {AccessToken.for_user(user)}"}
+        )
+        return CachedJWTAuthentication().authenticate(request)[0]
+
+    def test_serves_the_user_from_memory_until_it_changes(self):
+        user = make_user()
+        self.authenticate(user)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.authenticate(user).pk, user.pk)
+
+        User.objects.get(pk=user.pk).save(update_fields=["city"])
+        with self.assertNumQueries(1):
+            self.authenticate(user)
+
+
+class RevocationIndexTests(CachedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user()
+
+    def blacklist(self, jti, id=None, expires_in=timedelta(days=1)):
+        token = OutstandingToken.objects.create(
+            user=self.user,
+            jti=jti,
+            token=jti,
+            expires_at=timezone.now() + expires_in,
+        )
+        return BlacklistedToken.objects.create(id=id, token=token)
+
+    def test_finds_rows_committed_out_of_id_order(self):
+        index = RevocationIndex(capacity=1000, sync_interval=0)
+        self.blacklist("first", id=1)
+        self.blacklist("third", id=3)
+        self.assertFalse(index.is_blacklisted("second"))
+
+        # id 2 was handed out before 3 but committed after it was loaded
+        self.blacklist("second", id=2)
+        self.assertTrue(index.is_blacklisted("second"))
+        self.assertTrue(index.is_blacklisted("third"))
+        self.assertEqual(index.gaps, {})
+
+    def test_forgets_gaps_older_than_the_timeout(self):
+        index = RevocationIndex(capacity=1000, sync_interval=0, gap_timeout=60)
+        self.blacklist("first", id=1)
+        BlacklistedToken.objects.filter(id=self.blacklist("third", id=3).id).update(
+            blacklisted_at=timezone.now() - timedelta(minutes=5)
+        )
+        index.sync()
+        self.assertEqual(index.gaps, {})
+
+    def test_prune_deletes_expired_tokens_out_of_id_order(self):
+        self.blacklist("live", expires_in=timedelta(days=1))
+        self.blacklist("expired", expires_in=-timedelta(days=1))
+        self.blacklist("live-too", expires_in=timedelta(days=1))
+
+        self.assertEqual(prune_expired_tokens(batch_size=1), 1)
+        self.assertEqual(
+            set(OutstandingToken.objects.values_list("jti", flat=True)),
+            {"live", "live-too"},
+        )
+        self.assertEqual(BlacklistedToken.objects.count(), 2)
+
+
+class MaintenanceTests(TestCase):
+    def test_deletes_stale_unverified_accounts(self):
+        stale = make_user("stale@example.com", is_verfied=False)
+        fresh = make_user("fresh@example.com", is_verfied=False)
+        verified = make_user("verified@example.com")
+        User.objects.filter(pk__in=[stale.pk, verified.pk]).update(
+            date_joined=timezone.now() - timedelta(days=30)
+        )
+
+        self.assertEqual(delete_unverified_accounts(), (1, 0))
+        self.assertEqual(
+            set(User.objects.values_list("pk", flat=True)), {fresh.pk, verified.pk}
+        )
+
+    def test_counts_the_rows_the_delete_removed(self):
+        stale = make_user("stale@example.com", is_verfied=False)
+        User.objects.filter(pk=stale.pk).update(
+            date_joined=timezone.now() - timedelta(days=30)
+        )
+
+        def order_first(queryset, action):
+            def ordered_then(users):
+                # the user orders between the batch being picked and deleted
+                Order.objects.create(user=stale)
+                action(users)
+
+            return in_batches(queryset, ordered_then)
+
+        with mock.patch("users.maintenance.in_batches", order_first):
+            self.assertEqual(delete_unverified_accounts(), (0, 0))
+        self.assertTrue(User.objects.filter(pk=stale.pk).exists())
+
+    def test_delete_file_only_ignores_missing_files(self):
+        self.assertEqual(delete_file("avatars/missing.jpg"), 0)
+
+        with mock.patch.object(default_storage, "size", side_effect=PermissionError()):
+            with self.assertRaises(PermissionError):
+                delete_file("avatars/locked.jpg")
+
+
+class SignedTokenTests(TestCase):
+    def test_email_verification_token_is_bound_to_its_user(self):
+        user = make_user(is_verfied=False)
+        token = make_email_verification_token(user)
+
+        self.assertTrue(check_email_verification_token(user.pk, token))
+        self.assertFalse(check_email_verification_token(user.pk + 1, token))
+        self.assertFalse(check_email_verification_token(user.pk, token[:-2] + "xx"))
+
+    def test_password_reset_token_stops_working_once_used(self):
+        user = make_user()
+        token = make_password_reset_token(user)
+        self.assertEqual(get_password_reset_user(token), user)
+
+        user.set_password("N3w-password!")
+        user.save()
+        self.assertIsNone(get_password_reset_user(token))
+        self.assertIsNone(get_password_reset_user("garbage"))
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class RegisterTests(CachedTestCase):
+    data = {
+        "first_name": "Jane",
+        "last_name": "Doe",
+        "email": "Jane@Example.com",
+        "password1": "Kn1ght-meat!",
+        "password2": "Kn1ght-meat!",
+    }
+
+    def test_registers_with_one_insert_and_the_queued_email(self):
+        # the user and outbox INSERTs, the rest are savepoints: the view's
+        # transaction and the one create() catches the duplicate email in
+        with self.assertNumQueries(6):
+            response = APIClient().post("/api/auth/register/", self.data)
+
+        self.assertEqual(response.status_code, 201)
+        user = User.objects.get(email="Jane@example.com")
+        self.assertTrue(user.check_password("Kn1ght-meat!"))
+        self.assertEqual(EmailOutbox.objects.get().recipient, user.email)
+
+    def test_hashes_before_the_transaction(self):
+        depth = len(connection.atomic_blocks)
+        depths = []
+        make_password = hashing.make_password
+
+        def recording_make_password(raw_password):
+            depths.append(len(connection.atomic_blocks))
+            return make_password(raw_password)
+
+        with mock.patch("users.hashing.make_password", recording_make_password):
+            APIClient().post("/api/auth/register/", self.data)
+
+        self.assertEqual(depths, [depth])
+
+    def test_duplicate_email_is_refused(self):
+        make_user("Jane@example.com")
+
+        response = APIClient().post("/api/auth/register/", self.data)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("email", response.data)
+        self.assertEqual(EmailOutbox.objects.count(), 0)
+
+
+class UpdateProfileTests(CachedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user(city="Kigali")
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}"
+        )
+
+    def test_writes_only_the_changed_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(
+                "/api/auth/profile/", {"city": "Kigali", "country": "Rwanda"}
+            )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["user"]["country"], "Rwanda")
+        updates = [
+            query["sql"]
+            for query in queries.captured_queries
+            if query["sql"].startswith("UPDATE")
+        ]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"country"', updates[0])
+        self.assertNotIn('"city"', updates[0])
+
+    def test_diffs_against_the_row_not_a_stale_cached_user(self):
+        self.client.get("/api/auth/user-details/")
+        # another worker's write, this worker's cached user still says Kigali
+        User.objects.filter(pk=self.user.pk).update(city="Musanze")
+
+        response = self.client.patch("/api/auth/profile/", {"city": "Kigali"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(User.objects.get(pk=self.user.pk).city, "Kigali")
+
+
+
+class UserDetailsTests(CachedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user(city="Kigali")
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}"
+        )
+
+    def test_answers_not_modified_until_the_user_is_saved(self):
+        response = self.client.get("/api/auth/user-details/")
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+
+        response = self.client.get("/api/auth/user-details/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.client.patch("/api/auth/profile/", {"city": "Musanze"})
+        response = self.client.get("/api/auth/user-details/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["user"]["city"], "Musanze")
+
+    def test_builds_the_profile_from_the_row_not_the_cached_user(self):
+        self.client.get("/api/auth/user-details/")
+        # another worker's save, this worker's cached user still says Kigali
+        User.objects.filter(pk=self.user.pk).update(city="Musanze")
+        bump_profile_version(self.user.pk)
+
+        response = self.client.get("/api/auth/user-details/")
+
+        self.assertEqual(response.data["user"]["city"], "Musanze")
+
+
+class TokenRefreshTests(CachedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user()
+        self.refresh = str(IndexedRefreshToken.for_user(self.user))
+
+    def post_refresh(self):
+        return APIClient().post("/api/token/refresh/", {"refresh": self.refresh})
+
+    def test_skips_the_user_row_while_the_version_is_current(self):
+        self.post_refresh()
+        self.refresh = str(IndexedRefreshToken.for_user(self.user))
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post_refresh()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(
+            [
+                query
+                for query in queries.captured_queries
+                if query["sql"].startswith("SELECT") and '"users_user"' in query["sql"]
+            ]
+        )
+
+    def test_role_changes_reach_the_next_access_token(self):
+        self.user.user_type = 2
+        self.user.save()
+
+        response = self.post_refresh()
+
+        self.assertEqual(response.status_code, 200)
+        access = AccessToken(response.data["access"])
+        self.assertEqual(access["user_type"], 2)
+        self.assertEqual(access["token_version"], 1)
+
+    def test_deactivated_users_cant_refresh(self):
+        self.user.is_active = False
+        self.user.save()
+
+        self.assertEqual(self.post_refresh().status_code, 401)
+
+
+def completed(result=None, exception=None):
+    future = Future()
+    if exception is not None:
+        future.set_exception(exception)
+    else:
+        future.set_result(result)
+    return future
+
+
+# store_processed_avatar closes the thread's connection, the test's is shared
+@mock.patch("users.avatars.connection")
+class AvatarProcessingTests(MediaTestCase):
+    def test_renders_every_size_in_both_formats(self, connection):
+        variants = render_variants(make_jpeg(), (64, 128))
+
+        self.assertEqual(
+            set(variants),
+            {"original.jpg", "64.jpg", "64.webp", "128.jpg", "128.webp"},
+        )
+        with Image.open(io.BytesIO(variants["64.webp"])) as image:
+            self.assertEqual(image.size, (64, 64))
+
+    def test_points_the_user_at_the_processed_picture(self, connection):
+        name = default_storage.save("avatars/upload.jpg", ContentFile(make_jpeg()))
+        user = make_user(profile_picture=name)
+
+        digest = process_avatar(name, (64,))
+        store_processed_avatar(user.pk, name, completed(digest))
+
+        user.refresh_from_db()
+        self.assertEqual(user.avatar_hash, digest)
+        self.assertEqual(user.profile_picture.name, f"avatars/{digest}/original.jpg")
+        self.assertTrue(default_storage.exists(f"avatars/{digest}/64.webp"))
+
+    def test_logs_failures(self, connection):
+        user = make_user()
+
+        with self.assertLogs("users.avatars", "ERROR") as logs:
+            store_processed_avatar(user.pk, "avatars/x.jpg", completed(exception=OSError()))
+
+        self.assertIn("Traceback", logs.output[0])
+
+    @override_settings(AVATAR_PROCESSING={"EXECUTOR": "process", "WORKERS": 1})
+    @mock.patch("users.avatars._pool", None)
+    @mock.patch("users.avatars.ProcessPoolExecutor")
+    def test_process_workers_set_up_django(self, executor, connection):
+        self.assertIs(avatars.get_avatar_pool(), executor.return_value)
+        executor.assert_called_once_with(1, initializer=hashing.init_process_worker)
+
+
+def assert_off_the_event_loop(function):
+    """
+    Wraps `function` to fail if it's called on a running event loop.
+    """
+
+    def wrapper(*args, **kwargs):
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return function(*args, **kwargs)
+        raise AssertionError(f"{function.__name__} blocks the event loop")
+
+    return wrapper
+
+
+class AsyncViewTests(CachedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user(first_name="Jane", city="Kigali")
+        self.token = AccessToken.for_user(self.user)
+
+    def get(self, path, **headers):
+        return AsyncRequestFactory().get(
+            path, headers={"Authorization": f"Bearer {self.token}", **headers}
+        )
+
+    async def test_user_details_read_the_cache_off_the_event_loop(self):
+        from users import async_views
+
+        with mock.patch.object(
+            async_views,
+            "get_profile_validators",
+            assert_off_the_event_loop(async_views.get_profile_validators),
+        ), mock.patch.object(
+            async_views,
+            "get_cached_profile",
+            assert_off_the_event_loop(async_views.get_cached_profile),
+        ):
+            response = await AsyncUserView.get_user_data(
+                self.get("/api/auth/user-details/")
+            )
+            etag = response["ETag"]
+            not_modified = await AsyncUserView.get_user_data(
+                self.get("/api/auth/user-details/", **{"If-None-Match": etag})
+            )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)["user"]["city"], "Kigali")
+        self.assertEqual(not_modified.status_code, 304)
+
+    @override_settings(USER_CACHE={"SHARED_INVALIDATION": True})
+    async def test_shared_user_cache_is_checked_off_the_event_loop(self):
+        from users import authentication
+
+        authentication._user_cache = None
+        self.addCleanup(setattr, authentication, "_user_cache", None)
+        user_cache = get_user_cache()
+        user_cache.get_generation = assert_off_the_event_loop(user_cache.get_generation)
+
+        for _ in range(2):
+            response = await AsyncUserView.get_user_data(
+                self.get("/api/auth/user-details/")
+            )
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(user_cache.hits, 1)
+
+    async def test_requires_a_token(self):
+        response = await AsyncUserView.get_user_data(
+            AsyncRequestFactory().get("/api/auth/user-details/")
+        )
+
+        self.assertEqual(response.status_code, 401)
+        self.assertIn("WWW-Authenticate", response)
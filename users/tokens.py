@@ -0,0 +1,118 @@
+from django.conf import settings
+from django.contrib.auth.tokens import default_token_generator
+from django.core import signing
+from django.utils.encoding import force_bytes, force_str
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from users.authentication import (
+    TOKEN_VERSION_CLAIM,
+    get_published_token_version,
+    publish_token_version,
+)
+from users.models import User
+from users.revocation import get_revocation_index
+
+
+EMAIL_VERIFICATION_SALT = "users.email-verification"
+
+
+class IndexedRefreshToken(RefreshToken):
+    """
+    RefreshToken that checks the blacklist through the per-worker revocation
+    index and carries the role claims, access tokens made from it copy them.
+    """
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        set_role_claims(token, user.user_type, user.is_verfied, user.token_version)
+        return token
+
+    def check_blacklist(self):
+        jti = self.payload[api_settings.JTI_CLAIM]
+
+        if get_revocation_index().is_blacklisted(jti):
+            raise TokenError(_("Token is blacklisted"))
+
+    def blacklist(self):
+        blacklisted, created = super().blacklist()
+        get_revocation_index().add(blacklisted)
+        return blacklisted, created
+
+
+def set_role_claims(token, user_type, is_verfied, token_version):
+    token["user_type"] = user_type
+    token["is_verfied"] = is_verfied
+    token[TOKEN_VERSION_CLAIM] = token_version
+
+
+def refresh_role_claims(token):
+    """
+    Bring the role claims of a refresh token that is being rotated up to
+    date, so role changes reach the next access token. The row is only read
+    when the token's version isn't the one published for the user, after a
+    role change or once the published one expired.
+    """
+    user_id = token[api_settings.USER_ID_CLAIM]
+    published = get_published_token_version(user_id)
+    if published is not None and token.get(TOKEN_VERSION_CLAIM) == published:
+        return
+
+    claims = (
+        User.objects.filter(**{api_settings.USER_ID_FIELD: user_id}, is_active=True)
+        .values_list("user_type", "is_verfied", "token_version")
+        .first()
+    )
+    if claims is None:
+        raise TokenError(_("User not found"))
+    set_role_claims(token, *claims)
+    if published is None:
+        # a save publishing a newer version meanwhile must win
+        publish_token_version(user_id, claims[2], replace=False)
+
+
+def make_email_verification_token(user):
+    """
+    Signed, timestamped token carrying the user id, nothing is stored.
+    """
+    return signing.dumps({"id": user.pk}, salt=EMAIL_VERIFICATION_SALT, compress=True)
+
+
+def check_email_verification_token(user_id, token):
+    try:
+        data = signing.loads(
+            token,
+            salt=EMAIL_VERIFICATION_SALT,
+            max_age=settings.EMAIL_VERIFICATION_TIMEOUT,
+        )
+    except signing.BadSignature:
+        return False
+    return data.get("id") == user_id
+
+
+def make_password_reset_token(user):
+    """
+    `<uidb64>-<timestamp>-<hmac>`, the hmac covers the password hash and
+    last_login so the token stops working once it's been used.
+    """
+    uidb64 = urlsafe_base64_encode(force_bytes(user.pk))
+    return f"{uidb64}-{default_token_generator.make_token(user)}"
+
+
+def get_password_reset_user(token):
+    """
+    The user a reset token was made for, or None if it's invalid or expired.
+    """
+    try:
+        uidb64, user_token = token.split("-", 1)
+        user = User.objects.get(pk=force_str(urlsafe_base64_decode(uidb64)))
+    except (ValueError, TypeError, OverflowError, User.DoesNotExist):
+        return None
+
+    if not default_token_generator.check_token(user, user_token):
+        return None
+    return user
@@ -1,30 +1,42 @@
+from django.conf import settings
 from django.urls import path
 
 # views
 from users.views import UserView
+from users.async_views import AsyncUserView
+
+
+# the async views only pay off when served through asgi.py
+AuthView = AsyncUserView if settings.ASYNC_VIEWS else UserView
 
 
 urlpatterns = [
-    path("register/", UserView.register, name="user-register"),
+    path("register/", AuthView.register, name="user-register"),
     path(
         "verify-email/<int:id>/<str:token>/",
         UserView.verify_email,
         name="verify-user-email",
     ),
-    path("user-details/", UserView.get_user_data, name="user-data"),
-    path("login/", UserView.login, name="user-login"),
+    path("user-details/", AuthView.get_user_data, name="user-data"),
+    path("profile/", UserView.update_profile, name="user-profile"),
+    path("login/", AuthView.login, name="user-login"),
     path("logout/", UserView.logout, name="user-logout"),
-    path("forgot-password/", UserView.forgot_password, name="forgot-password"),
+    path("forgot-password/", AuthView.forgot_password, name="forgot-password"),
     path("reset-password/<str:token>/", UserView.reset_password, name="reset-password"),
-    path("change-password/", UserView.change_password, name="change-password"),
+    path("change-password/", AuthView.change_password, name="change-password"),
     path(
-        "change-phone-number/", UserView.change_phone_number, name="change-phone-number"
+        "change-phone-number/", AuthView.change_phone_number, name="change-phone-number"
     ),
-    path("change-location/", UserView.change_location, name="change-location"),
-    path("change-names/", UserView.change_names, name="change-names"),
+    path("change-location/", AuthView.change_location, name="change-location"),
+    path("change-names/", AuthView.change_names, name="change-names"),
     path(
         "change-profile-picture/",
-        UserView.change_profile_picture,
+        AuthView.change_profile_picture,
         name="change-profile-picture",
     ),
+    path("hashing-metrics/", UserView.hashing_metrics, name="hashing-metrics"),
+    path(
+        "user-cache-metrics/", UserView.user_cache_metrics, name="user-cache-metrics"
+    ),
+    path("cache-metrics/", UserView.cache_metrics, name="cache-metrics"),
 ]
@@ -1,57 +1,93 @@
 from django.conf import settings
 from django.core.mail import EmailMultiAlternatives
-from django.template.loader import get_template
-
-
-def send_verification_email(email, pk, token):
-    try:
-        subject = "welcome to Knight Meat Taste [Update]"
-        message = "Hello"
-        email_from = f"{settings.DISPLAY_NAME} <settings.EMAIL_HOST_USER>"
-        recipient_list = [
-            email,
-        ]
-        html_c = get_template("mail.html")
-        context = {
-            "token": token,
-            "url": f"{settings.CLIENT_URL}/account/verify-email/{pk}/{token}/",
-        }
-        html_content = html_c.render(context)
-        # headers = {'X-Auto-Response-Suppress': 'Update',
-        #            'List-Unsubscribe': '<mailto:unsubscribe@example.com>'
-        # }
-        msg = EmailMultiAlternatives(subject, message, email_from, recipient_list)
-        msg.attach_alternative(html_content, "text/html")
-        msg.send()
-    except Exception as e:
-        print(e)
-        return False
-
-    return True
-
-
-def send_reset_password_email(email, token):
-    try:
-        subject = "Reset your password [Update]"
-        message = "Hello again"
-        email_from = f"{settings.DISPLAY_NAME} <settings.EMAIL_HOST_USER>"
-        recipient_list = [
-            email,
-        ]
-        html_c = get_template("forget_password.html")
-        context = {
-            "token": token,
-            "url": f"{settings.CLIENT_URL}/account/reset-password/{token}",
-        }
-        html_content = html_c.render(context)
-        # headers = {'X-Auto-Response-Suppress': 'Update',
-        #            'List-Unsubscribe': '<mailto:unsubscribe@example.com>'
-        # }
-        msg = EmailMultiAlternatives(subject, message, email_from, recipient_list)
-        msg.attach_alternative(html_content, "text/html")
-        msg.send()
-    except Exception as e:
-        print(e)
-        return False
-
-    return True
+
+from users.mail_templates import get_email_template
+from users.models import EmailOutbox
+
+
+def get_email_from():
+    return f"{settings.DISPLAY_NAME} <{settings.EMAIL_HOST_USER}>"
+
+
+def build_verification_email(email, pk, token):
+    subject = "welcome to Knight Meat Taste [Update]"
+    recipient_list = [
+        email,
+    ]
+    message, html_content = get_email_template("mail.html").render(
+        token=token,
+        url=f"{settings.CLIENT_URL}/account/verify-email/{pk}/{token}/",
+    )
+    # headers = {'X-Auto-Response-Suppress': 'Update',
+    #            'List-Unsubscribe': '<mailto:unsubscribe@example.com>'
+    # }
+    msg = EmailMultiAlternatives(subject, message, get_email_from(), recipient_list)
+    msg.attach_alternative(html_content, "text/html")
+    return msg
+
+
+def build_reset_password_email(email, token):
+    subject = "Reset your password [Update]"
+    recipient_list = [
+        email,
+    ]
+    message, html_content = get_email_template("forget_password.html").render(
+        token=token,
+        url=f"{settings.CLIENT_URL}/account/reset-password/{token}",
+    )
+    # headers = {'X-Auto-Response-Suppress': 'Update',
+    #            'List-Unsubscribe': '<mailto:unsubscribe@example.com>'
+    # }
+    msg = EmailMultiAlternatives(subject, message, get_email_from(), recipient_list)
+    msg.attach_alternative(html_content, "text/html")
+    return msg
+
+
+def build_outbox_email(entry):
+    """
+    Build the message for an EmailOutbox row from its kind and stored context.
+    """
+    if entry.kind == "verification":
+        return build_verification_email(
+            entry.recipient, entry.context["pk"], entry.context["token"]
+        )
+    if entry.kind == "reset_password":
+        return build_reset_password_email(entry.recipient, entry.context["token"])
+    raise ValueError(f"Unknown email kind: {entry.kind}")
+
+
+def queue_verification_email(email, pk, token):
+    """
+    Store the verification email in the outbox, call it inside the same
+    transaction that writes the user so both are committed together.
+    """
+    return EmailOutbox.objects.create(
+        kind="verification",
+        recipient=email,
+        context={"pk": pk, "token": str(token)},
+    )
+
+
+def queue_reset_password_email(email, token):
+    return EmailOutbox.objects.create(
+        kind="reset_password",
+        recipient=email,
+        context={"token": str(token)},
+    )
+
+
+async def aqueue_verification_email(email, pk, token):
+    return await EmailOutbox.objects.acreate(
+        kind="verification",
+        recipient=email,
+        context={"pk": pk, "token": str(token)},
+    )
+
+
+async def aqueue_reset_password_email(email, token):
+    return await EmailOutbox.objects.acreate(
+        kind="reset_password",
+        recipient=email,
+        context={"token": str(token)},
+    )
+
@@ -1,11 +1,11 @@
-# drf yasg
-from drf_yasg.utils import swagger_auto_schema
-from drf_yasg import openapi
+# api docs, drf yasg's or no-ops without API_DOCS
+from knight_meat_tatse.docs import openapi, swagger_auto_schema
 
 
 # django
 from django.contrib.auth import get_user_model
-from django.utils.crypto import get_random_string
+from django.db import transaction
+from django.utils.cache import get_conditional_response
 
 # restframework
 from rest_framework import status
@@ -20,13 +20,9 @@ from rest_framework.response import Response
 from rest_framework.parsers import FormParser, MultiPartParser
 
 # restframework_simplejwt
-from rest_framework_simplejwt.tokens import RefreshToken, TokenError
+from rest_framework_simplejwt.tokens import TokenError
 from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
 
-
-# uuid to be used where needed
-import uuid
-
 from users.serializers import (
     RegisterUserSerializer,
     UserSerializer,
@@ -37,15 +33,54 @@ from users.serializers import (
     UserLocationSerializer,
     UserChangeNamesSerializer,
     ChangeProfilePictureSerializer,
+    ProfileUpdateSerializer,
 )
 
+# password hashing pool
+from users import hashing
+from users.authentication import TokenUserAuthentication, get_user_cache
+from users.profiles import (
+    get_cached_profile,
+    get_profile_validators,
+    set_conditional_headers,
+)
+from users.tokens import (
+    IndexedRefreshToken,
+    check_email_verification_token,
+    get_password_reset_user,
+    make_email_verification_token,
+    make_password_reset_token,
+)
+from users.decorators import admin_required
+from knight_meat_tatse.cache import get_stats as get_cache_stats
+
 # utilities module
-from users.utils import send_verification_email, send_reset_password_email
+from users.utils import queue_verification_email, queue_reset_password_email
 
 
 User = get_user_model()
 
 
+def get_profile_data(user, request):
+    serializer = UserSerializer(user, context={"request": request})
+    user = serializer.data
+
+    return {
+        "id": user["id"],
+        "first_name": user["first_name"],
+        "last_name": user["last_name"],
+        "email": user["email"],
+        "phone_number": user["phone_number"],
+        "address_1": user["address_1"],
+        "address_2": user["address_2"],
+        "city": user["city"],
+        "country": user["country"],
+        "profile_picture": user["profile_picture"],
+        "profile_picture_variants": user["profile_picture_variants"],
+        "type": user["user_type_display"],
+    }
+
+
 class UserView:
     """
     in this class there is all views for user basic actions including Registration, Login, EmailVerfication
@@ -63,15 +98,15 @@ class UserView:
         serializer = RegisterUserSerializer(data=request.data)
 
         if serializer.is_valid():
-            user = serializer.save()
-
-            email_verification_token = uuid.uuid4()
-            user_id = user.id
-
-            user.email_token = email_verification_token
-            user.save()
-
-            send_verification_email(user.email, user_id, email_verification_token)
+            # hashed before the transaction, which would hold the write lock
+            # for the whole hash otherwise
+            password = hashing.make_password(serializer.validated_data["password1"])
+            with transaction.atomic():
+                user = serializer.save(password=password)
+
+                queue_verification_email(
+                    user.email, user.id, make_email_verification_token(user)
+                )
 
             return Response(
                 {
@@ -104,10 +139,9 @@ class UserView:
                 {"message": "Email already verified."}, status=status.HTTP_200_OK
             )
 
-        if user.email_token == token:
+        if check_email_verification_token(user.pk, token):
             user.is_verfied = True
-            user.email_token = None
-            user.save()
+            user.save(update_fields=["is_verfied"])
 
             return Response(
                 {"message": "Email verified successfully"}, status=status.HTTP_200_OK
@@ -138,26 +172,18 @@ class UserView:
         """
         Getting current loggedin users data
         """
-        serializer = UserSerializer(request.user, context={"request": request})
-        user = serializer.data
+        user = request.user
+        version, etag, last_modified = get_profile_validators(user.pk)
 
-        return Response(
-            {
-                "user": {
-                    "id": user["id"],
-                    "first_name": user["first_name"],
-                    "last_name": user["last_name"],
-                    "email": user["email"],
-                    "phone_number": user["phone_number"],
-                    "address_1": user["address_1"],
-                    "address_2": user["address_2"],
-                    "city": user["city"],
-                    "country": user["country"],
-                    "profile_picture": user["profile_picture"],
-                    "type": user["user_type_display"],
-                }
-            }
+        not_modified = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
         )
+        if not_modified is not None:
+            return set_conditional_headers(not_modified, etag, last_modified)
+
+        data = get_cached_profile(user.pk, request, version, get_profile_data)
+        response = Response({"user": data})
+        return set_conditional_headers(response, etag, last_modified)
 
     @swagger_auto_schema(
         method="POST",
@@ -205,11 +231,11 @@ class UserView:
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        if user.check_password(password):
+        if hashing.check_user_password(user, password):
             serializer = UserSerializer(user, context={"request": request})
             logged_user = serializer.data
             # Authentication successful, generate tokens
-            refresh = RefreshToken.for_user(user)
+            refresh = IndexedRefreshToken.for_user(user)
             data = {
                 "message": "Logged In successfully",
                 "user": {
@@ -268,7 +294,7 @@ class UserView:
             )
 
         try:
-            RefreshToken(refresh_token).blacklist()
+            IndexedRefreshToken(refresh_token).blacklist()
             return Response(
                 {"message": "Successfully logged out."},
                 status=status.HTTP_200_OK,
@@ -301,10 +327,7 @@ class UserView:
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        user.password_reset_token = get_random_string(length=32)
-        user.save()
-
-        send_reset_password_email(user.email, user.password_reset_token)
+        queue_reset_password_email(user.email, make_password_reset_token(user))
 
         return Response(
             {
@@ -325,19 +348,15 @@ class UserView:
         serializer.is_valid(raise_exception=True)
         password = serializer.validated_data["password1"]
 
-        try:
-            user = User.objects.get(
-                password_reset_token=token,
-            )
-        except User.DoesNotExist:
+        user = get_password_reset_user(token)
+        if user is None:
             return Response(
                 {"message": "something goes wrong try again."},
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        user.set_password(password)
-        user.password_reset_token = None
-        user.save()
+        user.password = hashing.make_password(password)
+        user.save(update_fields=["password"])
 
         return Response(
             {"message": "Password reset successful."},
@@ -365,14 +384,16 @@ class UserView:
         serializer = ResetPasswordSerializer(data=data, context={"request": request})
 
         if serializer.is_valid():
-            if not user.check_password(data["old_password"]):
+            if not hashing.check_user_password(user, data["old_password"]):
                 return Response(
                     {"message": "Incorrect old password"},
                     status=status.HTTP_400_BAD_REQUEST,
                 )
 
-            user.set_password(serializer.validated_data["password1"])
-            user.save()
+            user.password = hashing.make_password(
+                serializer.validated_data["password1"]
+            )
+            user.save(update_fields=["password"])
             return Response(
                 {"message": "Password changed successfully."},
                 status=status.HTTP_200_OK,
@@ -401,7 +422,7 @@ class UserView:
 
         if serializer.is_valid():
             user.phone_number = serializer.validated_data["phone_number"]
-            user.save()
+            user.save(update_fields=["phone_number"])
             return Response(
                 {"message": "Phone number Updated successfully."},
                 status=status.HTTP_200_OK,
@@ -436,7 +457,7 @@ class UserView:
             user.address_2 = serializer.validated_data["address_2"]
             user.city = serializer.validated_data["city"]
             user.country = serializer.validated_data["country"]
-            user.save()
+            user.save(update_fields=["address_1", "address_2", "city", "country"])
             return Response(
                 {"message": "Location Updated successfully."},
                 status=status.HTTP_200_OK,
@@ -469,7 +490,7 @@ class UserView:
         if serializer.is_valid():
             user.first_name = serializer.validated_data["first_name"]
             user.last_name = serializer.validated_data["last_name"]
-            user.save()
+            user.save(update_fields=["first_name", "last_name"])
             return Response(
                 {"message": "Names Updated successfully."},
                 status=status.HTTP_200_OK,
@@ -501,7 +522,7 @@ class UserView:
 
         if serializer.is_valid():
             user.profile_picture = serializer.validated_data["profile_picture"]
-            user.save()
+            user.save(update_fields=["profile_picture"])
             return Response(
                 {
                     "message": "Profile Picture Updated successfully, it may take minute to appear here reload to see changes."
@@ -512,3 +533,109 @@ class UserView:
             {"message": "Profile Picture Failed To be updated."},
             status=status.HTTP_400_BAD_REQUEST,
         )
+
+    @swagger_auto_schema(
+        method="PATCH",
+        tags=["User"],
+        request_body=ProfileUpdateSerializer,
+        manual_parameters=[
+            openapi.Parameter(
+                "Authorization",
+                in_=openapi.IN_HEADER,
+                type=openapi.TYPE_STRING,
+                description="Bearer {token}",
+            ),
+        ],
+    )
+    @api_view(["PATCH"])
+    @permission_classes((IsAuthenticated,))
+    def update_profile(request):
+        """
+        Update any subset of the profile fields in one request, only changed columns are written
+        """
+        # request.user can come from another worker's stale cache, the diff
+        # has to be against the row or a change could be taken for a no-op
+        user = User.objects.get(pk=request.user.pk)
+        serializer = ProfileUpdateSerializer(user, data=request.data, partial=True)
+
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        changed = []
+        for field, value in serializer.validated_data.items():
+            if field == "profile_picture" or getattr(user, field) != value:
+                setattr(user, field, value)
+                changed.append(field)
+
+        if changed:
+            user.save(update_fields=changed)
+
+        return Response(
+            {"user": get_profile_data(user, request)}, status=status.HTTP_200_OK
+        )
+
+    @swagger_auto_schema(
+        method="GET",
+        tags=["Auth"],
+        manual_parameters=[
+            openapi.Parameter(
+                "Authorization",
+                in_=openapi.IN_HEADER,
+                type=openapi.TYPE_STRING,
+                description="Bearer {token}",
+            ),
+        ],
+    )
+    @api_view(["GET"])
+    @authentication_classes((TokenUserAuthentication,))
+    @permission_classes((IsAuthenticated,))
+    @admin_required
+    def hashing_metrics(request):
+        """
+        Password hashing pool queue depth and hash times
+        """
+        return Response(hashing.get_hashing_pool().metrics(), status=status.HTTP_200_OK)
+
+    @swagger_auto_schema(
+        method="GET",
+        tags=["Auth"],
+        manual_parameters=[
+            openapi.Parameter(
+                "Authorization",
+                in_=openapi.IN_HEADER,
+                type=openapi.TYPE_STRING,
+                description="Bearer {token}",
+            ),
+        ],
+    )
+    @api_view(["GET"])
+    @authentication_classes((TokenUserAuthentication,))
+    @permission_classes((IsAuthenticated,))
+    @admin_required
+    def user_cache_metrics(request):
+        """
+        Hit and miss counters of the authenticated user cache
+        """
+        return Response(get_user_cache().stats(), status=status.HTTP_200_OK)
+
+    @swagger_auto_schema(
+        method="GET",
+        tags=["Auth"],
+        manual_parameters=[
+            openapi.Parameter(
+                "Authorization",
+                in_=openapi.IN_HEADER,
+                type=openapi.TYPE_STRING,
+                description="Bearer {token}",
+            ),
+        ],
+    )
+    @api_view(["GET"])
+    @authentication_classes((TokenUserAuthentication,))
+    @permission_classes((IsAuthenticated,))
+    @admin_required
+    def cache_metrics(request):
+        """
+        Per-namespace hit rates of the tiered cache in this worker
+        """
+        return Response(get_cache_stats(), status=status.HTTP_200_OK)